@@ -3,9 +3,11 @@ import concurrent.futures
 import discord
 import os
 from discord.ext import commands
-from data import apis_dict, add_guild_db, write_cache
+from data import apis_dict, add_guild_db, create_db_pool, close_db_pool, load_caches, state_store
 from data import default_prefix
-from data import get_prefix_db
+from data import get_prefix_db, load_guild_settings, flush_user_xp, remove_dead_channels
+from data import get_channels_without_guild, set_channel_guilds, backup_database
+from dispatch import Dispatcher
 
 intents = discord.Intents.default()
 intents.members = True
@@ -13,7 +15,7 @@ intents.members = True
 executor = concurrent.futures.ThreadPoolExecutor()
 
 
-def get_prefix(disclient, message):
+async def get_prefix(disclient, message):
     guild = message.guild
     if guild:
         prefix = get_prefix_db(guild.id)
@@ -25,13 +27,32 @@ def get_prefix(disclient, message):
         return commands.when_mentioned_or(*default_prefix)(disclient, message)
 
 
-disclient = commands.Bot(
+class JoyBot(commands.Bot):
+    def __init__(self, **options):
+        super().__init__(**options)
+        # messages cogs post on their own, rather than in reply to a command, are queued here
+        self.dispatcher = Dispatcher(self, remove_dead_channels, apis_dict.get("dispatch_concurrency", 16))
+
+    async def close(self):
+        await super().close()
+        await flush_user_xp()
+        await close_db_pool()
+        await self.loop.run_in_executor(None, state_store.close)
+
+
+disclient = JoyBot(
     intents=intents,
     command_prefix=get_prefix
 )  # , intents=intents)
 disclient.remove_command('help')
 # commands.DefaultHelpCommand(width=100, dm_help=True, dm_help_threshold=100)
 
+# cogs start their background tasks on load, so the pool has to exist first
+disclient.loop.run_until_complete(create_db_pool())
+disclient.loop.run_until_complete(load_caches())
+state_store.start()
+backup_database()
+
 
 @disclient.event
 async def on_ready():
@@ -41,15 +62,22 @@ async def on_ready():
         status=discord.Status.online
     )
     print(f"bot is online as {disclient.user.name} in {len(disclient.guilds)} guilds!:")
+    # get_prefix runs on every message, so guild settings are only ever read from this cache
+    await load_guild_settings()
     for guild in disclient.guilds:
         # add if guild id not in guild table here...
-        added = add_guild_db(guild.id)
+        added = await add_guild_db(guild.id)
         if added:
             print(f'Added {guild.name} with {guild.member_count} members to the database!\n(ID: {guild.id})')
         else:
             print(f'{guild.name}: Member Count: {guild.member_count}\n(ID: {guild.id})')
-
-    await disclient.loop.create_task(write_cache())
+    # channels added before their guild was recorded
+    channel_guilds = {}
+    for channel_id in await get_channels_without_guild():
+        channel = disclient.get_channel(channel_id)
+        if getattr(channel, "guild", None) is not None:
+            channel_guilds[channel_id] = channel.guild.id
+    await set_channel_guilds(channel_guilds)
 
 
 try:
@@ -0,0 +1,65 @@
+import re
+from collections import namedtuple
+
+# Maps every link the bot accepts to one canonical form, so the same media always gets the same url and key.
+
+link_pattern = re.compile(r"""
+    (?P<gfycat>https://(?:www\.)?gfycat\.com/(?:[^/?#]+/)*(?P<gfycat_id>[^/?#.-]+)[^/?#]*(?:[?#]\S*)?)
+  | (?P<redgifs>https://(?:www\.)?redgifs\.com/(?:[^/?#]+/)*(?P<redgifs_id>[^/?#.-]+)[^/?#]*(?:[?#]\S*)?)
+  | (?P<gifdeliverynetwork>https://(?:www\.)?gifdeliverynetwork\.com/(?:[^/?#]+/)*
+        (?P<gifdeliverynetwork_id>[^/?#.-]+)[^/?#]*(?:[?#]\S*)?)
+  | (?P<twimg>https://pbs\.twimg\.com/media/(?P<twimg_id>[^/?#.:]+)
+        (?:\.(?P<twimg_extension>\w+))?(?:[?:](?P<twimg_query>\S*))?)
+  | (?P<youtube>https://(?:(?:www|m)\.)?youtu(?:\.be/|be\.com/(?:watch\?(?:\S*&)?v=|shorts/|embed/))
+        (?P<youtube_id>[\w-]{11})\S*)
+  | (?P<image>https?://[^\s?#]+\.(?i:jpe?g|png)(?:[?#]\S*)?)
+""", re.VERBOSE)
+
+# provider -> (media type, url format of the media id)
+providers = {
+    "gfycat": ("gfy", "https://gfycat.com/{}"),
+    "redgifs": ("gfy", "https://www.redgifs.com/watch/{}"),
+    "gifdeliverynetwork": ("gfy", "https://www.gifdeliverynetwork.com/{}"),
+    "twimg": ("image", "https://pbs.twimg.com/media/{}"),
+    "youtube": ("fancam", "https://www.youtube.com/watch?v={}"),
+    "image": ("image", "{}"),
+}
+
+# ids these providers serve the same media for, whatever their case
+case_insensitive_providers = ("gfycat", "redgifs", "gifdeliverynetwork")
+
+
+class CanonicalLink(namedtuple("CanonicalLink", ["provider", "media_id", "media_type", "url"])):
+    __slots__ = ()
+
+    @property
+    def key(self):
+        """The dedup key, unique per piece of media."""
+        media_id = self.media_id.lower() if self.provider in case_insensitive_providers else self.media_id
+        return f"{self.provider}:{media_id}"
+
+
+def canonicalise(link):
+    """Returns the CanonicalLink of a link, None if it isn't a link the bot accepts."""
+    link = link.strip()
+    if link.endswith("/"):
+        link = link[:-1]
+    match = link_pattern.fullmatch(link)
+    if match is None:
+        return None
+    provider = match.lastgroup
+    media_type, url = providers[provider]
+    if provider == "image":
+        return CanonicalLink(provider, link, media_type, link)
+    media_id = match[provider + "_id"]
+    url = url.format(media_id)
+    if provider == "twimg":
+        image_format = match["twimg_extension"] or match["twimg_query"] or ""
+        url += "?format=png&name=orig" if "png" in image_format else "?format=jpg&name=orig"
+    return CanonicalLink(provider, media_id, media_type, url)
+
+
+def media_type(link):
+    """Returns "gfy", "image" or "fancam", None if it isn't a link the bot accepts."""
+    canonical = canonicalise(link)
+    return canonical.media_type if canonical else None
@@ -15,17 +15,18 @@ class Custom(commands.Cog):
     @commands.command(aliases=['commands'])
     async def command_list(self, ctx):
         """Sends a list of all the custom commands."""
-        arrr = get_commands()
+        arrr = get_commands(ctx.guild.id if ctx.guild else 0)
         if len(arrr) == 0:
             await ctx.send(embed=error_embed('No commands added... Yet!'))
         else:
             await ctx.send(f"`{format_list(arrr.keys())}`")
 
     @commands.command(aliases=['ac', 'addcommand'])
-    async def add_command(self, ctx, name, gfy):
+    async def add_command(self, ctx, name, gfy, scope=None):
         """Adds a custom command with a valid gfy/red/gif link!
         Example: .addcommand <name> <link>
         You can now call this command with .<name>
+        To only add the command to this server: .addcommand <name> <link> server
         """
         name = name.lower()
         valid = (
@@ -34,12 +35,18 @@ class Custom(commands.Cog):
             "https://redgifs.com/",
             "https://www.gifdeliverynetwork.com/"
         )
+        guild_id = 0
+        if scope == 'server':
+            if not ctx.guild:
+                await ctx.send(embed=error_embed('Server commands can only be added in a server!'))
+                return
+            guild_id = ctx.guild.id
         if gfy.startswith(valid):
-            added = add_command(name, gfy, ctx.author.id)
+            added = await add_command(name, gfy, ctx.author.id, guild_id)
             if added:
                 await ctx.send(embed=success_embed(f'Added command `{name}`!'))
             else:
-                await ctx.send(embed=error_embed('Something went wrong!'))
+                await ctx.send(embed=error_embed(f'Command `{name}` already exists!'))
         else:
             await ctx.send(embed=error_embed('Invalid link!'))
 
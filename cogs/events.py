@@ -4,8 +4,8 @@ import discord
 from discord.ext import commands
 
 from bot import get_prefix
-from data import get_banned_words, add_guild_db
-from data import get_commands
+from data import find_banned_word, add_guild_db, remove_dead_channels
+from data import find_command
 from embeds import error_embed, permission_denied_embed, banned_word_embed
 
 
@@ -29,27 +29,23 @@ class Events(commands.Cog):
         if match:
             await message.add_reaction(emoji='😭')
         if message.guild:
-            guild = message.guild.id
-            banned_words = get_banned_words(guild)
-            if banned_words:
-                w = any(x in banned_words for x in msg)
-                if w:
-                    await message.delete()
-                    await message.author.send(banned_word_embed(message.guild, w))
-        try:
-            if msg[0].startswith(get_prefix(self.disclient, message)):
-                command = msg[0][1:]
-                command_list = get_commands()
-                if command in command_list:
-                    await message.channel.send(command_list[command])
-        except TypeError:
-            pass
+            banned_word = find_banned_word(message.guild.id, message.content)
+            if banned_word:
+                await message.delete()
+                await message.author.send(embed=banned_word_embed(message.guild, banned_word))
+                return
+        for prefix in await get_prefix(self.disclient, message):
+            if msg[0].startswith(prefix):
+                command = find_command(msg[0][len(prefix):], message.guild.id if message.guild else 0)
+                if command:
+                    await message.channel.send(command)
+                break
         try:
             if message.mentions[0] == self.disclient.user and len(message.content.split(" ")) == 1:
                 if message.guild:
-                    msg = f'My prefix in this server is `{get_prefix(self.disclient, message)[-1]}`!'
+                    msg = f'My prefix in this server is `{(await get_prefix(self.disclient, message))[-1]}`!'
                 else:
-                    msg = f'My prefix is `{get_prefix(self.disclient, message)[-1]}`!'
+                    msg = f'My prefix is `{(await get_prefix(self.disclient, message))[-1]}`!'
                 mention = f'\nYou can always mention me to use the commands, try @{self.disclient.user.name} help'
                 embed = discord.Embed(title=f'My Prefixes',
                                       description=msg + mention,
@@ -70,7 +66,7 @@ class Events(commands.Cog):
                 if message.author == self.disclient.user:
                     print("sent out a custom command")
                 else:
-                    prefix = get_prefix(self.disclient, ctx.message)[0]
+                    prefix = (await get_prefix(self.disclient, ctx.message))[0]
                     # once guild prefix is enabled need to change regex
                     regexstr = r'(\..*){}|\{}\{}.*$'.format('{2,}', prefix, prefix)
                     print(regexstr)
@@ -99,10 +95,14 @@ class Events(commands.Cog):
 
     @commands.Cog.listener()
     async def on_guild_join(self, guild):
-        added = add_guild_db(guild.id)
+        added = await add_guild_db(guild.id)
         if added:
             print(f"Added guild: {guild.name}!")
 
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        await remove_dead_channels([channel.id])
+
     @commands.Cog.listener()
     async def on_user_join(self, ctx):
         pass
@@ -1,6 +1,6 @@
 import discord
 from discord.ext import commands
-from data import find_user, check_user_is_mod
+from data import find_user, check_user_is_mod, get_pending_xp
 from data import apis_dict
 from embeds import success_embed, thanks_embed
 from data import default_prefix
@@ -27,7 +27,7 @@ class General(commands.Cog):
             #     [f'`{name}` - {cog.__doc__}'
             #      for name, cog in self.disclient.cogs.items()]
             # )
-            if not check_user_is_mod(ctx):
+            if not await check_user_is_mod(ctx):
                 for name, cog in self.disclient.cogs.items():
                     if name != 'Events' and name != 'Owner' and name != 'Moderation':
                         cogs_desc = cogs_desc + f'`{name}` - {cog.__doc__}\n'
@@ -123,10 +123,10 @@ class General(commands.Cog):
         else:
             member = ctx.author
         print(member)
-        user = find_user(member.id)
+        user = await find_user(member.id)
         print(user)
-        xp = user[1]
-        cont = user[2]
+        xp = (user[1] if user else 0) + get_pending_xp(member.id)
+        cont = user[2] if user else 0
         cr_at = member.created_at.strftime("%a, %#d %B %Y, %I:%M%p UTC")
         jo_at = member.joined_at.strftime("%a, %#d %B %Y, %I:%M%p UTC")
         embed = discord.Embed(colour=member.colour)
@@ -1,20 +1,22 @@
 import discord
 from discord.ext import commands
-from random import SystemRandom
 import asyncio
 from datetime import datetime
 from embeds import error_embed, warning_embed, success_embed, restricted_embed
+from shuffle import ShuffleBags
+from timers import TimerScheduler
+from canonical import canonicalise
 
 # import lots of shit from datafile.
-from data import find_group_id, get_member_links_with_tag, get_member_links, find_member_id, get_all_alias_of_tag, \
+from data import find_group_id, find_member_id, get_all_alias_of_tag, \
     find_member_aliases, find_group_id_and_name, get_group_aliases, find_member_id_and_name, \
     get_tag_parent_from_alias, get_all_tag_names, add_tag, find_tag_id, add_tag_alias, add_link_tags, \
-    add_link, get_link_id, add_link_to_member, find_user, add_user_contribution, add_user, \
-    random_link_from_links, member_link_count, get_links_with_tag, get_groups, \
+    add_links_to_member, \
+    random_link_from_links, get_groups, \
     get_members_of_group_and_link_count, count_links_of_member, get_all_tags_on_member_and_count, \
-    last_three_links, count_links, apis_dict, get_auditing_channels, remove_auditing_channel, find_restricted_user_db, \
-    find_perma_db, cache_dict, random_links_without_tags, get_guild_max_duration, gfy_v2_test, gfy_v2_test_tags, \
-    get_all_tag_alias_names
+    last_three_links, count_links, apis_dict, get_auditing_channels, find_restricted_user_db, \
+    find_perma_db, state_store, random_links_without_tags, get_guild_max_duration, \
+    get_member_link_pool, get_links_by_id, query_link_ids, link_version
 
 
 # custom decorators
@@ -31,27 +33,31 @@ def is_restricted():
 
 def is_perma():
     async def perma(ctx):
-        x = find_perma_db(ctx.author.id)
+        x = await find_perma_db(ctx.author.id)
         return False if x else True
     return commands.check(perma)
 
 
-def links_with_tag(idol_id, *tags):
-    link_list = []
+def parse_tag_query(tags):
+    """Resolves tag arguments to the keyword arguments of a link index query.
+    `+tag` has to be on the link, `-tag` can't be, and a link needs one of the plain tags.
+    Returns the query, the resolved tags to key shuffle bags with and the unknown tags."""
+    query = {"any_tags": [], "all_tags": [], "no_tags": []}
+    resolved = []
     no_tag = []
     for tag in tags:
         tag = tag.lower()
-        # rework sql to take a list of tags at once, rather than multiple
-        # https://stackoverflow.com/questions/589284/imploding-a-list-for-use-in-a-python-mysqldb-in-clause
-        tagged_links = get_member_links_with_tag(idol_id[0], tag)
-        if tagged_links:
-            link_list.extend([x[0] for x in tagged_links])
-        else:
+        operator = tag[:1] if tag[:1] in ("+", "-") else ""
+        tag_name_and_id = get_tag_parent_from_alias(tag[len(operator):])
+        if not tag_name_and_id:
             no_tag.append(tag)
-    return link_list, no_tag
+            continue
+        query[{"+": "all_tags", "-": "no_tags"}.get(operator, "any_tags")].append(tag_name_and_id[1])
+        resolved.append(operator + tag_name_and_id[0])
+    return query, tuple(sorted(resolved)), no_tag
 
 
-def send_gfy_error_formatting(group, idol):
+async def send_gfy_error_formatting(group, idol):
     g_id = find_group_id(group)
     if not g_id:
         return f'No group added named {group}!'
@@ -62,20 +68,45 @@ def send_gfy_error_formatting(group, idol):
         return f"No content for `{idol}` in `{group}`!"
 
 
-def rows_of_links(group, idol):
-    group = group.lower()
-    idol = idol.lower()
-    rows = gfy_v2_test(group, idol)
-    return rows
-
-
-def rows_of_links_with_tags(group, idol, *tags):
-    group = group.lower()
-    idol = idol.lower()
-    rows = []
-    for tag in tags:
-        rows.extend(gfy_v2_test_tags(group, idol, tag[0]))
-    return rows
+def find_idol_id(group, idol):
+    """Returns the MemberId of the idol, None if the group or idol doesn't exist."""
+    g_id = find_group_id(group.lower())
+    if not g_id:
+        return None
+    m_id = find_member_id(g_id[0], idol.lower())
+    if not m_id:
+        return None
+    return m_id[0]
+
+
+def parse_link_args(args):
+    """Splits addlink arguments into {CanonicalLink: [TagName]}, the date tags that have to be created
+    and {invalid tag: [links]}. Tags belong to the link before them."""
+    link_tags = {}
+    new_tags = set()
+    invalid_tags = {}
+    currentlink = None
+    for arg in args:
+        canonical = canonicalise(arg)
+        if canonical is not None:
+            currentlink = canonical
+            link_tags.setdefault(canonical, [])
+            continue
+        if not currentlink:
+            continue
+        tag = arg.lower()
+        tag_name_and_id = get_tag_parent_from_alias(tag)
+        if tag_name_and_id:
+            tag = tag_name_and_id[0]
+        elif tag.isdecimal() and len(tag) == 6:
+            # dates are tags that get created on first use
+            new_tags.add(tag)
+        else:
+            invalid_tags.setdefault(tag, []).append(currentlink.url)
+            continue
+        if tag not in link_tags[currentlink]:
+            link_tags[currentlink].append(tag)
+    return link_tags, new_tags, invalid_tags
 
 
 def format_timer_args(args):
@@ -117,14 +148,12 @@ class Fun(commands.Cog):
     """All of the commands listed here are for gfys, images, or fancams.
     All groups with multiple word names are written as one word.
     """
-    def __init__(self, disclient, loops, recent_posts):
+    def __init__(self, disclient, timer_state, shuffle_bags):
         """Initialise client."""
         self.disclient = disclient
-        self.loops = loops
-        self.recent_posts = recent_posts
-        self.VALID_LINK_GFY = ("https://gfycat.com",
-                               "https://www.redgifs.com",
-                               "https://www.gifdeliverynetwork.com")
+        self.timers = TimerScheduler(timer_state, self.send_timer_link)
+        self.shuffle_bags = shuffle_bags
+        self.disclient.loop.create_task(self.run_timers())
         # self.disclient.loop.create_task(self.write_recent())
 
     # @commands.Cog.listener()
@@ -154,56 +183,23 @@ class Fun(commands.Cog):
         if not m_id:
             await ctx.send(embed=error_embed(f'No idol named {idol} in {group}!'))
             return
-        link_list = []
-        no_tag = []
-        if tags:
-            for tag in tags:
-                tag = tag.lower()
-                # rework sql to take a list of tags at once, rather than multiple
-                # https://stackoverflow.com/questions/589284/imploding-a-list-for-use-in-a-python-mysqldb-in-clause
-                tagged_links = get_member_links_with_tag(m_id[0], tag)
-                if tagged_links:
-                    link_list.extend([x[0] for x in tagged_links])
-                else:
-                    no_tag.append(tag)
-        if not link_list:
-            links = get_member_links(m_id[0])
-            if links:
-                link_list.extend([x[0] for x in links])
-            else:
+        query, found_tags, no_tag = parse_tag_query(tags)
+        link_ids = query_link_ids(m_id[0], "image", **query) if found_tags else []
+        if link_ids:
+            finale = await self.draw_link(("image", m_id[0]) + found_tags, link_ids, link_version(m_id[0], **query))
+        else:
+            pool = await get_member_link_pool(m_id[0])
+            if not pool.links:
                 await ctx.send(embed=error_embed(f"No content for `{idol.title()}` in `{group}`!"))
                 return
-        fts = (".JPG", ".jpg", ".JPEG", ".jpeg", ".PNG", ".png")
-        link_list = [x for x in link_list if x.endswith(fts)]
-        if not link_list:
-            await ctx.send(embed=error_embed(f"No fancams added for `{idol.title()}`!"))
-        if group not in self.recent_posts:
-            updater = {group: {}}
-            self.recent_posts.update(updater)
-        if idol not in self.recent_posts[group]:
-            updater = {idol: []}
-            self.recent_posts[group].update(updater)
-        refine = [x for x in link_list if x not in self.recent_posts[group][idol]]
-        if len(refine) <= 1:
-            print(f"resetting {group}: {idol} list.")
-            self.recent_posts[group][idol] = []
-            if no_tag:
-                msg = f'No content for requested tag(s): {", ".join(no_tag)}'
-                await ctx.send(embed=warning_embed(msg))
-                await ctx.send(refine[0])
-            else:
-                await ctx.send(refine[0])
-        else:
-            crypto = SystemRandom()
-            rand = crypto.randrange(len(refine) - 1)
-            finale = refine[rand]
-            self.recent_posts[group][idol].append(finale)
-            if no_tag:
-                msg = f'No content for requested tag(s): {", ".join(no_tag)}'
-                await ctx.send(embed=warning_embed(msg))
-                await ctx.send(finale)
-            else:
-                await ctx.send(finale)
+            finale = self.shuffle_bags.draw(("image", m_id[0]), pool.images, link_version(m_id[0]))
+        if not finale:
+            await ctx.send(embed=error_embed(f"No images added for `{idol.title()}`!"))
+            return
+        if no_tag:
+            msg = f'No content for requested tag(s): {", ".join(no_tag)}'
+            await ctx.send(embed=warning_embed(msg))
+        await ctx.send(finale)
 
 # --- Fancam Commands --- #
 
@@ -226,57 +222,24 @@ class Fun(commands.Cog):
         if not m_id:
             await ctx.send(embed=error_embed(f'No idol named {idol} in {group}!'))
             return
-        link_list = []
-        no_tag = []
-        if tags:
-            for tag in tags:
-                tag = tag.lower()
-                # rework sql to take a list of tags at once, rather than multiple
-                # https://stackoverflow.com/questions/589284/imploding-a-list-for-use-in-a-python-mysqldb-in-clause
-                tagged_links = get_member_links_with_tag(m_id[0], tag)
-                if tagged_links:
-                    link_list.extend([x[0] for x in tagged_links])
-                else:
-                    no_tag.append(tag)
-        if not link_list:
-            links = get_member_links(m_id[0])
-            if links:
-                link_list.extend([x[0] for x in links])
-            else:
+        query, found_tags, no_tag = parse_tag_query(tags)
+        link_ids = query_link_ids(m_id[0], "fancam", **query) if found_tags else []
+        if link_ids:
+            finale = await self.draw_link(("fancam", m_id[0]) + found_tags, link_ids,
+                                          link_version(m_id[0], **query))
+        else:
+            pool = await get_member_link_pool(m_id[0])
+            if not pool.links:
                 await ctx.send(embed=error_embed(f"No content for `{idol.title()}` in `{group}`!"))
                 return
-        yt_link = 'https://www.youtu'
-        # THIS SEEMS TO BE BROKEN --------------------------------------------------------------- #
-        link_list = [x[0] for x in link_list if x[0].startswith(yt_link)]
-        if not link_list:
+            finale = self.shuffle_bags.draw(("fancam", m_id[0]), pool.fancams, link_version(m_id[0]))
+        if not finale:
             await ctx.send(embed=error_embed(f"No fancams added for `{idol.title()}`!"))
-        if group not in self.recent_posts:
-            updater = {group: {}}
-            self.recent_posts.update(updater)
-        if idol not in self.recent_posts[group]:
-            updater = {idol: []}
-            self.recent_posts[group].update(updater)
-        refine = [x for x in link_list if x not in self.recent_posts[group][idol]]
-        if len(refine) <= 1:
-            print(f"resetting {group}: {idol} list.")
-            self.recent_posts[group][idol] = []
-            if no_tag:
-                msg = f'No content for requested tag(s): {", ".join(no_tag)}'
-                await ctx.send(embed=warning_embed(msg))
-                await ctx.send(refine[0])
-            else:
-                await ctx.send(refine[0])
-        else:
-            crypto = SystemRandom()
-            rand = crypto.randrange(len(refine) - 1)
-            finale = refine[rand]
-            self.recent_posts[group][idol].append(finale)
-            if no_tag:
-                msg = f'No content for requested tag(s): {", ".join(no_tag)}'
-                await ctx.send(embed=warning_embed(msg))
-                await ctx.send(finale)
-            else:
-                await ctx.send(finale)
+            return
+        if no_tag:
+            msg = f'No content for requested tag(s): {", ".join(no_tag)}'
+            await ctx.send(embed=warning_embed(msg))
+        await ctx.send(finale)
 
 # --- Gfy/Link Commands --- #
 
@@ -312,111 +275,10 @@ class Fun(commands.Cog):
                 await ctx.send(embed=error_embed(f"{idol} not in {group}!"))
                 return
             author = ctx.author.id
-            currentlink = None
-            last_added = None
-            invalid_tags = {}
-            duplicate_tags = {}
-            tags_added = {}
-            duplicate_links = 0
-            added_links = 0
-            valid_tags = [x[0] for x in get_all_tag_alias_names()]
-            fts = (".JPG", ".jpg", ".JPEG", ".jpeg", ".PNG", ".png")
-            for link in links:
-                if link.endswith("/"):
-                    link = link[:-1]
-                if link.startswith("https://gfycat.com/"):
-                    split = link.split("/")
-                    if "-" in split[-1]:
-                        split[-1] = split[-1].split("-")
-                        split[-1] = split[-1][0]
-                    link = "https://gfycat.com/" + split[-1]
-                    currentlink = link
-                    last_added = None
-                elif link.startswith("https://www.redgifs.com/"):
-                    split = link.split("/")
-                    link = "https://www.redgifs.com/watch/" + split[-1]
-                    currentlink = link
-                    last_added = None
-                elif link.startswith("https://www.gifdeliverynetwork.com/"):
-                    split = link.split("/")
-                    link = "https://www.gifdeliverynetwork.com/" + split[-1]
-                    currentlink = link
-                    last_added = None
-                elif link.startswith("https://www.youtu"):
-                    currentlink = link
-                    last_added = None
-                elif link.endswith(fts):
-                    currentlink = link
-                    last_added = None
-                elif "twimg" in link:
-                    split_link = link.split("/")
-                    if "?" in split_link[-1]:
-                        splitt = split_link[-1].split("?")
-                        if "png" in splitt[-1]:
-                            newending = splitt[0] + "?format=png&name=orig"
-                        else:
-                            newending = splitt[0] + "?format=jpg&name=orig"
-                        link = "https://pbs.twimg.com/media/" + newending
-                    elif "." in split_link[-1]:
-                        splitt = split_link[-1].split(".")
-                        if "png" in splitt[-1]:
-                            newending = splitt[0] + "?format=png&name=orig"
-                        else:
-                            newending = splitt[0] + "?format=jpg&name=orig"
-                        link = "https://pbs.twimg.com/media/" + newending
-                    currentlink = link
-                    last_added = None
-                else:
-                    if not currentlink:
-                        continue
-                    link = link.lower()
-                    # tags code is really untested
-                    if link not in valid_tags:
-                        # check tag is a date format
-                        if link.isdecimal() and len(link) == 6:
-                            add_tag(link, author)
-                            tag_id = find_tag_id(link)
-                            add_tag_alias(tag_id, link, author)
-                            added_tagged_link = add_link_tags(currentlink, link)
-                            if added_tagged_link:
-                                if link in tags_added:
-                                    tags_added[link] += 1
-                                else:
-                                    tags_added.update({link: 1})
-                        else:
-                            if link not in invalid_tags:
-                                invalid_tags.update({link: [currentlink]})
-                            else:
-                                invalid_tags[link].append(currentlink)
-                            continue
-                    else:
-                        link = get_tag_parent_from_alias(link)[0]
-                        added = add_link_tags(currentlink, link)
-                        if added:
-                            if link in tags_added:
-                                tags_added[link] += 1
-                            else:
-                                tags_added.update({link: 1})
-                        else:
-                            # update to duplicate tags in future
-                            if link not in duplicate_tags:
-                                duplicate_tags.update({link: [currentlink]})
-                            else:
-                                duplicate_tags[link].append(currentlink)
-                            continue
-                if add_link(currentlink, author):
-                    l_id = get_link_id(currentlink)
-                    added = add_link_to_member(m_id[0], l_id)
-                    if added:
-                        await self.audit_channel(group, idol, str(link), ctx.author)
-                        added_links += 1
-                        last_added = currentlink
-                    else:
-                        if currentlink == last_added:
-                            continue
-                        else:
-                            duplicate_links += 1
-            # loop end .............................................................. this function loool
+            link_tags, new_tags, invalid_tags = parse_link_args(links)
+            added, duplicate_links, tags_added, duplicate_tags = await add_links_to_member(m_id[0], link_tags,
+                                                                                           new_tags, author)
+            added_links = len(added)
             embed = discord.Embed(title='Results:',
                                   color=discord.Color.blurple())
             if added_links > 0:
@@ -424,14 +286,9 @@ class Fun(commands.Cog):
                 embed.add_field(name=f"Added `{added_links}` link(s) to `{group}`'s `{idol}`!",
                                 value='\uFEFF',
                                 inline=False)
-                found = find_user(author)
-                if found:
-                    add_user_contribution(author, added_links)
-                    # TODO add messaging to users adding a lot, to invite them to main discord
-                    # check add check to database as to whether they have been messaged
-                    # also check that they are not currently in the discord
-                else:
-                    add_user(author, 0, added_links)
+                # TODO add messaging to users adding a lot, to invite them to main discord
+                # check add check to database as to whether they have been messaged
+                # also check that they are not currently in the discord
             if tags_added:
                 lets = []
                 for key, value in tags_added.items():
@@ -454,68 +311,47 @@ class Fun(commands.Cog):
             if not added_links and not tags_added and not duplicate_links and not invalid_tags:
                 embed = error_embed("Something went wrong!")
             await ctx.send(embed=embed)
-
-    def add_to_recent_posts(self, group, idol):
-        if group not in self.recent_posts:
-            updater = {group: {}}
-            self.recent_posts.update(updater)
-        if idol not in self.recent_posts[group]:
-            updater = {idol: []}
-            self.recent_posts[group].update(updater)
-
-    def return_gfys(self, group, idol, tags):
-        if tags:
-            print("there are tags")
-            rows = rows_of_links_with_tags(group, idol, tags)
-            if not rows:
+            for link in added:
+                await self.audit_channel(group, idol, link, ctx.author)
+
+    async def return_gfys(self, group, idol, tags):
+        m_id = find_idol_id(group, idol)
+        if m_id is not None:
+            if tags:
+                query, found_tags, _ = parse_tag_query(tags)
+                if found_tags:
+                    finale = await self.draw_link(("gfy", m_id) + found_tags, query_link_ids(m_id, "gfy", **query),
+                                                  link_version(m_id, **query))
+                    if finale:
+                        return finale
                 print("nothing for that tag")
-                rows = rows_of_links(group, idol)
-        else:
-            print("no tags")
-            rows = rows_of_links(group, idol)
-        # row = (groupid, memberid, gromanname, mromanname, link)
-        if len(rows) >= 1:
-            return self.return_link_from_rows(rows)
-        else:
-            # handle error here
-            error = send_gfy_error_formatting(group, idol)
-            if error:
-                return error_embed(error)
-
-    def return_link_from_rows(self, rows):
-        """x: row: (gid, mid, gname, mname, link)"""
-        group = rows[0][2]
-        idol = rows[0][3]
-        self.add_to_recent_posts(group, idol)
-        links = [
-            x[-1] for x in rows if x[-1] not in self.recent_posts[x[2]][x[3]] and x[-1].startswith(self.VALID_LINK_GFY)]
-        print(links)
-        if not links:
-            print("not a single link left, resetting recent post")
-            links = [x[-1] for x in rows if x[-1].startswith(self.VALID_LINK_GFY)]
-            self.recent_posts[group][idol] = []
-        crypto = SystemRandom()
-        try:
-            rand = crypto.randrange(len(links) - 1)
-        except ValueError:
-            rand = 0
-        finale = links[rand]
-        if len(links) <= 1:
-            self.recent_posts[group][idol] = []
-        else:
-            self.recent_posts[group][idol].append(finale)
-        return finale
+            pool = await get_member_link_pool(m_id)
+            finale = self.shuffle_bags.draw(("gfy", m_id), pool.gfys, link_version(m_id))
+            if finale:
+                return finale
+        # handle error here
+        error = await send_gfy_error_formatting(group, idol)
+        if error:
+            return error_embed(error)
+
+    async def draw_link(self, key, link_ids, version):
+        """Draws one of the LinkIds from the shuffle bag of the key and returns its link, None if there are none.
+        version is the link_version of the query the LinkIds came from."""
+        link_id = self.shuffle_bags.draw(key, link_ids, version)
+        if link_id is None:
+            return None
+        return (await get_links_by_id([link_id])).get(link_id)
 
     @commands.command(name='gfy', aliases=['gif', 'gyf', 'jif'])
     @is_restricted()
     async def _gfyv2(self, ctx, group, idol, *tags):
         """Returns a gfy from the requested group and idol!
         Examples: `.gfy <group> <idol>`, `.gfy RV Joy`
-        You can also add tags after the idol arguement"""
+        You can also add tags after the idol arguement, `+tag` must also be on the gfy and `-tag` must not be"""
         group = group.lower()
         idol = idol.lower()
         tags = tags
-        result = self.return_gfys(group, idol, tags)
+        result = await self.return_gfys(group, idol, tags)
         if isinstance(result, discord.Embed):
             # this is an error
             await ctx.send(embed=result)
@@ -529,24 +365,17 @@ class Fun(commands.Cog):
     async def random(self, ctx):
         """Returns a random link, luck of the draw!"""
 
-        async def random_link():
-            link_member_group = random_link_from_links()
-            link = link_member_group[0]
-            idol = link_member_group[1]
-            group = link_member_group[2]
-            self.add_to_recent_posts(group, idol)
-            if link not in self.recent_posts[group][idol]:
-                self.recent_posts[group][idol].append(link)
-                await ctx.send(f"Random choice! `{group.title()}`'s `{idol.title()}`\n{link}")
-            else:
-                relen = len(self.recent_posts[group][idol])
-                gflen = member_link_count(group, idol)
-                if relen == gflen:
-                    print(f"resetting recent dict for {idol}")
-                    self.recent_posts[group][idol] = []
-                await random_link()
-
-        await random_link()
+        link_member_group = await random_link_from_links()
+        if not link_member_group:
+            await ctx.send(embed=error_embed('No links added... Yet!'))
+            return
+        idol = link_member_group[1]
+        group = link_member_group[2]
+        # the random row only picks the idol, their own bag picks the link so it doesn't repeat
+        pool = await get_member_link_pool(link_member_group[3])
+        link = self.shuffle_bags.draw(("random", link_member_group[3]), pool.links,
+                                      link_version(link_member_group[3])) or link_member_group[0]
+        await ctx.send(f"Random choice! `{group.title()}`'s `{idol.title()}`\n{link}")
 
 # --- Tags --- #
 
@@ -554,7 +383,7 @@ class Fun(commands.Cog):
     @is_restricted()
     async def tags(self, ctx):  # link=None
         """Returns a list of the tags!"""
-        tag_list = [x[0] for x in get_all_tag_names() if len(x[0]) != 6 and not x[0].isdecimal()]
+        tag_list = [x[0] for x in await get_all_tag_names() if len(x[0]) != 6 and not x[0].isdecimal()]
         msg = f"`{format_list(tag_list)}`\nSome tags have aliases, to check these try `.tagalias <tag>`\n" \
               f"Dates are also available, check out `.dates` to see them!"
         embed = discord.Embed(title="Tags:",
@@ -565,7 +394,7 @@ class Fun(commands.Cog):
     @commands.command()
     @is_restricted()
     async def dates(self, ctx):
-        date_list = [x[0] for x in get_all_tag_names() if len(x[0]) == 6 and x[0].isdecimal()]
+        date_list = [x[0] for x in await get_all_tag_names() if len(x[0]) == 6 and x[0].isdecimal()]
         msg = f"`{format_list(date_list)}`"
         embed = discord.Embed(title="Dates:",
                               description=msg,
@@ -580,7 +409,7 @@ class Fun(commands.Cog):
         tag_name_and_id = get_tag_parent_from_alias(tag)
         tag_name = tag_name_and_id[0]
         tag_id = tag_name_and_id[-1]
-        aliases = [x[0] for x in get_all_alias_of_tag(tag_id)]
+        aliases = [x[0] for x in await get_all_alias_of_tag(tag_id)]
         embed = discord.Embed(title=f"Aliases for `{tag_name}`:",
                               description=f"`{format_list(aliases)}`",
                               color=discord.Color.blurple())
@@ -599,37 +428,26 @@ class Fun(commands.Cog):
             await ctx.send(error_embed("Not enough arguments provided!"))
             return
         currentlink = None
-        valid_links = (
-            "https://gfycat.com/",
-            "https://www.redgifs.com/",
-            "https://www.gifdeliverynetwork.com/",
-            "https://pbs.twimg.com/media/",
-            "https://youtu",
-            "https://www.youtu"
-        )
-        valid_fts = (".JPG", ".jpg", ".JPEG", ".jpeg", ".PNG", ".png")
-        valid_tags = [x[0] for x in get_all_tag_alias_names()]
         author = ctx.author.id
         invalid_tags = []
         duplicate_tags = []
         tags_added = {}
         for tag in tags_list:
-            if tag.startswith(valid_links):
-                currentlink = tag
-            elif tag.endswith(valid_fts):
-                currentlink = tag
+            canonical = canonicalise(tag)
+            if canonical is not None:
+                currentlink = canonical.url
             else:
                 if not currentlink:
                     continue
                 tag = tag.lower()
-                tag = get_tag_parent_from_alias(tag)[0]
-                if tag not in valid_tags:
+                tag_name_and_id = get_tag_parent_from_alias(tag)
+                if tag_name_and_id is None:
                     # check tag is a date format
                     if tag.isdecimal() and len(tag) == 6:
-                        add_tag(tag, author)
-                        tag_id = find_tag_id(tag)
-                        add_tag_alias(tag_id, tag, author)
-                        added_tagged_link = add_link_tags(currentlink, tag)
+                        await add_tag(tag, author)
+                        tag_id = (await find_tag_id(tag))[0]
+                        await add_tag_alias(tag_id, tag, author)
+                        added_tagged_link = await add_link_tags(currentlink, tag)
                         if added_tagged_link:
                             if tag in tags_added:
                                 tags_added[tag] += 1
@@ -639,7 +457,8 @@ class Fun(commands.Cog):
                         invalid_tags.append(tag)
                         continue
                 else:
-                    added = add_link_tags(currentlink, tag)
+                    tag = tag_name_and_id[0]
+                    added = await add_link_tags(currentlink, tag)
                     if added:
                         if tag in tags_added:
                             tags_added[tag] += 1
@@ -670,40 +489,29 @@ class Fun(commands.Cog):
             embed = error_embed("Something went wrong!")
         await ctx.send(embed=embed)
 
+    async def send_tagged(self, ctx, tags, media=None):
+        """Sends a random link of the media type that matches the tags, see parse_tag_query."""
+        query, found_tags, _ = parse_tag_query(tags)
+        link_ids = query_link_ids(media=media, **query) if found_tags else []
+        finale = await self.draw_link(("tagged",) + found_tags + ((media,) if media else ()), link_ids,
+                                      link_version(**query))
+        if finale:
+            await ctx.send(f"Tagged `{' '.join(found_tags)}`, {finale}")
+            return
+        await ctx.send(f"Nothing for tag `{' '.join(x.lower() for x in tags)}`")
+
     @commands.command(aliases=['t'])
     @is_restricted()
-    async def tagged(self, ctx, tag):
+    async def tagged(self, ctx, tag, *tags):
         """
         Sends a random gfy with the specified tag.
         Example: .tagged <tag>
+        More tags can follow, `+tag` must also be on the link and `-tag` must not be.
         """
-        tag = tag.lower()
-        valid_tags = [x[0] for x in get_all_tag_alias_names()]
-        if tag in valid_tags:
-            tag = get_tag_parent_from_alias(tag)[0]
-            if tag not in self.recent_posts:
-                updater = {tag: []}
-                self.recent_posts.update(updater)
-            taggfy = [x[0] for x in get_links_with_tag(tag)]
-            recentag = self.recent_posts[tag]
-            refine = [x for x in taggfy if x not in recentag]
-            if len(refine) <= 1:
-                self.recent_posts[tag] = []
-                refine = taggfy
-            crypto = SystemRandom()
-            try:
-                rand = crypto.randrange(len(refine) - 1)
-            except Exception as e:
-                print(e)
-                rand = 0
-            finale = refine[rand]
-            self.recent_posts[tag].append(finale)
-            await ctx.send(f"Tagged `{tag}`, {finale}")
-        else:
-            await ctx.send(f"Nothing for tag `{tag}`")
+        await self.send_tagged(ctx, (tag,) + tags)
 
     @commands.command(aliases=['ti'])
-    async def taggedimage(self, ctx, tag):
+    async def taggedimage(self, ctx, tag, *tags):
         """
         Sends a random image with the specified tag.
         Example: .taggedimage <tag>
@@ -712,90 +520,22 @@ class Fun(commands.Cog):
             if find_restricted_user_db(ctx.guild.id, ctx.author.id):
                 await ctx.author.send(embed=restricted_embed(ctx.guild))
                 return
-        tag = tag.lower()
-        valid_fts = (".JPG", ".jpg", ".JPEG", ".jpeg", ".PNG", ".png")
-        valid_tags = [x[0] for x in get_all_tag_alias_names()]
-        twitter = "https://pbs.twimg"
-        if tag in valid_tags:
-            tag = get_tag_parent_from_alias(tag)[0]
-            if tag not in self.recent_posts:
-                updater = {tag: []}
-                self.recent_posts.update(updater)
-            tg = get_links_with_tag(tag)
-            recentag = self.recent_posts[tag]
-            refine = [x[0] for x in tg if x[0] not in recentag and x[0].endswith(valid_fts) or x[0].startswith(twitter)]
-            if len(refine) <= 1:
-                self.recent_posts[tag] = []
-                refine = tg
-            crypto = SystemRandom()
-            rand = crypto.randrange(len(refine) - 1)
-            finale = refine[rand]
-            self.recent_posts[tag].append(finale)
-            await ctx.send(f"Tagged `{tag}`, {finale}")
-        else:
-            await ctx.send(f"Nothing for tag `{tag}`")
+        await self.send_tagged(ctx, (tag,) + tags, "image")
 
     @commands.command(aliases=['tg'])
     @is_restricted()
-    async def taggedgfy(self, ctx, tag):
+    async def taggedgfy(self, ctx, tag, *tags):
         """
         Sends a random gfy with the specified tag.
         Example: .taggedgfy <tag>
         """
-        valid_links = (
-            "https://www.redgifs",
-            "https://gfy",
-            "https://gifdeliverynetwork"
-        )
-        tag = tag.lower()
-        valid_tags = [x[0] for x in get_all_tag_alias_names()]
-        if tag in valid_tags:
-            tag = get_tag_parent_from_alias(tag)[0]
-            if tag not in self.recent_posts:
-                updater = {tag: []}
-                self.recent_posts.update(updater)
-            taggfy = get_links_with_tag(tag)
-            recentag = self.recent_posts[tag]
-            refine = [x[0] for x in taggfy if x[0] not in recentag and x[0].startswith(valid_links)]
-            if len(refine) <= 1:
-                self.recent_posts[tag] = []
-                refine = taggfy
-            crypto = SystemRandom()
-            rand = crypto.randrange(len(refine) - 1)
-            finale = refine[rand]
-            self.recent_posts[tag].append(finale)
-            await ctx.send(f"Tagged `{tag}`, {finale}")
-        else:
-            await ctx.send(f"Nothing for tag `{tag}`")
+        await self.send_tagged(ctx, (tag,) + tags, "gfy")
 
     @commands.command(aliases=['tf'])
     @is_restricted()
-    async def taggedfancam(self, ctx, tag):
+    async def taggedfancam(self, ctx, tag, *tags):
         """Sends a random fancam with the specified tag."""
-        valid_links = (
-            "https://youtu",
-            "https://www.you"
-        )
-        tag = tag.lower()
-        valid_tags = [x[0] for x in get_all_tag_alias_names()]
-        if tag in valid_tags:
-            tag = get_tag_parent_from_alias(tag)[0]
-            if tag not in self.recent_posts:
-                updater = {tag: []}
-                self.recent_posts.update(updater)
-            taggfy = get_links_with_tag(tag)
-            recentag = self.recent_posts[tag]
-            refine = [x[0] for x in taggfy if x[0] not in recentag and x[0].startswith(valid_links)]
-            if len(refine) <= 1:
-                self.recent_posts[tag] = []
-                refine = taggfy
-            crypto = SystemRandom()
-            rand = crypto.randrange(len(refine) - 1)
-            finale = refine[rand]
-            self.recent_posts[tag].append(finale)
-            await ctx.send(f"Tagged `{tag}`, {finale}")
-        else:
-            await ctx.send(f"Nothing for tag `{tag}`")
+        await self.send_tagged(ctx, (tag,) + tags, "fancam")
 
     @commands.command(aliases=['tagupdater'])
     @is_restricted()
@@ -829,7 +569,7 @@ class Fun(commands.Cog):
                 number_of_links = 4
         elif number_of_links > 30:
             number_of_links = 30
-        links = random_links_without_tags(number_of_links, group, idol)
+        links = await random_links_without_tags(number_of_links, group, idol)
         print(links)
         # link is a tuple of 3 parts, 0: link, 1: member name, 2: group name
         send = f"The following links have no tags assigned to them!\n"
@@ -866,79 +606,99 @@ class Fun(commands.Cog):
                 if duration > max_duration[0]:
                     duration = max_duration[0]
                     msg = msg + f'\nDuration reduced to server max duration of `{max_duration[0]}`.'
-        if tags:
-            links = rows_of_links_with_tags(group, idol, tags)
-        else:
-            links = rows_of_links(group, idol)
+        m_id = find_idol_id(group, idol)
+        if m_id is None:
+            await ctx.send(embed=error_embed(await send_gfy_error_formatting(group, idol)))
+            return
+        tags = tuple(x.lower() for x in tags)
+        links = self.timer_links(m_id, tags)[1]
+        if not links:
+            await ctx.send(embed=error_embed(await send_gfy_error_formatting(group, idol)))
+            return
         loops = (abs(duration) * 60) // abs(interval)
         if len(links) < loops:
             loops = len(links)
-        author = str(ctx.author.id)
-        channel = str(ctx.channel.id)
-        if channel not in self.loops:
-            self.loops.update({channel: {}})
-        if author not in self.loops[channel]:
-            self.loops[channel].update({author: {'1': loops}})
-            index = '1'
-        else:
-            try:
-                index = int(max(self.loops[channel][author].keys())) + 1
-            except ValueError:
-                index = '1'
-            index = str(index)
-            self.loops[channel][author].update({index: loops})
+        loops = max(loops, 1)
         msg = f"{group}'s {idol} for {duration} minute(s)!" + msg
         await ctx.send(embed=discord.Embed(title='Starting Timer!',
                                            description=msg,
                                            color=discord.Color.blurple()))
+        self.timers.start(ctx.channel.id, ctx.author.id, m_id, tags, interval, loops)
+
+    def timer_links(self, member_id, tags):
+        """Returns the shuffle bag key, LinkIds and their version a timer draws from,
+        gfys with the tags or else every gfy."""
+        query, found_tags, _ = parse_tag_query(tags)
+        links = query_link_ids(member_id, "gfy", **query) if found_tags else []
+        if links:
+            return ("gfy", member_id) + found_tags, links, link_version(member_id, **query)
+        # same order as the member link pool, so this shares the bag of `.gfy <group> <idol>`
+        return ("gfy", member_id), query_link_ids(member_id, "gfy"), link_version(member_id)
+
+    async def run_timers(self):
+        await self.disclient.wait_until_ready()
+        await self.timers.run()
+
+    async def send_timer_link(self, timer):
+        channel = self.disclient.get_channel(timer.channel_id)
+        if channel is None:
+            self.timers.stop(timer.channel_id)
+            return
+        if timer.links is None:
+            timer.links = self.timer_links(timer.member_id, timer.tags)
         try:
-            while self.loops[channel][author][index] > 0:
-                await ctx.send(self.return_link_from_rows(links))
-                self.loops[channel][author][index] -= 1
-                if self.loops[channel][author][index] == 0:
-                    await ctx.send(embed=discord.Embed(title='Timer Finished!',
+            link = await self.draw_link(*timer.links)
+            if link:
+                await channel.send(link)
+            if timer.remaining == 0:
+                await channel.send(embed=discord.Embed(title='Timer Finished!',
                                                        description='',
                                                        color=discord.Color.blurple()))
-                    break
-                await asyncio.sleep(interval)
-        except KeyError:
-            pass
-        if self.loops[channel][author][index] == 0:
-            self.loops[channel][author].pop(index)
-        if not self.loops[channel][author]:
-            self.loops[channel].pop(author)
-        if not self.loops[channel]:
-            self.loops.pop(channel)
+        except discord.Forbidden:
+            self.timers.stop(timer.channel_id)
+        except Exception as e:
+            print(e)
 
     @commands.command(aliases=['stop', 'cancel', 'end'])
     @is_restricted()
-    async def stop_timer(self, ctx, timer_number=None):
+    async def stop_timer(self, ctx, timer_number=None, idol=None):
         """
         Stops the timer function by user, if you have multiple timers running, specify the timer number.
         You can stop all timers with: .stop all
+        You can stop all timers of an idol with: .stop <group> <idol>
         """
-
-        author = str(ctx.author.id)
-        channel = str(ctx.channel.id)
-        if channel not in self.loops:
+        if not self.timers.running(ctx.channel.id):
             await ctx.send(embed=error_embed('No timer running in this channel.'))
             return
-        if author not in self.loops[channel]:
-            await ctx.send(embed=error_embed('No timer running for {ctx.author} in this channel.'))
+        running = self.timers.running(ctx.channel.id, ctx.author.id)
+        if not running:
+            await ctx.send(embed=error_embed(f'No timer running for {ctx.author} in this channel.'))
             return
-        if not timer_number:
-            timer_number = min(self.loops[channel][author].keys())
-        if timer_number == 'all':
-            for element in self.loops[channel][author].keys():
-                self.loops[channel][author].pop(element)
+        if idol is not None:
+            group = timer_number
+            m_id = find_idol_id(group, idol)
+            if m_id is None or not self.timers.stop(ctx.channel.id, ctx.author.id, member_id=m_id):
+                await ctx.send(embed=error_embed(f'No timer of `{idol}` in `{group}` running for {ctx.author} '
+                                                 f'in this channel.'))
+                return
             await ctx.send(embed=discord.Embed(title='Stopped Timer',
-                                               description=f"Stopped all timers for `{ctx.author}`",
+                                               description=f"Stopped timers of `{idol}` for `{ctx.author}`",
                                                color=discord.Color.blurple()))
-        else:
-            self.loops[channel][author].pop(timer_number)
+            return
+        if timer_number == 'all':
+            self.timers.stop(ctx.channel.id, ctx.author.id)
             await ctx.send(embed=discord.Embed(title='Stopped Timer',
-                                               description=f"Stopped timer {timer_number} for {ctx.author}",
+                                               description=f"Stopped all timers for `{ctx.author}`",
                                                color=discord.Color.blurple()))
+            return
+        if not timer_number:
+            timer_number = min(running)
+        if not str(timer_number).isdecimal() or not self.timers.stop(ctx.channel.id, ctx.author.id, int(timer_number)):
+            await ctx.send(embed=error_embed(f'No timer {timer_number} running for {ctx.author} in this channel.'))
+            return
+        await ctx.send(embed=discord.Embed(title='Stopped Timer',
+                                           description=f"Stopped timer {timer_number} for {ctx.author}",
+                                           color=discord.Color.blurple()))
 
     @commands.command(name='force_stop', aliases=['stoptimer', 'stopusertimer', 'forcestop'])
     @commands.has_permissions(manage_messages=True)
@@ -949,14 +709,10 @@ class Fun(commands.Cog):
         Usage (invoke this command in the same channel that the timer is running):
         .force_stop @<user>
         .force_stop <User ID>"""
-        channel = str(ctx.channel.id)
-        member_id = str(member.id)
         destroyed = 0
-        if channel in self.loops:
-            if member_id in self.loops[channel]:
-                destroyed += len(self.loops[channel][member_id])
-                del self.loops[channel][member_id]
-            else:
+        if self.timers.running(ctx.channel.id):
+            destroyed = self.timers.stop(ctx.channel.id, member.id)
+            if not destroyed:
                 await ctx.send(embed=error_embed(f'No timers running for `{member}`!'))
         else:
             await ctx.send(embed=error_embed('No timers running in this channel!'))
@@ -977,7 +733,7 @@ class Fun(commands.Cog):
         """
         async with ctx.channel.typing():
             if group is None:
-                groups = get_groups()
+                groups = await get_groups()
                 groups = [x[0] for x in groups]
                 group_msg = f"`{format_list(groups)}`"
                 s = "Type `.info <group>` for more information on that group!"
@@ -992,8 +748,8 @@ class Fun(commands.Cog):
                     g_id = name_and_g_id[0]
                     g_name = name_and_g_id[-1]
                     message = []
-                    aliases = [x[0] for x in get_group_aliases(g_id)]
-                    members = get_members_of_group_and_link_count(g_id)
+                    aliases = [x[0] for x in await get_group_aliases(g_id)]
+                    members = await get_members_of_group_and_link_count(g_id)
                     for member in members:
                         name = member[0]
                         number_of_links = member[1]
@@ -1025,14 +781,14 @@ class Fun(commands.Cog):
                     return
                 m_id = m_id_and_name[0]
                 m_name = m_id_and_name[-1]
-                link_count = count_links_of_member(m_id)
-                member_aliases = [x[0] for x in find_member_aliases(m_id)]
+                link_count = await count_links_of_member(m_id)
+                member_aliases = [x[0] for x in await find_member_aliases(m_id)]
                 is_tagged = []
-                tags_and_count = get_all_tags_on_member_and_count(m_id)
+                tags_and_count = await get_all_tags_on_member_and_count(m_id)
                 for tags in tags_and_count:
                     is_tagged.append(f"{tags[0]}: {tags[1]}")
                 a = f'{g_name} {m_name.title()} Information'
-                d = hide_links([x[0] for x in last_three_links(m_id)])
+                d = hide_links([x[0] for x in await last_three_links(m_id)])
                 if is_tagged:
                     c = format_list(is_tagged)
                     s = (f'`{m_name.title()}` has a total of `{link_count}` link(s)!\n'
@@ -1054,7 +810,7 @@ class Fun(commands.Cog):
     @commands.command(aliases=['linkcount', 'total_links'])
     @is_restricted()
     async def totallinks(self, ctx):
-        results = count_links()
+        results = await count_links()
         group_count = results[1]
         member_count = results[2]
         link_count = results[0]
@@ -1170,25 +926,16 @@ class Fun(commands.Cog):
         be made by mods, author names will be omitted in those.
         """
         dt = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        main_audcha = self.disclient.get_channel(apis_dict["auditing_channel"])
         s = f'Time Added: `{dt}`\nUser ID: `{author.id}`\nGroup: `{group}`\nIdol: `{idol}`\nLink: {link}'
         embed = discord.Embed(title=s,
                               color=discord.Color.blurple())
         embed.set_footer(text=f"Added by {author}",
                          icon_url=author.avatar_url)
-        await main_audcha.send(embed=embed)
-        await main_audcha.send(link)
-        aud_chas = get_auditing_channels()
-        if aud_chas:
-            list_of_chas = [x[0] for x in aud_chas]
-            for chan in list_of_chas:
-                channel = self.disclient.get_channel(int(chan))
-                fstr = f'Added: `{group}`, `{idol}`: {link}'
-                try:
-                    await channel.send(fstr)
-                except AttributeError:
-                    print("channel deleted")
-                    remove_auditing_channel(chan)
+        self.disclient.dispatcher.send(apis_dict["auditing_channel"], embed=embed)
+        self.disclient.dispatcher.send(apis_dict["auditing_channel"], link)
+        aud_chas = await get_auditing_channels()
+        fstr = f'Added: `{group}`, `{idol}`: {link}'
+        self.disclient.dispatcher.fan_out([x[0] for x in aud_chas], fstr)
 
 
 # --- End of Class --- #
@@ -1216,9 +963,13 @@ def newline(array):
 
 def setup(disclient):
     try:
-        loops = cache_dict["gfys"]["loops"]  # dict for timers
-        recent_posts = cache_dict["gfys"]["recent_posts"]
-        disclient.add_cog(Fun(disclient, loops, recent_posts))
+        # running timers, so they carry on after a restart
+        timer_state = state_store.namespace("timers")
+        # seed and cursor of every shuffle bag
+        shuffle_bags = ShuffleBags(state_store.namespace("shuffle_bags"),
+                                   apis_dict.get("shuffle_bag_max_keys", 50000),
+                                   apis_dict.get("shuffle_bag_ttl_days", 30) * 86400)
+        disclient.add_cog(Fun(disclient, timer_state, shuffle_bags))
     except Exception as e:
         print(f"gfys cog could not be loaded")
         print(e)
\ No newline at end of file
@@ -2,7 +2,7 @@ import discord
 from discord.ext import commands
 
 from data import set_guild_prefix_db, add_banned_word, remove_restricted_user, add_restricted_user, check_user_is_mod, \
-    add_linked_channel_db, set_guild_max_timer_db
+    add_linked_channel_db, set_guild_max_timer_db, remove_banned_word, normalise_banned_word
 from embeds import error_embed, success_embed, permission_denied_embed
 
 
@@ -20,7 +20,7 @@ class Server(commands.Cog):
         if len(prefix) > 3:
             await ctx.send(embed=error_embed(f'Invalid prefix: `{prefix}. Please use 3 characters maximum'))
             return
-        set_prefix = set_guild_prefix_db(ctx.guild.id, prefix)
+        set_prefix = await set_guild_prefix_db(ctx.guild.id, prefix)
         if set_prefix:
             await ctx.send(embed=success_embed(f'Changed this servers prefix to `{prefix}`!'))
         else:
@@ -34,7 +34,7 @@ class Server(commands.Cog):
         Example:
         .set_max_timer 10"""
         guild_id = ctx.guild.id
-        set_limit = set_guild_max_timer_db(timer_limit, guild_id)
+        set_limit = await set_guild_max_timer_db(timer_limit, guild_id)
         if set_limit:
             await ctx.send(embed=success_embed(f'Set the timer limit to `{timer_limit}` minute(s) in {ctx.guild.name}!'))
         else:
@@ -46,7 +46,7 @@ class Server(commands.Cog):
     async def _restrict_user(self, ctx, member: discord.Member):
         """Restricts a user from using Joy's Fun category commands in this discord.
         The user can continue to use the bot in DMs, other categories, and in other discords."""
-        added = add_restricted_user(ctx.guild.id, member.id)
+        added = await add_restricted_user(ctx.guild.id, member.id)
         if added:
             await ctx.send(embed=success_embed(f'Restricted {member} in {ctx.guild.name}!'))
         else:
@@ -57,7 +57,7 @@ class Server(commands.Cog):
     @commands.guild_only()
     async def _unrestrict_user(self, ctx, member: discord.Member):
         """Unrestricts a user from using Joy's Fun category commands in this discord."""
-        removed = remove_restricted_user(ctx.guild.id, member.id)
+        removed = await remove_restricted_user(ctx.guild.id, member.id)
         if removed:
             await ctx.send(embed=success_embed(f'{member} is no longer restricted in {ctx.guild.name}!'))
         else:
@@ -78,33 +78,35 @@ class Server(commands.Cog):
     #         await ctx.send(embed=success_embed(f"Linked channel to automatically grab links for {group}'s {idol}!"))
     #     else:
     #         await ctx.send(embed=error_embed(f"Failed to add linked channel!"))
-    #
-    # @commands.command()
-    # @commands.has_permissions(administrator=True)
-    # @commands.guild_only()
-    # async def ban_word(self, ctx, word):
-    #     """Add a word to a ban-list, if said the message will be automatically deleted."""
-    #     guild_id = ctx.guild.id
-    #     author_id = ctx.author.id
-    #     word = word.lower()
-    #     add_word = add_banned_word(guild_id, word, author_id)
-    #     if add_word:
-    #         await ctx.send(success_embed(f"Added ||{word}|| to banned words!"))
-    #     else:
-    #         await ctx.send(error_embed(f"Failed to add ||{word}|| to banned words!"))
-    #
-    # @commands.command()
-    # @commands.has_permissions(administrator=True)
-    # @commands.guild_only()
-    # async def unban_word(self, ctx, word):
-    #     """Removes a word from the ban-list of this server."""
-    #     guild_id = ctx.guild.id
-    #     word = word.lower()
-    #     add_word = add_banned_word(guild_id, word)
-    #     if add_word:
-    #         await ctx.send(success_embed(f"Added ||{word}|| to banned words!"))
-    #     else:
-    #         await ctx.send(error_embed(f"Failed to add ||{word}|| to banned words!"))
+
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    @commands.guild_only()
+    async def ban_word(self, ctx, *, word):
+        """Add a word or phrase to a ban-list, if said the message will be automatically deleted."""
+        guild_id = ctx.guild.id
+        word = normalise_banned_word(word)
+        if not word:
+            await ctx.send(embed=error_embed("No word provided!"))
+            return
+        add_word = await add_banned_word(guild_id, word)
+        if add_word:
+            await ctx.send(embed=success_embed(f"Added ||{word}|| to banned words!"))
+        else:
+            await ctx.send(embed=error_embed(f"Failed to add ||{word}|| to banned words!"))
+
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    @commands.guild_only()
+    async def unban_word(self, ctx, *, word):
+        """Removes a word or phrase from the ban-list of this server."""
+        guild_id = ctx.guild.id
+        word = normalise_banned_word(word)
+        removed = await remove_banned_word(guild_id, word)
+        if removed:
+            await ctx.send(embed=success_embed(f"Removed ||{word}|| from banned words!"))
+        else:
+            await ctx.send(embed=error_embed(f"||{word}|| is not a banned word in this server!"))
 
     @commands.command()
     @commands.has_permissions(kick_members=True)
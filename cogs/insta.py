@@ -7,7 +7,6 @@ import asyncio
 from bot import executor
 from pathlib import Path
 
-import pyshorteners
 from cogs.gfycats import PfyClient
 
 import discord
@@ -16,9 +15,9 @@ from discord.utils import escape_markdown
 from instagram_private_api import Client, ClientLoginRequiredError, ClientCookieExpiredError, \
     ClientChallengeRequiredError
 from discord.ext import commands
-from data import apis_dict, insta_settings_file, get_insta_users_to_check, get_channels_following_insta_user, \
+from data import apis_dict, insta_settings_file, get_insta_users_to_check, get_subscribed_channels, \
     get_all_instas_followed_in_guild, follow_insta_user_db, unfollow_insta_user_db, add_insta_user_to_db, \
-    add_channel, set_min_timestamp, get_min_timestamp
+    add_channel, set_min_timestamp, get_min_timestamp, set_handles, get_stale_handles
 
 # https://github.com/ping/instagram_private_api/blob/master/examples/savesettings_logincallback.py
 from embeds import error_embed, success_embed
@@ -33,24 +32,16 @@ def handle_upload_finish(future: concurrent.futures.Future, disclient: discord.C
 
 
 async def finish_upload(embed, channels, disclient, url_to_path_pairs):
-    for channel in channels:
-        chan = disclient.get_channel(channel)
-        await chan.send(embed=embed)
-        links = url_to_path_pairs  # list of urls
-        # i = 0
-        # while i < (len(links)):
-        #     await chan.send('\n'.join(link for link, _ in links[i:i+4]))
-        #     i += 4
-        for link, _ in links:
-            await chan.send(link)
+    disclient.dispatcher.fan_out(channels, embed=embed)
+    # queued one after another, the dispatcher joins the links into as few messages as fit
+    for link, _ in url_to_path_pairs:
+        disclient.dispatcher.fan_out(channels, link)
     for p in [path for _, path in url_to_path_pairs if path]:
         os.remove(p)
 
 
 async def handle_message_one_image(message, disclient, channels):
-    embed = message
-    for channel in channels:
-        await disclient.get_channel(channel).send(embed=embed)
+    disclient.dispatcher.fan_out(channels, embed=message)
 
 
 def handle_carousel(embed, filename_or_links, gfy, disclient, channels):
@@ -144,11 +135,11 @@ class InstaClient:
         return user_name
 
     async def get_user_feed(self, user_id):
-        min_timestamp = get_min_timestamp(user_id)
+        min_timestamp = await get_min_timestamp(user_id)
         # grab all results that are posted after the minimum timestamp
         result_list = self.api.user_feed(user_id, min_timestamp=min_timestamp)
         if result_list and result_list['items']:
-            set_min_timestamp(user_id, result_list['items'][0]['taken_at'])
+            await set_min_timestamp(user_id, result_list['items'][0]['taken_at'])
             return result_list['items']
         return []
 
@@ -205,6 +196,25 @@ class Instagram(commands.Cog):
         self.disclient = disclient
         self.insta = InstaClient(self.disclient, api_key, api_sec)
         self.disclient.loop.create_task(self.check_for_new_posts())
+        self.handles_task = self.disclient.loop.create_task(self.refresh_handles())
+
+    def cog_unload(self):
+        self.handles_task.cancel()
+
+    async def refresh_handles(self):
+        """Looks up the user names .instas lists again once they are older than handle_ttl_hours."""
+        await self.disclient.wait_until_ready()
+        while not self.disclient.is_closed():
+            try:
+                stale = await get_stale_handles("instagram", apis_dict.get("handle_ttl_hours", 24))
+                for user_id in stale:
+                    # instagram has no batch lookup, so one user at a time and slowly
+                    name = await self.disclient.loop.run_in_executor(None, self.insta.get_user_name, user_id)
+                    await set_handles("instagram", {user_id: name})
+                    await asyncio.sleep(5)
+            except Exception as e:
+                print(f"Could not refresh instagram user names: {e}")
+            await asyncio.sleep(3600)
 
     async def check_for_new_posts(self):
         await self.disclient.wait_until_ready()
@@ -212,11 +222,11 @@ class Instagram(commands.Cog):
             try:
                 print('checking instagram for posts!')
                 # TODO rewrite get_insta_users_to_check SQL to only grab followed with join on instagram_channels
-                insta_users = get_insta_users_to_check()
+                insta_users = await get_insta_users_to_check()
                 if not insta_users:
                     continue
                 for user in insta_users:
-                    following_user = get_channels_following_insta_user(user)
+                    following_user = get_subscribed_channels("instagram", user)
                     if not following_user:
                         continue
                     try:
@@ -254,11 +264,12 @@ class Instagram(commands.Cog):
             await ctx.send(embed=error_embed(f'No instagram user found called {escape_markdown(user_name)}!'))
             return
 
-        add_insta_user_to_db(user_id)
-        add_channel(ctx.channel.id)
-        if not follow_insta_user_db(user_id, ctx.channel.id):
+        await add_insta_user_to_db(user_id)
+        await add_channel(ctx.channel.id, ctx.guild.id)
+        if not await follow_insta_user_db(user_id, ctx.channel.id):
             await ctx.send(embed=error_embed(f'{escape_markdown(user_name)} is already followed in this channel!'))
             return
+        await set_handles("instagram", {user_id: user['user']['username']})
 
         name = user['user']['full_name']
         link = f"https://www.instagram.com/{user['user']['username']}"
@@ -283,7 +294,7 @@ class Instagram(commands.Cog):
             await ctx.send(embed=error_embed(f'No instagram user found called {escape_markdown(user_name)}!'))
             return
 
-        if unfollow_insta_user_db(user_id, ctx.channel.id):
+        if await unfollow_insta_user_db(user_id, ctx.channel.id):
             await ctx.send(embed=success_embed(f'Unfollowed {escape_markdown(user_name)}!'))
         else:
             await ctx.send(embed=error_embed(f'Failed to unfollow {escape_markdown(user_name)}!'))
@@ -293,18 +304,15 @@ class Instagram(commands.Cog):
     async def instas(self, ctx):
         """Returns a list of all instagram users followed in this server!"""
         guild = ctx.guild
-        chans = get_all_instas_followed_in_guild()
+        chans = await get_all_instas_followed_in_guild(guild.id)
         chan_dict = {}
-        for pair in chans:
-            if pair[0] not in chan_dict:
-                chan_dict.update({pair[0]: [pair[-1]]})
-            else:
-                chan_dict[pair[0]].append(pair[-1])
+        for channel, insta_id, user_name in chans:
+            # a user name is only missing until the background refresh has looked it up
+            chan_dict.setdefault(channel, []).append(user_name or str(insta_id))
         msg = ''
         for channel in guild.channels:
             if channel.id in chan_dict:
                 for insta in chan_dict[channel.id]:
-                    insta = self.insta.get_user_name(insta)
                     spacing = 39 - len(channel.name + insta)
                     chan_str = f"`#{channel.name}{' ' * spacing}{insta}`\n"
                     msg = msg + chan_str
@@ -1,7 +1,7 @@
 import discord
 from discord.ext import commands
-from data import find_user, add_user, add_user_xp, get_idol_leaderboard, get_group_leaderboard
-from data import get_leaderboard
+from data import find_user, add_user_xp, get_idol_leaderboard, get_group_leaderboard, get_pending_xp
+from data import get_leaderboard, flush_user_xp_loop
 
 
 class Levels(commands.Cog):
@@ -12,6 +12,7 @@ class Levels(commands.Cog):
     def __init__(self, disclient):
         """Initialise client."""
         self.disclient = disclient
+        self.disclient.loop.create_task(flush_user_xp_loop())
 
     @commands.Cog.listener()
     async def on_message(self, message):
@@ -19,11 +20,7 @@ class Levels(commands.Cog):
             return
         if message.author.bot:
             return
-        author = str(message.author.id)
-        found = find_user(author)
-        if not found:
-            add_user(author)
-        add_user_xp(author)
+        add_user_xp(message.author.id)
         # add better leveling system in the future
 
     @commands.command(aliases=['xp'])
@@ -33,10 +30,11 @@ class Levels(commands.Cog):
             member = member
         else:
             member = ctx.author
-        user = find_user(member.id)
-        if user:
-            xp = user[1]
-            cont = user[2]
+        user = await find_user(member.id)
+        pending_xp = get_pending_xp(member.id)
+        if user or pending_xp:
+            xp = (user[1] if user else 0) + pending_xp
+            cont = user[2] if user else 0
             embed = discord.Embed(colour=member.colour, title="Level & XP")
             embed.set_author(name=member)
             embed.set_thumbnail(url=member.avatar_url)
@@ -59,7 +57,7 @@ class Levels(commands.Cog):
         if number_of_users > 20:
             number_of_users = 20
         async with ctx.channel.typing():
-            lb = get_leaderboard(number_of_users)
+            lb = await get_leaderboard(number_of_users)
             one_str = ""
             for i, pair in enumerate(lb, start=1):
                 if str(i).endswith('1') and i != 11:
@@ -88,7 +86,7 @@ class Levels(commands.Cog):
         if number_of_entries > 50:
             number_of_entries = 50
         async with ctx.channel.typing():
-            lb = get_idol_leaderboard(number_of_entries)
+            lb = await get_idol_leaderboard(number_of_entries)
             one_str = ""
             for i, triple in enumerate(lb, start=1):
                 if str(i).endswith('1') and i != 11:
@@ -116,7 +114,7 @@ class Levels(commands.Cog):
         if number_of_entries > 50:
             number_of_entries = 50
         async with ctx.channel.typing():
-            lb = get_group_leaderboard(number_of_entries)
+            lb = await get_group_leaderboard(number_of_entries)
             one_str = ""
             for i, pair in enumerate(lb, start=1):
                 if str(i).endswith('1') and i != 11:
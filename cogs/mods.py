@@ -25,7 +25,7 @@ def is_owner():
 
 def is_mod():
     async def check_mod(ctx):
-        x = check_user_is_mod(ctx)
+        x = await check_user_is_mod(ctx)
         return True if x else False
     return commands.check(check_mod)
 
@@ -41,7 +41,7 @@ class Owner(commands.Cog):
     @is_owner()
     async def merge_user_contribution(self, ctx, member1: discord.Member, member2: discord.Member):
         """Add contribution from first arguement to second argument"""
-        add_cont_from_one_user_to_other(member1.id, member2.id)
+        await add_cont_from_one_user_to_other(member1.id, member2.id)
         ctx.send(embed=success_embed('Merged user contribution'))
 
     @commands.command(name='forcedelete', aliases=['forcedel', 'fdel'])
@@ -49,7 +49,7 @@ class Owner(commands.Cog):
     async def force_delete_link(self, ctx, *links):
         delcounter = 0
         for link in links:
-            removed = delete_link_from_database(link)
+            removed = await delete_link_from_database(link)
             if removed:
                 delcounter += 1
             else:
@@ -61,7 +61,7 @@ class Owner(commands.Cog):
     @is_owner()
     async def remove_moderator(self, ctx, member: discord.Member):
         """Add user to moderator list."""
-        removed = remove_moderator(member.id)
+        removed = await remove_moderator(member.id)
         if removed:
             await ctx.send(embed=success_embed(f'{member} is no longer a moderator!'))
         else:
@@ -71,7 +71,7 @@ class Owner(commands.Cog):
     @is_owner()
     async def add_moderator(self, ctx, member: discord.Member):
         """Add user to moderator list."""
-        added = add_moderator(member.id)
+        added = await add_moderator(member.id)
         if added:
             await ctx.send(embed=success_embed(f'{member} is now a moderator!'))
         else:
@@ -155,7 +155,7 @@ class Owner(commands.Cog):
     @is_owner()
     async def perma_user(self, ctx, user_id):
         """Stops user from added anything to the bot"""
-        perma = perma_user_db(user_id)
+        perma = await perma_user_db(user_id)
         if perma:
             await ctx.send(embed=success_embed("User successfully perma'd."))
         else:
@@ -165,7 +165,7 @@ class Owner(commands.Cog):
     @is_owner()
     async def remove_perma_user(self, ctx, user_id):
         """Removes user from perma ban"""
-        unperma = remove_perma_user_db(user_id)
+        unperma = await remove_perma_user_db(user_id)
         if unperma:
             await ctx.send(embed=success_embed("User un-perma'd."))
         else:
@@ -192,10 +192,10 @@ class Moderation(commands.Cog):
             added = []
             for group in group_list:
                 groupstr = str(group).lower()
-                success = add_group(groupstr, ctx.author.id)
+                success = await add_group(groupstr, ctx.author.id)
                 if success:
                     added.append(groupstr)
-                    add_group_alias_db(groupstr, groupstr, ctx.author.id)
+                    await add_group_alias_db(groupstr, groupstr, ctx.author.id)
                 else:
                     already_exists.append(groupstr)
             if already_exists and added:
@@ -226,7 +226,7 @@ class Moderation(commands.Cog):
         invalid_aliases = []
         for alias in aliases:
             alias = alias.lower()
-            added = add_group_alias_db(group, alias, ctx.author.id)
+            added = await add_group_alias_db(group, alias, ctx.author.id)
             if added:
                 added_aliases.append(alias)
             else:
@@ -258,7 +258,7 @@ class Moderation(commands.Cog):
         invalid_aliases = []
         for alias in aliases:
             alias = alias.lower()
-            removed = remove_group_alias_db(group, alias)
+            removed = await remove_group_alias_db(group, alias)
             if removed:
                 removed_aliases.append(alias)
             else:
@@ -292,7 +292,7 @@ class Moderation(commands.Cog):
             await ctx.send(embed=error_embed('No idols provided!'))
         else:
             # rework lists to strings once working
-            members = get_members_of_group(group)
+            members = await get_members_of_group(group)
             members = [x[0] for x in members]
             members = set(members)
             args = set(args)
@@ -301,8 +301,8 @@ class Moderation(commands.Cog):
             added = []
             for idol in idol_list:
                 idol = str(idol).lower()
-                add_member(group, idol, ctx.author.id)
-                add_member_alias_db(group, idol, idol, ctx.author.id)
+                await add_member(group, idol, ctx.author.id)
+                await add_member_alias_db(group, idol, idol, ctx.author.id)
                 added.append(idol)
             if already_exists and added:
                 exists = ', '.join(already_exists)
@@ -333,7 +333,7 @@ class Moderation(commands.Cog):
         invalid_aliases = []
         for alias in aliases:
             alias = alias.lower()
-            added = add_member_alias_db(group, idol, alias, ctx.author.id)
+            added = await add_member_alias_db(group, idol, alias, ctx.author.id)
             if added:
                 added_aliases.append(alias)
             else:
@@ -367,7 +367,7 @@ class Moderation(commands.Cog):
         invalid_aliases = []
         for alias in aliases:
             alias = alias.lower()
-            removed = remove_member_alias_db(group, idol, alias)
+            removed = await remove_member_alias_db(group, idol, alias)
             if removed:
                 removed_aliases.append(alias)
             else:
@@ -402,7 +402,7 @@ class Moderation(commands.Cog):
         not_there = []
         for tag in tags_list:
             tag = tag.lower()
-            remove = remove_tag_from_link(link, tag)
+            remove = await remove_tag_from_link(link, tag)
             if remove:
                 removed.append(tag)
             else:
@@ -426,14 +426,14 @@ class Moderation(commands.Cog):
     @is_mod()
     async def create_tag(self, ctx, tag):
         """Adds a new tag, which will be available for use."""
-        if not check_user_is_mod(ctx):
+        if not await check_user_is_mod(ctx):
             await ctx.send(embed=permission_denied_embed())
             return
 
         tag = tag.lower()
-        added = add_tag(tag, ctx.author.id)
-        add_tag_alias_db(tag, tag, ctx.author.id)
+        added = await add_tag(tag, ctx.author.id)
         if added:
+            await add_tag_alias_db(tag, tag, ctx.author.id)
             act = f'Added tag: {tag}!'
             await moderation_auditing(self.disclient, ctx.author, act)
             await ctx.send(embed=success_embed(act))
@@ -446,7 +446,7 @@ class Moderation(commands.Cog):
         """Completely deletes a tag.
         All links with this tag, will no longer have this tag."""
         tag = tag.lower()
-        removed = remove_tag(tag)
+        removed = await remove_tag(tag)
         if removed:
             act = f'Deleted tag: {tag}!'
             await moderation_auditing(self.disclient, ctx.author, act)
@@ -467,7 +467,7 @@ class Moderation(commands.Cog):
         invalid_aliases = []
         for alias in aliases:
             alias = alias.lower()
-            added = add_tag_alias_db(tag, alias, ctx.author.id)
+            added = await add_tag_alias_db(tag, alias, ctx.author.id)
             if added:
                 added_aliases.append(alias)
             else:
@@ -500,7 +500,7 @@ class Moderation(commands.Cog):
         invalid_aliases = []
         for alias in aliases:
             alias = alias.lower()
-            removed = remove_tag_alias_db(tag, alias)
+            removed = await remove_tag_alias_db(tag, alias)
             if removed:
                 removed_aliases.append(alias)
             else:
@@ -538,7 +538,7 @@ class Moderation(commands.Cog):
         for link in link_list:
             if '-' in link:
                 link = link.split('-')[0]
-            removed = remove_link(group, idol, link)
+            removed = await remove_link(group, idol, link)
             if removed:
                 success.append(link)
             else:
@@ -566,7 +566,7 @@ class Moderation(commands.Cog):
         Example: .delete_group <group>
         """
         group = group.lower()
-        removed = remove_group(group)
+        removed = await remove_group(group)
         if removed:
             act = f"Deleted group: {group}"
             await moderation_auditing(self.disclient, ctx.author, act)
@@ -590,7 +590,7 @@ class Moderation(commands.Cog):
         if not args:
             await ctx.send(embed=error_embed('No idols provided!'))
         else:
-            members = get_members_of_group(group)
+            members = await get_members_of_group(group)
             members = [x[0] for x in members]
             members = set(members)
             args = set(args)
@@ -599,7 +599,7 @@ class Moderation(commands.Cog):
             success = []
             for idol in idol_list:
                 idol = idol.lower()
-                a = remove_member(g_id[0], idol)
+                a = await remove_member(g_id[0], idol)
                 if a:
                     success.append(idol)
             if success and failed:
@@ -623,12 +623,12 @@ class Moderation(commands.Cog):
         """Adds auditing from this channel, as links are added to
         the bot, they will also be posted here so all new additions
         can be viewed."""
-        if not check_user_is_mod(ctx):
+        if not await check_user_is_mod(ctx):
             await ctx.send(embed=permission_denied_embed())
             return
 
-        add_channel(ctx.channel.id)
-        added = add_auditing_channel(ctx.channel.id)
+        await add_channel(ctx.channel.id, ctx.guild.id if ctx.guild else None)
+        added = await add_auditing_channel(ctx.channel.id)
         if added:
             des = 'Added this channel to the auditing list!'
             await ctx.send(embed=success_embed(des))
@@ -640,7 +640,7 @@ class Moderation(commands.Cog):
     @is_mod()
     async def remove_auditing(self, ctx):
         """Removes auditing from this channel!"""
-        removed = remove_auditing_channel(ctx.channel.id)
+        removed = await remove_auditing_channel(ctx.channel.id)
         if removed:
             des = 'Removed this channel from the auditing list!'
             await ctx.send(embed=success_embed(des))
@@ -650,10 +650,12 @@ class Moderation(commands.Cog):
 
     @commands.command(aliases=['delcommand', 'dc'])
     @is_mod()
-    async def delete_command(self, ctx, command):
-        """Removes a custom command created previously."""
+    async def delete_command(self, ctx, command, scope=None):
+        """Removes a custom command created previously.
+        Server commands are removed with: .delcommand <name> server"""
         command = command.lower()
-        removed = remove_command(command)
+        guild_id = ctx.guild.id if scope == 'server' and ctx.guild else 0
+        removed = await remove_command(command, guild_id)
         if removed:
             act = f"Removed command: {command}"
             await moderation_auditing(self.disclient, ctx.author, act)
@@ -664,12 +666,11 @@ class Moderation(commands.Cog):
 
 async def moderation_auditing(disclient, author, action):
     """Posts moderator actions to the mod auditing channel in the discord."""
-    mod_audcha = disclient.get_channel(apis_dict["mod_audit_channel"])
     dt = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     s = f'`{dt}`: `{author}`:\n{action}'
     embed = discord.Embed(title=s,
                           color=discord.Color.blurple())
-    await mod_audcha.send(embed=embed)
+    disclient.dispatcher.send(apis_dict["mod_audit_channel"], embed=embed)
 
 
 def setup(disclient):
@@ -2,18 +2,43 @@ import discord
 import asyncpraw
 from discord.ext import commands
 import asyncio
-from data import get_all_subreddits, get_channels_with_sub, remove_channel_from_subreddit, add_reddit_channel, \
-    add_reddit, get_subreddit_id, find_channel, add_channel, get_all_reddit_channels_and_sub, cache_dict
+import time
+from collections import namedtuple
+from data import remove_channel_from_subreddit, add_reddit_channel, \
+    add_reddit, get_subreddit_id, add_channel, get_subscriptions, state_store, get_all_reddits_followed_in_guild
 from data import apis_dict
 from embeds import success_embed, error_embed
 
 
-def get_and_format_subs_list():
-    return [x[0] for x in get_all_subreddits()]
+# ids of the latest posts remembered per subreddit, a few times what one poll can return
+seen_posts_kept = 50
+image_extensions = (".JPG", ".jpg", ".JPEG", ".jpeg", ".PNG", ".png")
+gif_links = (
+    "https://gfycat.com/",
+    "https://www.redgifs.com/",
+    "https://www.gifdeliverynetwork.com/"
+)
 
+# what is sent for a submission, rendered once and shared by every channel following the subreddit
+RedditPost = namedtuple("RedditPost", ["embed", "content"])
 
-def get_and_format_channels_with_sub(sub_name):
-    return [x[0] for x in get_channels_with_sub(sub_name)]
+
+def render_submission(subs, subm):
+    """Returns the RedditPost of a submission, its embed must not be changed after this."""
+    url = "" if "/r/" in subm.url else subm.url
+    permalink = f"https://reddit.com{subm.permalink}"
+    embed = discord.Embed(title=subm.title,
+                          description=f"Posted by {subm.author} in **/r/{subs}**",
+                          color=discord.Color.blurple())
+    if url and (url.endswith(image_extensions) or "gallery" in url):
+        embed.set_image(url=url)
+        embed.add_field(name="Post Permalink", value=f"{permalink} \n**{url}**")
+        return RedditPost(embed, None)
+    if url.startswith(gif_links):
+        embed.add_field(name="Post Permalink", value=f"{permalink} \n**{url}**")
+    else:
+        embed.add_field(name="Post Permalink", value=permalink)
+    return RedditPost(embed, url or None)
 
 
 def create_reddit_instance():
@@ -26,97 +51,69 @@ def create_reddit_instance():
 class Reddit(commands.Cog):
     """Get new posts from your favourite Subreddits!
     """
-    def __init__(self, disclient, recent_posts):
+    def __init__(self, disclient, seen_posts):
         """Initialise client."""
         self.disclient = disclient
-        self.recent_posts = recent_posts
-        self.disclient.loop.create_task(self.post_new())
+        self.seen_posts = seen_posts  # subreddit -> ids of its latest posts, oldest first
+        self.reddit = None
+        self.poll_interval = apis_dict.get("reddit_poll_interval", 600)
+        self.semaphore = asyncio.Semaphore(apis_dict.get("reddit_concurrency", 8))
+        # subreddit -> seconds between a post being submitted and the last cycle finding it
+        self.lag = {}
+        self.task = self.disclient.loop.create_task(self.post_new())
+
+    def cog_unload(self):
+        self.task.cancel()
+        if self.reddit is not None:
+            self.disclient.loop.create_task(self.reddit.close())
 
     async def post_new(self):
         await self.disclient.wait_until_ready()
+        # one client for the life of the cog, so its session and token are reused between cycles
+        self.reddit = create_reddit_instance()
         while not self.disclient.is_closed():
-            reddit = create_reddit_instance()
-            subs_list = get_and_format_subs_list()
-            for subs in subs_list:
-                channels_with_reddit = get_and_format_channels_with_sub(subs)
-                if not channels_with_reddit:
-                    continue
-                # do as much processing before reddit call
-                sub = await reddit.subreddit(subs)
-                async for subm in sub.new(limit=5):
-                    titl = subm.title
-                    if "/r/" in subm.url:
-                        url = ""
-                    else:
-                        url = subm.url
-                    auth = subm.author
-                    perm = subm.permalink
-                    fts = (".JPG", ".jpg", ".JPEG",
-                           ".jpeg", ".PNG", ".png")
-                    gifs = (
-                        "https://gfycat.com/",
-                        "https://www.redgifs.com/",
-                        "https://www.gifdeliverynetwork.com/"
-                    )
-                    for channels in channels_with_reddit:
-                        if subs not in self.recent_posts:
-                            self.recent_posts.update({subs: {}})
-                        if str(channels) not in self.recent_posts[subs]:
-                            self.recent_posts[subs].update({str(channels): []})
-                        channel = self.disclient.get_channel(int(channels))
-                        channels = str(channels)
-                        if perm not in self.recent_posts[subs][channels]:
-                            self.recent_posts[subs][channels].append(perm)
-                            soy = "https://reddit.com"
-                            if len(self.recent_posts[subs][channels]) > 10:
-                                self.recent_posts[subs][channels].pop(0)
-                            #  Embeds from this point
-                            desc = f"Posted by {auth} in **/r/{subs}**"
-                            clr = discord.Color.blurple()
-                            embed = discord.Embed(title=titl,
-                                                  description=desc,
-                                                  color=clr)
-                            if url:
-                                val = f"{soy}{perm} \n**{url}**"
-                                if url.endswith(fts) or "gallery" in url:
-                                    embed.set_image(url=url)
-                                    embed.add_field(name="Post Permalink",
-                                                    value=val)
-                                    try:
-                                        await channel.send(embed=embed)
-                                    except AttributeError:
-                                        self.recent_posts[subs].pop(channels)
-                                        print("Channel deleted")
-                                elif url.startswith(gifs):
-                                    embed.add_field(name="Post Permalink",
-                                                    value=val)
-                                    try:
-                                        await channel.send(embed=embed)
-                                        await channel.send(url)
-                                    except AttributeError:
-                                        self.recent_posts[subs].pop(channels)
-                                        print("Channel deleted")
-                                else:
-                                    val = f"{soy}{perm}"
-                                    embed.add_field(name="Post Permalink",
-                                                    value=val)
-                                    try:
-                                        await channel.send(embed=embed)
-                                        await channel.send(url)
-                                    except AttributeError:
-                                        self.recent_posts[subs].pop(channels)
-                                        print("Channel deleted")
-                            else:
-                                val = f"{soy}{perm}"
-                                embed.add_field(name="Post Permalink",
-                                                value=val)
-                                try:
-                                    await channel.send(embed=embed)
-                                except AttributeError:
-                                    self.recent_posts[subs].pop(channels)
-                                    print(f"Channel deleted")
-            await reddit.close()
-            await asyncio.sleep(600)
+            started = time.monotonic()
+            subscriptions = get_subscriptions("reddit")
+            self.lag = {}
+            results = await asyncio.gather(*[self.poll_subreddit(subs, channels)
+                                             for subs, channels in subscriptions.items()], return_exceptions=True)
+            new_posts = 0
+            for subs, result in zip(subscriptions, results):
+                if isinstance(result, Exception):
+                    print(f"Could not post new posts of /r/{subs}: {result}")
+                else:
+                    new_posts += result
+            duration = time.monotonic() - started
+            msg = f"Polled {len(subscriptions)} subreddits in {duration:.1f}s, {new_posts} new posts"
+            if self.lag:
+                slowest = max(self.lag, key=self.lag.get)
+                msg += f", most behind /r/{slowest} by {self.lag[slowest]:.0f}s"
+            print(msg)
+            await asyncio.sleep(max(self.poll_interval - duration, 0))
+
+    async def poll_subreddit(self, subs, channels_with_reddit):
+        """Sends the new posts of a subreddit to the channels following it, returns how many posts were new."""
+        async with self.semaphore:
+            try:
+                sub = await self.reddit.subreddit(subs)
+                submissions = [subm async for subm in sub.new(limit=5)]
+            except Exception as e:
+                print(f"Could not get new posts of /r/{subs}: {e}")
+                return 0
+        seen = self.seen_posts.get(subs, [])
+        seen_ids = set(seen)
+        # oldest first, so channels get them in the order they were posted
+        new_submissions = [subm for subm in reversed(submissions) if subm.id not in seen_ids]
+        if not new_submissions:
+            return 0
+        self.seen_posts[subs] = (seen + [subm.id for subm in new_submissions])[-seen_posts_kept:]
+        self.lag[subs] = max(time.time() - subm.created_utc for subm in new_submissions)
+        for subm in new_submissions:
+            post = render_submission(subs, subm)
+            self.disclient.dispatcher.fan_out(channels_with_reddit, embed=post.embed)
+            if post.content:
+                self.disclient.dispatcher.fan_out(channels_with_reddit, post.content)
+        return len(new_submissions)
 
     @commands.command()
     @commands.guild_only()
@@ -128,17 +125,12 @@ class Reddit(commands.Cog):
         subreddit = subreddit.lower()
         if '/r/' in subreddit:
             subreddit = subreddit.split('/r/')[-1]
-        subreddit_id = get_subreddit_id(subreddit)
+        subreddit_id = await get_subreddit_id(subreddit)
         if not subreddit_id:
             msg = f"{subreddit} is not found!"
             await ctx.send(embed=error_embed(msg))
             return
-        found = find_channel(channel)
-        if not found:
-            msg = f"{subreddit} is not found!"
-            await ctx.send(embed=error_embed(msg))
-            return
-        removed = remove_channel_from_subreddit(found[0], subreddit_id[0])
+        removed = await remove_channel_from_subreddit(channel, subreddit)
         if removed:
             msg = f"Unfollowed {subreddit} in this channel!"
             await ctx.send(embed=success_embed(msg))
@@ -158,13 +150,12 @@ class Reddit(commands.Cog):
         subreddit = subreddit.lower()
         if '/r/' in subreddit:
             subreddit = subreddit.split('/r/')[-1]
-        subreddit_id = get_subreddit_id(subreddit)
+        subreddit_id = await get_subreddit_id(subreddit)
         if not subreddit_id:
-            add_reddit(subreddit)
-            subreddit_id = get_subreddit_id(subreddit)
-        add_channel(channel)
-        found = find_channel(channel)
-        added = add_reddit_channel(found[0], subreddit_id[0])
+            await add_reddit(subreddit)
+            subreddit_id = await get_subreddit_id(subreddit)
+        await add_channel(channel, ctx.guild.id)
+        added = await add_reddit_channel(channel, subreddit)
         if added:
             msg = f"Added {subreddit} to this channel!"
             await ctx.send(embed=success_embed(msg))
@@ -177,7 +168,7 @@ class Reddit(commands.Cog):
     async def reddits(self, ctx):
         """Returns a list of followed subreddits in this server."""
         guild = ctx.guild
-        chans = get_all_reddit_channels_and_sub()
+        chans = await get_all_reddits_followed_in_guild(guild.id)
         chan_dict = {}
         for pair in chans:
             if pair[0] not in chan_dict:
@@ -204,11 +195,16 @@ class Reddit(commands.Cog):
 
 def setup(disclient):
     try:
-        recent_posts = cache_dict["reddit"]["recent_posts"]
-        if recent_posts.strip() == "":
-            print(f"Recent posts missing, skipping loading cog reddit")
-            return
-        disclient.add_cog(Reddit(disclient, recent_posts))
+        seen_posts = state_store.namespace("reddit_seen_posts")
+        # subreddit -> channel -> permalinks already posted there, kept before posts were tracked per subreddit
+        recent_posts = state_store.namespace("reddit_recent_posts", legacy=("reddit", "recent_posts"))
+        for subs, channels in recent_posts.items():
+            if subs not in seen_posts:
+                # permalinks look like /r/<sub>/comments/<id>/<title>/
+                ids = {perm.split("/")[4] for perms in channels.values() for perm in perms if perm.count("/") > 4}
+                seen_posts[subs] = sorted(ids)
+        recent_posts.clear()
+        disclient.add_cog(Reddit(disclient, seen_posts))
     except Exception as e:
         print(f"reddit cog could not be loaded")
         print(e)
\ No newline at end of file
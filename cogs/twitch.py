@@ -1,14 +1,14 @@
 import datetime
 
-from twitchAPI.twitch import Twitch as Twitchy
-from data import apis_dict, get_all_twitch_channels_to_check, get_channels_following_twitch_stream, \
-    update_twitch_last_live, follow_twitch_channel_db, unfollow_twitch_channel_db, add_twitch_channel_to_db, \
-    add_channel, get_all_twitch_followed_in_guild
+from data import apis_dict, get_all_twitch_channels_to_check, get_subscribed_channels, \
+    update_twitch_last_lives, follow_twitch_channel_db, unfollow_twitch_channel_db, add_twitch_channel_to_db, \
+    add_channel, get_all_twitch_followed_in_guild, set_handles, get_stale_handles
 import asyncio
 from discord.ext import commands
 import discord
 
 from embeds import success_embed, error_embed
+from twitch_api import TwitchClient
 
 
 class Twitch(commands.Cog):
@@ -16,59 +16,66 @@ class Twitch(commands.Cog):
     """
     def __init__(self, disclient, twitch_id, twitch_sec):
         self.disclient = disclient
-        self.disclient.loop.create_task(self.get_online_streams())
-        self.twitch = Twitchy(twitch_id, twitch_sec,)
-        self.twitch.authenticate_app([])
-        self.time_format = '%Y-%m-%d %H:%M:%S'
+        self.twitch = TwitchClient(twitch_id, twitch_sec)
+        self.task = self.disclient.loop.create_task(self.get_online_streams())
+        self.handles_task = self.disclient.loop.create_task(self.refresh_handles())
+
+    def cog_unload(self):
+        self.task.cancel()
+        self.handles_task.cancel()
+        self.disclient.loop.create_task(self.twitch.close())
+
+    async def refresh_handles(self):
+        """Looks up the logins .twitches lists again once they are older than handle_ttl_hours."""
+        await self.disclient.wait_until_ready()
+        while not self.disclient.is_closed():
+            try:
+                stale = await get_stale_handles("twitch", apis_dict.get("handle_ttl_hours", 24))
+                users = await self.twitch.get_users(user_ids=stale)
+                await set_handles("twitch", {int(user['id']): user['login'] for user in users})
+            except Exception as e:
+                print(f"Could not refresh twitch logins: {e}")
+            await asyncio.sleep(3600)
 
     async def get_online_streams(self):
         await self.disclient.wait_until_ready()
         print('Looking for live Twitch streams!')
         while not self.disclient.is_closed():
             try:
-                # print("checking twitch")
-                check = get_all_twitch_channels_to_check(3)
+                check = await get_all_twitch_channels_to_check(3)
                 if not check:
                     await asyncio.sleep(60)
                     continue
-                if len(check) > 100:
-                    # need to split list into lengths of 100 in future
-                    # get_streams only takes 100 inputs at a time
-                    check = check[:99]
-                ids = [str(x) for x in check.keys()]
-                b = self.twitch.get_streams(user_id=ids)
-                for stream in b["data"]:
-                    c = self.twitch.get_users(user_ids=stream["user_id"])
-                    linkend = c['data'][0]['login']
-                    link = f"https://www.twitch.tv/{linkend}"
-                    username = stream['user_name']
-                    desc = stream['title']
-                    msg = f"`{username}` is live! {link}"
+                streams = await self.twitch.get_streams([str(x) for x in check.keys()])
+                # only streams that went live since they were last seen
+                started = {}
+                for stream in streams:
+                    started_at = datetime.datetime.strptime(stream['started_at'], '%Y-%m-%dT%H:%M:%SZ')
+                    if check[int(stream['user_id'])] != started_at:
+                        started[int(stream['user_id'])] = started_at
+                streams = [x for x in streams if int(x['user_id']) in started]
+                if not streams:
+                    await asyncio.sleep(60)
+                    continue
+                await update_twitch_last_lives(started)
+                users = await self.twitch.get_users(user_ids=[x['user_id'] for x in streams])
+                logins = {user['id']: user['login'] for user in users}
+                for stream in streams:
+                    channels = get_subscribed_channels("twitch", stream['user_id'])
+                    if not channels:
+                        continue
+                    link = f"https://www.twitch.tv/{logins.get(stream['user_id'], stream['user_name'].lower())}"
+                    msg = f"`{stream['user_name']}` is live! {link}"
                     image_url = f"""{stream['thumbnail_url'].format(
                                      width=852, height=480)}?{str(datetime.datetime.now().timestamp())}"""
                     embed = discord.Embed(title=msg,
-                                          description=desc,
+                                          description=stream['title'],
                                           color=discord.Color.purple())
                     embed.set_image(url=image_url)
                     embed.add_field(name='Playing',
                                     value=stream['game_name'])
-                    check_time = datetime.datetime.strptime(stream['started_at'], '%Y-%m-%dT%H:%M:%SZ')
-                    check_time.strftime(self.time_format)
-                    if check[int(stream['user_id'])] != check_time:
-                        update_twitch_last_live(stream['user_id'], check_time)
-                    else:
-                        continue
-                    channels = get_channels_following_twitch_stream(stream['user_id'])
-                    if not channels:
-                        await asyncio.sleep(60)
-                        continue
-                    for chan in channels:
-                        channel = self.disclient.get_channel(int(chan))
-                        # set ping roles up in the future
-                        # gid = channel.guild.id
-                        # rol = self.disclient.get_guild(gid).roles
-                        # tr = discord.utils.get(rol, name="twitch")
-                        await channel.send(embed=embed)  # content=tr.mention, for when roles are assigned
+                    # content=tr.mention, for when ping roles are assigned
+                    self.disclient.dispatcher.fan_out(channels, embed=embed)
             except Exception as e:
                 print(e)
             # delay 60 seconds before checking again
@@ -85,16 +92,16 @@ class Twitch(commands.Cog):
             stream = stream.split("/")[-1].lower()
         else:
             stream = stream.lower()
-        user = self.twitch.get_users(logins=stream)
-        print(user)
-        if not user:
+        users = await self.twitch.get_users(logins=[stream])
+        if not users:
             await ctx.send(embed=error_embed(f"Failed to find Twitch user {stream}!"))
             return
-        for d in user["data"]:
+        for d in users:
             ayed = str(d["id"])
-            add_channel(channel)
-            add_twitch_channel_to_db(ayed)
-            followed = follow_twitch_channel_db(channel, ayed)
+            await add_channel(channel, ctx.guild.id)
+            await add_twitch_channel_to_db(ayed)
+            followed = await follow_twitch_channel_db(channel, ayed)
+            await set_handles("twitch", {int(ayed): d['login']})
             if followed:
                 display_name = d['display_name']
                 profile_image = d['profile_image_url']
@@ -119,13 +126,13 @@ class Twitch(commands.Cog):
             stream = stream.split("/")[-1].lower()
         else:
             stream = stream.lower()
-        user = self.twitch.get_users(logins=stream)
-        if not user:
+        users = await self.twitch.get_users(logins=[stream])
+        if not users:
             await ctx.send(embed=error_embed(f"Failed to find Twitch user {stream}!"))
             return
-        for d in user["data"]:
+        for d in users:
             ayed = str(d["id"])
-            unfollowed = unfollow_twitch_channel_db(channel, ayed)
+            unfollowed = await unfollow_twitch_channel_db(channel, ayed)
             if unfollowed:
                 await ctx.send(embed=success_embed(f"Unfollowed {stream} in this channel!"))
             else:
@@ -136,20 +143,15 @@ class Twitch(commands.Cog):
     async def twitches(self, ctx):
         """Returns a list of all twitch users followed in this server!"""
         guild = ctx.guild
-        chans = get_all_twitch_followed_in_guild()
+        chans = await get_all_twitch_followed_in_guild(guild.id)
         chan_dict = {}
-        for pair in chans:
-            if pair[0] not in chan_dict:
-                chan_dict.update({pair[0]: [pair[-1]]})
-            else:
-                chan_dict[pair[0]].append(pair[-1])
+        for channel, twitch_id, login in chans:
+            # a login is only missing until the background refresh has looked it up
+            chan_dict.setdefault(channel, []).append(login or str(twitch_id))
         msg = ''
         for channel in guild.channels:
             if channel.id in chan_dict:
                 for twitch in chan_dict[channel.id]:
-                    twitch_str = str(twitch)
-                    twitch = self.twitch.get_users(user_ids=[twitch_str])
-                    twitch = twitch['data'][0]['login']
                     spacing = 39 - len(channel.name + twitch)
                     chan_str = f"`#{channel.name}{' ' * spacing}{twitch}`\n"
                     msg = msg + chan_str
@@ -1,12 +1,15 @@
+import asyncio
 import json
+import time
 import discord
 from discord.utils import escape_markdown
-import pyshorteners
 import tweepy
 from discord.ext import commands
 from data import apis_dict, get_twitter_users_from_db, add_twitter_channel_to_db, remove_twitter_user_from_db, \
-    add_twitter_to_db, add_channel, get_twitter_channels_following_user, get_all_twitter_channels_and_twitters
+    add_twitter_to_db, add_channel, get_subscribed_channels, get_all_twitters_followed_in_guild, \
+    set_handles, get_stale_handles, check_user_is_owner
 from embeds import error_embed, success_embed
+from canonical import canonicalise
 
 
 def authenticator():
@@ -16,31 +19,16 @@ def authenticator():
     return auth
 
 
-def get_users_to_stream():
+async def get_users_to_stream():
     """Returns all users to stream tweets from."""
-    users = get_twitter_users_from_db()
+    users = await get_twitter_users_from_db()
     return users
 
 
 def twitter_image_link_formatting(link):
     """Formats link of tweeted image to return highest quality image."""
-    if "twimg" in link:
-        split_link = link.split("/")
-        if "?" in split_link[-1]:
-            splitt = split_link[-1].split("?")
-            if "png" in splitt[-1]:
-                newending = splitt[0] + "?format=png&name=orig"
-            else:
-                newending = splitt[0] + "?format=jpg&name=orig"
-            link = "https://pbs.twimg.com/media/" + newending
-        elif "." in split_link[-1]:
-            splitt = split_link[-1].split(".")
-            if "png" in splitt[-1]:
-                newending = splitt[0] + "?format=png&name=orig"
-            else:
-                newending = splitt[0] + "?format=jpg&name=orig"
-            link = "https://pbs.twimg.com/media/" + newending
-    return link
+    canonical = canonicalise(link)
+    return canonical.url if canonical else link
 
 
 class TwitterClient:
@@ -52,20 +40,78 @@ class TwitterClient:
         user = self.client.get_user(user_name)
         return user
 
-    def get_twitter_user_name(self, twitter_id):
-        user = self.client.get_user(twitter_id)
-        name = user.screen_name
-        return name
+    def get_twitter_user_names(self, twitter_ids):
+        """Returns {twitter id: screen name} of the ids, looked up 100 at a time."""
+        names = {}
+        for i in range(0, len(twitter_ids), 100):
+            for user in self.client.lookup_users(user_ids=twitter_ids[i:i + 100]):
+                names[user.id] = user.screen_name
+        return names
+
+
+class TweetQueue:
+    """Hands raw tweets from tweepy's thread to a fixed number of consumers on the event loop.
+    At most maxsize tweets wait, any more are dropped and counted instead of piling up."""
+
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.maxsize = maxsize
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+        self.processed = 0
+        self.peak = 0  # the most tweets that have been waiting at once since the last stats
+        self.lag = 0  # the longest a tweet waited for a consumer since the last stats, in seconds
+
+    def put_threadsafe(self, raw_data):
+        """Queues a tweet, called from tweepy's thread."""
+        # qsize is only a guess from this thread, it saves scheduling tweets that would be dropped anyway
+        if self.queue.qsize() >= self.maxsize:
+            self.loop.call_soon_threadsafe(self._count_drop)
+        else:
+            self.loop.call_soon_threadsafe(self._put, raw_data, time.monotonic())
+
+    def _put(self, raw_data, received):
+        try:
+            self.queue.put_nowait((raw_data, received))
+        except asyncio.QueueFull:
+            self._count_drop()
+            return
+        self.peak = max(self.peak, self.queue.qsize())
+
+    def _count_drop(self):
+        self.dropped += 1
+        if self.dropped % 100 == 1:
+            print(f"Tweet queue is full, {self.dropped} tweets dropped so far")
+
+    def stats(self):
+        """Returns the tweets waiting now, the peak and longest wait since the last call, and the running totals."""
+        stats = {"depth": self.queue.qsize(), "peak": self.peak, "lag": self.lag,
+                 "dropped": self.dropped, "processed": self.processed}
+        self.peak = self.queue.qsize()
+        self.lag = 0
+        return stats
+
+    async def consume(self, handle):
+        """Awaits handle for every queued tweet, one at a time."""
+        while True:
+            raw_data, received = await self.queue.get()
+            self.lag = max(self.lag, time.monotonic() - received)
+            try:
+                await handle(raw_data)
+            except Exception as e:
+                print(f"Could not post a tweet: {e}")
+            self.processed += 1
 
 
 class MyStreamListener(tweepy.StreamListener):
-    def __init__(self, disclient):
+    def __init__(self, disclient, tweets):
         """Inherit and overwrite listener from Tweepy."""
         super().__init__()
         self.disclient = disclient
+        self.tweets = tweets
 
     def on_data(self, raw_data):
-        self.disclient.loop.create_task(self.disclient.get_cog('Twitter').format_new_tweet(raw_data))
+        self.tweets.put_threadsafe(raw_data)
 
     def on_event(self, status):
         print(f"event: {status}")
@@ -85,7 +131,7 @@ class MyStreamListener(tweepy.StreamListener):
 
     def on_disconnect(self, notice):
         print(notice)
-        Twitter.restart_stream(self.disclient)
+        asyncio.run_coroutine_threadsafe(self.disclient.get_cog('Twitter').restart_stream(), self.disclient.loop)
 
 
 class Twitter(commands.Cog):
@@ -95,13 +141,48 @@ class Twitter(commands.Cog):
         """Initialise client."""
         self.disclient = disclient
         self.client = TwitterClient()
-        self.current_stream = tweepy.Stream(authenticator(), MyStreamListener(self.disclient))
-        self.current_stream.filter(follow=get_users_to_stream(), is_async=True)
+        self.current_stream = None
+        self.tweets = TweetQueue(self.disclient.loop, apis_dict.get("tweet_queue_size", 1000))
+        self.consumers = [self.disclient.loop.create_task(self.tweets.consume(self.format_new_tweet))
+                          for _ in range(apis_dict.get("tweet_consumers", 4))]
+        self.disclient.loop.create_task(self.restart_stream())
+        self.handles_task = self.disclient.loop.create_task(self.refresh_handles())
+        self.stats_task = self.disclient.loop.create_task(self.report_queue())
+
+    def cog_unload(self):
+        self.handles_task.cancel()
+        self.stats_task.cancel()
+        for consumer in self.consumers:
+            consumer.cancel()
+        if self.current_stream is not None:
+            self.current_stream.disconnect()
+
+    async def refresh_handles(self):
+        """Looks up the screen names .twitters lists again once they are older than handle_ttl_hours."""
+        await self.disclient.wait_until_ready()
+        while not self.disclient.is_closed():
+            try:
+                stale = await get_stale_handles("twitter", apis_dict.get("handle_ttl_hours", 24))
+                if stale:
+                    names = await self.disclient.loop.run_in_executor(None, self.client.get_twitter_user_names, stale)
+                    await set_handles("twitter", names)
+            except Exception as e:
+                print(f"Could not refresh twitter screen names: {e}")
+            await asyncio.sleep(3600)
+
+    async def report_queue(self):
+        """Prints how the tweet queue is keeping up every tweet_stats_interval seconds."""
+        while True:
+            await asyncio.sleep(apis_dict.get("tweet_stats_interval", 600))
+            stats = self.tweets.stats()
+            print(f"Tweet queue: {stats['depth']} waiting, peak {stats['peak']}, longest wait {stats['lag']:.1f}s, "
+                  f"{stats['processed']} posted, {stats['dropped']} dropped")
 
-    def restart_stream(self):
-        """"""
-        self.current_stream = tweepy.Stream(authenticator(), MyStreamListener(self.disclient))
-        self.current_stream.filter(follow=get_users_to_stream(), is_async=True)
+    async def restart_stream(self):
+        """Starts a new stream following every user in the database."""
+        users = await get_users_to_stream()
+        self.current_stream = tweepy.Stream(authenticator(), MyStreamListener(self.disclient, self.tweets))
+        self.current_stream.filter(follow=users, is_async=True)
 
     @commands.command(name='follow_twitter', aliases=['followtwitter', 'twitterfollow'])
     @commands.guild_only()
@@ -112,14 +193,15 @@ class Twitter(commands.Cog):
         if 'twitter.com' in user_name:
             user_name = user_name.split('/')[-1]
         channel_id = ctx.channel.id
-        add_channel(channel_id)
+        await add_channel(channel_id, ctx.guild.id)
         user = self.client.get_twitter_user(user_name)
         if user:
-            add_twitter_to_db(user.id_str)
+            await add_twitter_to_db(user.id_str)
         else:
             await ctx.send(embed=error_embed(f'Twitter user `{escape_markdown(user_name)}` not found!'))
-        added = add_twitter_channel_to_db(channel_id, user.id_str)
+        added = await add_twitter_channel_to_db(channel_id, user.id_str)
         if added:
+            await set_handles("twitter", {user.id: user.screen_name})
             icon_url = user.profile_image_url
             display_name = user.name
             link = f'https://twitter.com/{user.screen_name}'
@@ -129,8 +211,8 @@ class Twitter(commands.Cog):
                                   color=discord.Color.blue())
             embed.set_thumbnail(url=icon_url)
             await ctx.send(embed=embed)
-            if user.id_str not in get_users_to_stream():
-                self.restart_stream()
+            if user.id_str not in await get_users_to_stream():
+                await self.restart_stream()
         else:
             await ctx.send(embed=error_embed(f'Failed to follow twitter user `{escape_markdown(user_name)}`!'))
 
@@ -147,7 +229,7 @@ class Twitter(commands.Cog):
         if not user.id_str:
             # TODO make better twitter embed with images of display pics etc
             await ctx.send(embed=error_embed(f'Twitter user `{escape_markdown(user_name)}` not found!'))
-        removed = remove_twitter_user_from_db(channel_id, user.id_str)
+        removed = await remove_twitter_user_from_db(channel_id, user.id_str)
         if removed:
             await ctx.send(embed=success_embed(f'Unfollowed twitter user `{escape_markdown(user_name)}`!'))
         else:
@@ -158,18 +240,15 @@ class Twitter(commands.Cog):
     async def twitters(self, ctx):
         """Returns a list of followed twitters in this server."""
         guild = ctx.guild
-        chans = get_all_twitter_channels_and_twitters()
+        chans = await get_all_twitters_followed_in_guild(guild.id)
         chan_dict = {}
-        for pair in chans:
-            if pair[0] not in chan_dict:
-                chan_dict.update({pair[0]: [pair[-1]]})
-            else:
-                chan_dict[pair[0]].append(pair[-1])
+        for channel, twitter_id, screen_name in chans:
+            # a screen name is only missing until the background refresh has looked it up
+            chan_dict.setdefault(channel, []).append(screen_name or str(twitter_id))
         msg = ''
         for channel in guild.channels:
             if channel.id in chan_dict:
                 for twitter in chan_dict[channel.id]:
-                    twitter = self.client.get_twitter_user_name(twitter)
                     spacing = 39 - len(channel.name + twitter)
                     chan_str = f"`#{channel.name}{' ' * spacing}{twitter}`\n"
                     msg = msg + chan_str
@@ -183,6 +262,20 @@ class Twitter(commands.Cog):
                                   color=discord.Color.blue())
             await ctx.send(embed=embed)
 
+    @commands.command(name='tweet_queue', aliases=['tweetqueue'])
+    @commands.check(check_user_is_owner)
+    async def tweet_queue(self, ctx):
+        """Shows how many tweets are waiting to be posted and how long they waited."""
+        # same counters as the periodic report, reading them here starts its window again
+        stats = self.tweets.stats()
+        embed = discord.Embed(title='Tweet Queue', color=discord.Color.blue())
+        embed.add_field(name='Waiting', value=f"{stats['depth']} / {self.tweets.maxsize}")
+        embed.add_field(name='Peak', value=str(stats['peak']))
+        embed.add_field(name='Longest Wait', value=f"{stats['lag']:.1f}s")
+        embed.add_field(name='Posted', value=str(stats['processed']))
+        embed.add_field(name='Dropped', value=str(stats['dropped']))
+        await ctx.send(embed=embed)
+
     async def format_new_tweet(self, raw_data):
         """Formats a tweet into a nice discord embed"""
         tweet_data = json.loads(raw_data)
@@ -199,11 +292,9 @@ class Twitter(commands.Cog):
         text = tweet_data["text"]
         if "extended_entities" in tweet_data:
             if len(tweet_data["extended_entities"]["media"]) > 1:
-                images = []
-                short = pyshorteners.Shortener()
-                for media in tweet_data["extended_entities"]["media"]:
-                    link = twitter_image_link_formatting(media["media_url_https"])
-                    images.append(short.tinyurl.short(link))
+                # the original quality twimg urls are short enough to send as they are, and discord embeds them
+                images = [twitter_image_link_formatting(media["media_url_https"])
+                          for media in tweet_data["extended_entities"]["media"]]
                 embed = discord.Embed(title=title,
                                       description=text,
                                       color=discord.Color.blue())
@@ -234,17 +325,15 @@ class Twitter(commands.Cog):
 
     async def send_new_tweet(self, tweet, twitter_id):
         """Sends tweet out to channels that are following that user"""
-        channels = get_twitter_channels_following_user(twitter_id)
-        for channel in channels:
-            channel = self.disclient.get_channel(int(channel))
-            if isinstance(tweet, tuple):
-                await channel.send(embed=tweet[0])
-                await channel.send('\n'.join(tweet[1]))
-            else:
-                if isinstance(tweet, str):
-                    await channel.send(tweet)
-                else:
-                    await channel.send(embed=tweet)
+        channels = get_subscribed_channels("twitter", twitter_id)
+        dispatcher = self.disclient.dispatcher
+        if isinstance(tweet, tuple):
+            dispatcher.fan_out(channels, embed=tweet[0])
+            dispatcher.fan_out(channels, '\n'.join(tweet[1]))
+        elif isinstance(tweet, str):
+            dispatcher.fan_out(channels, tweet)
+        else:
+            dispatcher.fan_out(channels, embed=tweet)
 
 
 def setup(disclient):
@@ -1,18 +1,22 @@
 import asyncio
 import json
-import mysql.connector as conn
-import mysql.connector.errors
+import aiomysql
 import threading
 import datetime
 import os
+import re
+import sys
+import random
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from setup import get_directories_path
+from canonical import canonicalise, media_type
+from state import StateStore
 
 with open(get_directories_path) as direc:
     direc_dict = json.load(direc)
 with open(direc_dict["apis"], 'r') as apis:
     apis_dict = json.load(apis)
-with open(direc_dict["cache_variables"]) as cache:
-    cache_dict = json.load(cache)
 with open(direc_dict["mods"], 'r') as mods:
     mods_dict = json.load(mods)
 
@@ -20,21 +24,13 @@ insta_settings_file = direc_dict["insta_file_path"]
 
 default_prefix = apis_dict["command_prefix"]
 
-
-async def write_cache():
-    x = 0
-    while True:
-        with open(direc_dict["cache_variables"], 'w') as cash:
-            json.dump(cache_dict, cash, indent=4)
-        x += 60
-        if x % 3600 == 0:
-            dt = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(f"Written cache variables for 1 hour at {dt}.")
-        await asyncio.sleep(20)
+# cogs keep what has to survive a restart in their own namespace, see state.py
+state_store = StateStore(direc_dict["cache_variables"], apis_dict.get("state_flush_interval", 5),
+                         apis_dict.get("state_compact_after", 10000))
 
 
-def check_user_is_mod(ctx):
-    return find_moderator(ctx.author.id)
+async def check_user_is_mod(ctx):
+    return await find_moderator(ctx.author.id)
 
 
 def check_user_is_owner(ctx):
@@ -47,14 +43,620 @@ def check_user_is_owner(ctx):
 database = apis_dict["database_name"]
 username = apis_dict["database_user"]
 password = apis_dict["database_password"]
-
-db = conn.connect(
-    host='localhost',
-    user=username,
-    passwd=password,
-    database=database,
-    buffered=True
-)
+pool_min_size = apis_dict.get("database_pool_min_size", 1)
+pool_max_size = apis_dict.get("database_pool_max_size", 10)
+
+pool = None
+
+
+async def create_db_pool():
+    """Opens the connection pool that every query is run through."""
+    global pool
+    if pool is None:
+        pool = await aiomysql.create_pool(
+            host='localhost',
+            user=username,
+            password=password,
+            db=database,
+            charset='utf8mb4',
+            autocommit=True,
+            minsize=pool_min_size,
+            maxsize=pool_max_size
+        )
+    return pool
+
+
+async def close_db_pool():
+    """Closes all pooled connections, waiting for queries in flight to finish."""
+    global pool
+    if pool is not None:
+        pool.close()
+        await pool.wait_closed()
+        pool = None
+
+
+@asynccontextmanager
+async def db_cursor():
+    """Yields a cursor on a pooled connection, the connection is released on exit."""
+    async with pool.acquire() as connection:
+        async with connection.cursor() as cursor:
+            yield cursor
+
+
+@asynccontextmanager
+async def db_transaction():
+    """Yields a cursor whose statements are committed together on exit, or rolled back if one raises."""
+    async with pool.acquire() as connection:
+        await connection.begin()
+        try:
+            async with connection.cursor() as cursor:
+                yield cursor
+        except BaseException:
+            await connection.rollback()
+            raise
+        await connection.commit()
+
+
+# --- ALIAS INDEX --- #
+
+
+class AliasIndex:
+    """In memory copy of the group, member and tag alias tables.
+    Aliases are matched case insensitively, like the database collation."""
+
+    def __init__(self):
+        self.groups = {}  # alias -> GroupId
+        self.group_names = {}  # GroupId -> RomanName
+        self.members = {}  # (GroupId, alias) -> MemberId
+        self.member_names = {}  # MemberId -> RomanName
+        self.member_groups = {}  # MemberId -> GroupId
+        self.tags = {}  # alias -> TagId
+        self.tag_names = {}  # TagId -> TagName
+
+    def group(self, alias):
+        """Returns (GroupId, RomanName) of the group with this alias."""
+        group_id = self.groups.get(alias.lower())
+        if group_id is None:
+            return None
+        return group_id, self.group_names[group_id]
+
+    def member(self, group_id, alias):
+        """Returns (MemberId, RomanName) of the member of the group with this alias."""
+        member_id = self.members.get((group_id, alias.lower()))
+        if member_id is None:
+            return None
+        return member_id, self.member_names[member_id]
+
+    def tag(self, alias):
+        """Returns (TagName, TagId) of the tag with this alias."""
+        tag_id = self.tags.get(alias.lower())
+        if tag_id is None:
+            return None
+        return self.tag_names[tag_id], tag_id
+
+    def add_group(self, group_id, name):
+        self.group_names[group_id] = name
+
+    def add_group_alias(self, group_id, alias):
+        if group_id in self.group_names:
+            self.groups[alias.lower()] = group_id
+
+    def remove_group_alias(self, alias):
+        self.groups.pop(alias.lower(), None)
+
+    def remove_group(self, group_id):
+        self.group_names.pop(group_id, None)
+        self.groups = {a: g for a, g in self.groups.items() if g != group_id}
+        for member_id in [m for m, g in self.member_groups.items() if g == group_id]:
+            self.remove_member(member_id)
+
+    def add_member(self, member_id, group_id, name):
+        self.member_names[member_id] = name
+        self.member_groups[member_id] = group_id
+
+    def add_member_alias(self, member_id, alias):
+        if member_id in self.member_groups:
+            self.members[(self.member_groups[member_id], alias.lower())] = member_id
+
+    def remove_member_alias(self, group_id, alias):
+        self.members.pop((group_id, alias.lower()), None)
+
+    def remove_member(self, member_id):
+        self.member_names.pop(member_id, None)
+        self.member_groups.pop(member_id, None)
+        self.members = {k: m for k, m in self.members.items() if m != member_id}
+
+    def add_tag(self, tag_id, name):
+        self.tag_names[tag_id] = name
+
+    def add_tag_alias(self, tag_id, alias):
+        if tag_id in self.tag_names:
+            self.tags[alias.lower()] = tag_id
+
+    def remove_tag_alias(self, alias):
+        self.tags.pop(alias.lower(), None)
+
+    def remove_tag(self, tag_id):
+        self.tag_names.pop(tag_id, None)
+        self.tags = {a: t for a, t in self.tags.items() if t != tag_id}
+
+
+alias_index = AliasIndex()
+
+
+async def load_alias_index():
+    """Reads every alias table into a new index and swaps it in."""
+    global alias_index
+    index = AliasIndex()
+    async with db_cursor() as cursor:
+        await cursor.execute("SELECT GroupId, RomanName FROM groupz")
+        for group_id, name in await cursor.fetchall():
+            index.add_group(group_id, name)
+        await cursor.execute("SELECT GroupId, Alias FROM groupz_aliases WHERE Alias IS NOT NULL")
+        for group_id, alias in await cursor.fetchall():
+            index.add_group_alias(group_id, alias)
+        await cursor.execute("SELECT MemberId, GroupId, RomanName FROM members")
+        for member_id, group_id, name in await cursor.fetchall():
+            index.add_member(member_id, group_id, name)
+        await cursor.execute("SELECT MemberId, Alias FROM member_aliases WHERE Alias IS NOT NULL")
+        for member_id, alias in await cursor.fetchall():
+            index.add_member_alias(member_id, alias)
+        await cursor.execute("SELECT TagId, TagName FROM tags")
+        for tag_id, name in await cursor.fetchall():
+            index.add_tag(tag_id, name)
+        await cursor.execute("SELECT TagId, Alias FROM tag_aliases WHERE Alias IS NOT NULL")
+        for tag_id, alias in await cursor.fetchall():
+            index.add_tag_alias(tag_id, alias)
+    alias_index = index
+    print(f"Loaded {len(index.groups)} group, {len(index.members)} member and {len(index.tags)} tag aliases.")
+
+
+async def load_caches():
+    """Warms every in memory index, run once the pool is open."""
+    await load_alias_index()
+    await load_custom_commands()
+    await load_link_indexes()
+    await load_subscriptions()
+
+
+# --- MEMBER LINK POOLS --- #
+
+
+class MemberLinkPool:
+    """Every link of one member, split by media type."""
+
+    __slots__ = ("links", "gfys", "images", "fancams", "size")
+
+    def __init__(self, links):
+        self.links = tuple(links)
+        media = [media_type(x) for x in self.links]
+        self.gfys = tuple(x for x, m in zip(self.links, media) if m == "gfy")
+        self.images = tuple(x for x, m in zip(self.links, media) if m == "image")
+        self.fancams = tuple(x for x, m in zip(self.links, media) if m == "fancam")
+        # the sub pools share the link strings, so only count them once
+        self.size = sum(sys.getsizeof(x) for x in self.links) + sys.getsizeof(self.links) \
+            + sys.getsizeof(self.gfys) + sys.getsizeof(self.images) + sys.getsizeof(self.fancams)
+
+
+class LinkPoolCache:
+    """Least recently used cache of member link pools, bounded by an estimate of their size in bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.pools = OrderedDict()  # MemberId -> MemberLinkPool
+        self.generation = 0
+
+    def get(self, member_id):
+        pool = self.pools.get(member_id)
+        if pool is not None:
+            self.pools.move_to_end(member_id)
+        return pool
+
+    def put(self, member_id, pool):
+        self.invalidate(member_id)
+        if pool.size > self.max_bytes:
+            return
+        self.pools[member_id] = pool
+        self.size += pool.size
+        while self.size > self.max_bytes:
+            _, evicted = self.pools.popitem(last=False)
+            self.size -= evicted.size
+
+    def invalidate(self, member_id):
+        self.generation += 1
+        pool = self.pools.pop(member_id, None)
+        if pool is not None:
+            self.size -= pool.size
+
+
+link_pool_cache = LinkPoolCache(apis_dict.get("link_cache_max_bytes", 32 * 1024 * 1024))
+
+
+async def get_member_link_pool(member_id):
+    """Returns the MemberLinkPool of a member, reading it from the database on a miss."""
+    pool = link_pool_cache.get(member_id)
+    if pool is not None:
+        return pool
+    generation = link_pool_cache.generation
+    pool = MemberLinkPool(x[0] for x in await get_member_links(member_id))
+    # a link was added or removed while reading, so the pool may already be stale
+    if generation == link_pool_cache.generation:
+        link_pool_cache.put(member_id, pool)
+    return pool
+
+
+def link_condition(link):
+    """Returns the condition and value that match the rows of links with this link,
+    by its dedup key when it is a link canonical.py knows."""
+    canonical = canonicalise(link)
+    if canonical is None:
+        return "links.Link = %s", link
+    return "links.LinkKey = %s", canonical.key
+
+
+async def find_link_members(cursor, link):
+    """Returns {LinkId: [MemberId]} for every row of links with this link."""
+    condition, value = link_condition(link)
+    await cursor.execute("""SELECT links.LinkId, MemberId FROM links
+                            LEFT JOIN link_members ON link_members.LinkId = links.LinkId
+                            WHERE """ + condition, (value,))
+    link_members = {}
+    for link_id, member_id in await cursor.fetchall():
+        member_ids = link_members.setdefault(link_id, [])
+        if member_id is not None:
+            member_ids.append(member_id)
+    return link_members
+
+
+def forget_links(link_members):
+    """Drops deleted links from the member link pools, the random link sampler and the link index."""
+    for link_id, member_ids in link_members.items():
+        link_sampler.remove_link(link_id, member_ids)
+        link_index.remove_link(link_id, member_ids)
+        for member_id in member_ids:
+            link_pool_cache.invalidate(member_id)
+
+
+# --- RANDOM LINK SAMPLER --- #
+
+
+class RandomSampler:
+    """A set that a uniformly random item can be drawn from in O(1).
+    Removing swaps the last item into the hole, so the items stay dense."""
+
+    def __init__(self):
+        self.items = []
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, item):
+        if item not in self.positions:
+            self.positions[item] = len(self.items)
+            self.items.append(item)
+
+    def remove(self, item):
+        position = self.positions.pop(item, None)
+        if position is None:
+            return
+        last = self.items.pop()
+        if position < len(self.items):
+            self.items[position] = last
+            self.positions[last] = position
+
+    def sample(self, k=1):
+        """Returns up to k different items."""
+        return random.sample(self.items, min(k, len(self.items)))
+
+
+class LinkSampler:
+    """(LinkId, MemberId) pairs of link_members, with the pairs of links that have no tags kept apart."""
+
+    def __init__(self):
+        self.links = RandomSampler()
+        self.untagged = RandomSampler()
+        self.untagged_by_member = {}  # MemberId -> RandomSampler of LinkIds
+        self.untagged_by_group = {}  # GroupId -> RandomSampler of (LinkId, MemberId)
+        self.member_groups = {}  # MemberId -> GroupId, kept so pairs can be removed after the member is
+        self.tag_counts = {}  # LinkId -> number of tags on the link
+
+    def add_pair(self, link_id, member_id):
+        self.links.add((link_id, member_id))
+        if not self.tag_counts.get(link_id):
+            self.add_untagged(link_id, member_id)
+
+    def remove_pair(self, link_id, member_id):
+        self.links.remove((link_id, member_id))
+        self.remove_untagged(link_id, member_id)
+
+    def add_untagged(self, link_id, member_id):
+        self.untagged.add((link_id, member_id))
+        self.untagged_by_member.setdefault(member_id, RandomSampler()).add(link_id)
+        group_id = self.member_groups.get(member_id)
+        if group_id is None:
+            group_id = alias_index.member_groups.get(member_id)
+            if group_id is None:
+                return
+            self.member_groups[member_id] = group_id
+        self.untagged_by_group.setdefault(group_id, RandomSampler()).add((link_id, member_id))
+
+    def remove_untagged(self, link_id, member_id):
+        self.untagged.remove((link_id, member_id))
+        if member_id in self.untagged_by_member:
+            self.untagged_by_member[member_id].remove(link_id)
+        group_id = self.member_groups.get(member_id)
+        if group_id in self.untagged_by_group:
+            self.untagged_by_group[group_id].remove((link_id, member_id))
+
+    def remove_link(self, link_id, member_ids):
+        for member_id in member_ids:
+            self.remove_pair(link_id, member_id)
+        self.tag_counts.pop(link_id, None)
+
+    def add_tag(self, link_id, member_ids):
+        self.tag_counts[link_id] = self.tag_counts.get(link_id, 0) + 1
+        for member_id in member_ids:
+            self.remove_untagged(link_id, member_id)
+
+    def remove_tag(self, link_id, member_ids):
+        count = self.tag_counts.get(link_id, 0) - 1
+        if count > 0:
+            self.tag_counts[link_id] = count
+            return
+        self.tag_counts.pop(link_id, None)
+        for member_id in member_ids:
+            self.add_pair(link_id, member_id)
+
+
+link_sampler = LinkSampler()
+
+
+# --- LINK INDEX --- #
+
+
+def link_hash(link_id):
+    """Spreads a LinkId over 64 bits, a set of links is versioned by xoring these together."""
+    return (link_id * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+
+
+class LinkIndex:
+    """Inverted index from members, tags and media types to the LinkIds that have them.
+    Tag queries are answered with set operations, without touching the database.
+    Every member and tag also has a version of its links, the xor of their link_hash, which changes
+    in O(1) when a link is added or removed and is the same after a restart for the same links."""
+
+    def __init__(self):
+        self.member_links = {}  # MemberId -> set of LinkIds
+        self.tag_links = {}  # TagId -> set of LinkIds
+        self.media_links = {"gfy": set(), "image": set(), "fancam": set()}
+        self.member_versions = {}  # MemberId -> xor of link_hash of its links
+        self.tag_versions = {}  # TagId -> xor of link_hash of its links
+
+    def add_link(self, link_id, link):
+        media = media_type(link)
+        if media is not None:
+            self.media_links[media].add(link_id)
+
+    def remove_link(self, link_id, member_ids):
+        for links in self.media_links.values():
+            links.discard(link_id)
+        for member_id in member_ids:
+            self.remove_pair(link_id, member_id)
+        for tag_id in [t for t, links in self.tag_links.items() if link_id in links]:
+            self.remove_tag(link_id, tag_id)
+
+    def add_pair(self, link_id, member_id):
+        links = self.member_links.setdefault(member_id, set())
+        if link_id not in links:
+            links.add(link_id)
+            self.member_versions[member_id] = self.member_versions.get(member_id, 0) ^ link_hash(link_id)
+
+    def remove_pair(self, link_id, member_id):
+        links = self.member_links.get(member_id)
+        if links is not None and link_id in links:
+            links.discard(link_id)
+            self.member_versions[member_id] ^= link_hash(link_id)
+            if not links:
+                del self.member_links[member_id]
+                del self.member_versions[member_id]
+
+    def add_tag(self, link_id, tag_id):
+        links = self.tag_links.setdefault(tag_id, set())
+        if link_id not in links:
+            links.add(link_id)
+            self.tag_versions[tag_id] = self.tag_versions.get(tag_id, 0) ^ link_hash(link_id)
+
+    def remove_tag(self, link_id, tag_id):
+        links = self.tag_links.get(tag_id)
+        if links is not None and link_id in links:
+            links.discard(link_id)
+            self.tag_versions[tag_id] ^= link_hash(link_id)
+            if not links:
+                del self.tag_links[tag_id]
+                del self.tag_versions[tag_id]
+
+    def drop_tag(self, tag_id):
+        self.tag_links.pop(tag_id, None)
+        self.tag_versions.pop(tag_id, None)
+
+    def version(self, member_id=None, any_tags=(), all_tags=(), no_tags=()):
+        """Returns a version of every link a query over the member and tags can return, as a string.
+        It changes whenever one of them gains or loses a link, a link never changes its media type."""
+        parts = [self.member_versions.get(member_id, 0)] if member_id is not None else []
+        parts += [self.tag_versions.get(x, 0) for tags in (any_tags, all_tags, no_tags) for x in sorted(tags)]
+        return "-".join(format(x, "x") for x in parts)
+
+    def query(self, member_id=None, media=None, any_tags=(), all_tags=(), no_tags=()):
+        """Returns the sorted LinkIds of the member and media type that have one of any_tags,
+        every tag of all_tags and none of no_tags.
+        A query without a member or a tag to include returns nothing rather than every link."""
+        empty = set()
+        sets = []
+        if member_id is not None:
+            sets.append(self.member_links.get(member_id, empty))
+        if any_tags:
+            sets.append(set().union(*(self.tag_links.get(x, empty) for x in any_tags)))
+        sets.extend(self.tag_links.get(x, empty) for x in all_tags)
+        if not sets:
+            return []
+        if media is not None:
+            sets.append(self.media_links[media])
+        sets.sort(key=len)
+        result = sets[0].intersection(*sets[1:])
+        for tag_id in no_tags:
+            result.difference_update(self.tag_links.get(tag_id, empty))
+        return sorted(result)
+
+
+link_index = LinkIndex()
+
+
+def query_link_ids(member_id=None, media=None, any_tags=(), all_tags=(), no_tags=()):
+    """Returns the sorted LinkIds matching a tag query, see LinkIndex.query."""
+    return link_index.query(member_id, media, any_tags, all_tags, no_tags)
+
+
+def link_version(member_id=None, media=None, any_tags=(), all_tags=(), no_tags=()):
+    """Returns the version of the links a tag query draws from, see LinkIndex.version.
+    Without tags it is the version of the member's link pool."""
+    return link_index.version(member_id, any_tags, all_tags, no_tags)
+
+
+async def load_link_indexes():
+    """Reads every link, link_members and link_tags row into a new sampler and link index and swaps them in."""
+    global link_sampler, link_index
+    sampler = LinkSampler()
+    index = LinkIndex()
+    async with db_cursor() as cursor:
+        await cursor.execute("SELECT LinkId, Link FROM links")
+        for link_id, link in await cursor.fetchall():
+            index.add_link(link_id, link)
+        await cursor.execute("SELECT LinkId, TagId FROM link_tags")
+        for link_id, tag_id in await cursor.fetchall():
+            index.add_tag(link_id, tag_id)
+            sampler.tag_counts[link_id] = sampler.tag_counts.get(link_id, 0) + 1
+        await cursor.execute("SELECT LinkId, MemberId FROM link_members")
+        for link_id, member_id in await cursor.fetchall():
+            sampler.add_pair(link_id, member_id)
+            index.add_pair(link_id, member_id)
+    link_sampler = sampler
+    link_index = index
+    print(f"Loaded {len(sampler.links)} links into the sampler, {len(sampler.untagged)} without tags.")
+    print(f"Indexed {len(index.member_links)} members and {len(index.tag_links)} tags.")
+
+
+async def get_links_by_id(link_ids):
+    """Returns {LinkId: Link} of the ids."""
+    if not link_ids:
+        return {}
+    async with db_cursor() as cursor:
+        sql = "SELECT LinkId, Link FROM links WHERE LinkId IN (" + ", ".join(["%s"] * len(link_ids)) + ")"
+        await cursor.execute(sql, list(link_ids))
+        return dict(await cursor.fetchall())
+
+
+async def rows_from_pairs(pairs):
+    """Returns rows of Link, member name, group name, MemberId of (LinkId, MemberId) pairs."""
+    links = await get_links_by_id({x[0] for x in pairs})
+    rows = []
+    for link_id, member_id in pairs:
+        if link_id not in links or member_id not in alias_index.member_names:
+            continue
+        group_id = alias_index.member_groups[member_id]
+        rows.append((links[link_id], alias_index.member_names[member_id], alias_index.group_names[group_id], member_id))
+    return rows
+
+
+# --- SUBSCRIPTIONS --- #
+
+
+class Subscriptions:
+    """In memory copy of which channels follow what, so new posts find their channels without a query.
+    source is "reddit", "twitter", "instagram" or "twitch", the external id is the subreddit name,
+    or the id of the account on its site."""
+
+    sources = ("reddit", "twitter", "instagram", "twitch")
+
+    def __init__(self):
+        self.routes = {source: {} for source in self.sources}  # source -> external id -> set of channels
+        self.channel_routes = {}  # channel -> set of (source, external id)
+
+    @staticmethod
+    def external_key(source, external_id):
+        return external_id if source == "reddit" else int(external_id)
+
+    def add(self, source, external_id, channel):
+        external_id = self.external_key(source, external_id)
+        self.routes[source].setdefault(external_id, set()).add(channel)
+        self.channel_routes.setdefault(channel, set()).add((source, external_id))
+
+    def _discard(self, source, external_id, channel):
+        channels = self.routes[source].get(external_id)
+        if channels is not None:
+            channels.discard(channel)
+            if not channels:
+                del self.routes[source][external_id]
+
+    def remove(self, source, external_id, channel):
+        external_id = self.external_key(source, external_id)
+        self._discard(source, external_id, channel)
+        routes = self.channel_routes.get(channel)
+        if routes is not None:
+            routes.discard((source, external_id))
+            if not routes:
+                del self.channel_routes[channel]
+
+    def remove_channel(self, channel):
+        for source, external_id in self.channel_routes.pop(channel, ()):
+            self._discard(source, external_id, channel)
+
+    def channels(self, source, external_id):
+        return list(self.routes[source].get(self.external_key(source, external_id), ()))
+
+    def followed(self, source):
+        return {external_id: list(channels) for external_id, channels in self.routes[source].items()}
+
+
+subscriptions = Subscriptions()
+
+
+def get_subscribed_channels(source, external_id):
+    """Returns the channels following external_id on source."""
+    return subscriptions.channels(source, external_id)
+
+
+def get_subscriptions(source):
+    """Returns {external id: [channels following it]} of everything followed on source."""
+    return subscriptions.followed(source)
+
+
+async def load_subscriptions():
+    """Reads every follow of every channel into subscriptions."""
+    global subscriptions
+    index = Subscriptions()
+    async with db_cursor() as cursor:
+        sql = """SELECT 'reddit', RedditName, Channel FROM reddit_channels
+                 JOIN reddit ON reddit.RedditId = reddit_channels.RedditId
+                 JOIN channels ON channels.ChannelId = reddit_channels.ChannelId
+                 UNION ALL
+                 SELECT 'twitter', Twitter, Channel FROM twitter_channels
+                 JOIN twitter ON twitter.TwitterId = twitter_channels.TwitterId
+                 JOIN channels ON channels.ChannelId = twitter_channels.ChannelId
+                 UNION ALL
+                 SELECT 'instagram', Instagram, Channel FROM instagram_channels
+                 JOIN instagram ON instagram.InstagramId = instagram_channels.InstagramId
+                 JOIN channels ON channels.ChannelId = instagram_channels.ChannelId
+                 UNION ALL
+                 SELECT 'twitch', Twitch, Channel FROM twitch_channels
+                 JOIN twitch ON twitch.TwitchId = twitch_channels.TwitchId
+                 JOIN channels ON channels.ChannelId = twitch_channels.ChannelId"""
+        await cursor.execute(sql)
+        for source, external_id, channel in await cursor.fetchall():
+            index.add(source, external_id, channel)
+    subscriptions = index
+    print(f"Loaded {len(index.channel_routes)} channels following feeds.")
 
 
 # --- MAKE DATABASE BACKUP ON DAY CYCLES --- #
@@ -67,945 +669,1028 @@ def backup_database():
     threading.Timer(86400.0, backup_database).start()
 
 
-backup_database()
-
-
 # --- CUSTOM COMMANDS --- #
 
 
-def add_command(name, link, added_by):
-    """Add a new custom command to the database."""
-    cursor = db.cursor()
-    sql = "INSERT INTO custom_commands(CommandName, Command, AddedBy) VALUES (%s, %s, %s);"
-    val = (name, link, added_by)
-    cursor.execute(sql, val)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
+# GuildId 0 is a command that works in every server
+custom_commands = {}  # (GuildId, CommandName) -> Command
 
 
-def get_commands():
-    """Returns a dictionary of all commands in the database."""
-    cursor = db.cursor()
-    sql = "SELECT CommandName, Command FROM custom_commands ORDER BY CommandName;"
-    cursor.execute(sql)
-    result = dict(cursor.fetchall())
-    cursor.close()
-    return result
-
-
-def find_command(command_name):
-    """Finds a specific command by name in the database."""
-    cursor = db.cursor()
-    sql = """SELECT CommandName FROM custom_commands
-                WHERE CommandName = %s"""
-    val = command_name
-    cursor.execute(sql, val)
-    rowcount = cursor.rowcount
-    cursor.close()
-    return rowcount > 0
+async def load_custom_commands():
+    """Reads every custom command into custom_commands."""
+    async with db_cursor() as cursor:
+        await cursor.execute("SELECT GuildId, CommandName, Command FROM custom_commands")
+        rows = await cursor.fetchall()
+    custom_commands.clear()
+    custom_commands.update({(guild_id, name.lower()): command for guild_id, name, command in rows})
+    print(f"Loaded {len(custom_commands)} custom commands.")
 
 
-def remove_command(name):
+async def add_command(name, link, added_by, guild_id=0):
+    """Add a new custom command to the database."""
+    async with db_cursor() as cursor:
+        sql = "INSERT INTO custom_commands(GuildId, CommandName, Command, AddedBy) VALUES (%s, %s, %s, %s);"
+        val = (guild_id, name, link, added_by)
+        try:
+            await cursor.execute(sql, val)
+        except aiomysql.IntegrityError:
+            return False
+        rowcount = cursor.rowcount
+        if rowcount > 0:
+            custom_commands[(guild_id, name.lower())] = link
+        return rowcount > 0
+
+
+def get_commands(guild_id=0):
+    """Returns a dictionary of the commands usable in a guild, commands of the guild replace global ones."""
+    result = {name: command for (g_id, name), command in custom_commands.items() if g_id == 0}
+    if guild_id:
+        result.update({name: command for (g_id, name), command in custom_commands.items() if g_id == guild_id})
+    return dict(sorted(result.items()))
+
+
+def find_command(command_name, guild_id=0):
+    """Returns the link of a command, looking in the guild before the global commands."""
+    command_name = command_name.lower()
+    if guild_id and (guild_id, command_name) in custom_commands:
+        return custom_commands[(guild_id, command_name)]
+    return custom_commands.get((0, command_name))
+
+
+async def remove_command(name, guild_id=0):
     """Removes a command by name from the database."""
-    cursor = db.cursor()
-    # sql = """UPDATE Custom_Commands
-    #         SET
-    #             Custom_Commands.IsDeleted = 1
-    #         WHERE
-    #             Custom_Commands.CommandName = %s;"""
-    sql = """DELETE FROM custom_commands
-                WHERE CommandName = %s"""
-    value = (name,)
-    cursor.execute(sql, value)
-    db.commit()
-    row_count = cursor.rowcount
-    cursor.close()
-    return row_count > 0
+    async with db_cursor() as cursor:
+        # sql = """UPDATE Custom_Commands
+        #         SET
+        #             Custom_Commands.IsDeleted = 1
+        #         WHERE
+        #             Custom_Commands.CommandName = %s;"""
+        sql = """DELETE FROM custom_commands
+                    WHERE GuildId = %s AND CommandName = %s"""
+        value = (guild_id, name)
+        await cursor.execute(sql, value)
+        row_count = cursor.rowcount
+        if row_count > 0:
+            custom_commands.pop((guild_id, name.lower()), None)
+        return row_count > 0
 
 
 # --- LINK COMMANDS --- #
 
 
-def add_link(link, added_by):
+async def add_link(link, added_by):
     """Adds a link to the database."""
-    cursor = db.cursor()
-    sql = "INSERT INTO links(Link, AddedBy) VALUES (%s, %s);"
-    values = (link, added_by)
-    try:
-        cursor.execute(sql, values)
-    except Exception as e:
-        print(e)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
-
-
-def delete_link_from_database(link):
-    cursor = db.cursor()
-    sql = "DELETE FROM links WHERE Link = %s"
-    val = (link,)
-    try:
-        cursor.execute(sql, val)
-    except Exception as e:
-        print(e)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
+    async with db_cursor() as cursor:
+        canonical = canonicalise(link)
+        sql = "INSERT INTO links(Link, LinkKey, AddedBy) VALUES (%s, %s, %s);"
+        values = (link, canonical.key if canonical else None, added_by)
+        try:
+            await cursor.execute(sql, values)
+        except Exception as e:
+            print(e)
+        rowcount = cursor.rowcount
+        if rowcount > 0:
+            link_index.add_link(cursor.lastrowid, link)
+        return rowcount > 0
+
+
+async def delete_link_from_database(link):
+    async with db_cursor() as cursor:
+        condition, value = link_condition(link)
+        sql = "DELETE FROM links WHERE " + condition
+        val = (value,)
+        try:
+            link_members = await find_link_members(cursor, link)
+            await cursor.execute(sql, val)
+        except Exception as e:
+            print(e)
+            return False
+        rowcount = cursor.rowcount
+        if rowcount > 0:
+            forget_links(link_members)
+        return rowcount > 0
+
+
+async def count_links():
+    """Returns a count of all links, groups, and members."""
+    async with db_cursor() as cursor:
+        sql = """SELECT
+                  (SELECT COUNT(*) FROM links) as link_count, 
+                  (SELECT COUNT(*) FROM groupz) as group_count,
+                  (SELECT COUNT(*) FROM members) as member_count"""
+        await cursor.execute(sql)
+        result = await cursor.fetchone()
+        return result
 
 
-def gfy_v2_test(group, idol):
-    """Returns rows of GroupId, MemberId, GroupName, IdolName, Link"""
-    cursor = db.cursor()
-    sql = """SELECT g.GroupId, m.MemberId, g.RomanName, m.RomanName, l.Link FROM links l
-             JOIN link_members lm on l.LinkId = lm.LinkId
-             JOIN members m on lm.MemberId = m.MemberId
-             JOIN member_aliases ma on m.MemberId = ma.MemberId
-             JOIN groupz g on g.GroupId = m.GroupId
-             JOIN groupz_aliases ga on ga.GroupId = g.GroupId
-             WHERE ga.Alias = %s AND ma.Alias = %s;"""
-    vals = (group, idol)
-    try:
-        cursor.execute(sql, vals)
-    except Exception as e:
-        print(e)
-    result = cursor.fetchall()
-    cursor.close()
-    return result
-
-
-def gfy_v2_test_tags(group, idol, tag):
-    cursor = db.cursor()
-    sql = """SELECT g.GroupId, m.MemberId, g.RomanName, m.RomanName, l.Link FROM links l
-             JOIN link_members lm on l.LinkId = lm.LinkId
-             JOIN members m on lm.MemberId = m.MemberId
-             JOIN member_aliases ma on m.MemberId = ma.MemberId
-             JOIN groupz g on g.GroupId = m.GroupId
-             JOIN groupz_aliases ga on ga.GroupId = g.GroupId
-             JOIN link_tags lt on lt.LinkId = l.LinkId
-             JOIN tag_aliases ta on ta.TagId = lt.TagId
-             WHERE ga.Alias = %s AND ma.Alias = %s AND ta.Alias = (%s);"""
-    vals = (group, idol, tag)
-    try:
-        cursor.execute(sql, vals)
-    except Exception as e:
-        print(e)
-    result = cursor.fetchall()
-    cursor.close()
-    return result
-
-
-def count_links():
-    """Returns a count of all links, groups, and members."""
-    cursor = db.cursor()
-    sql = """SELECT
-              (SELECT COUNT(*) FROM links) as link_count, 
-              (SELECT COUNT(*) FROM groupz) as group_count,
-              (SELECT COUNT(*) FROM members) as member_count"""
-    cursor.execute(sql)
-    result = cursor.fetchone()
-    cursor.close()
-    return result
-
-
-def get_link_id(link):
+async def get_link_id(link):
     """Returns a links unique ID in the database."""
-    cursor = db.cursor()
-    sql = "SELECT LinkId FROM links WHERE Link = %s"
-    val = (link,)
-    cursor.execute(sql, val)
-    link_id = cursor.fetchone()[0]
-    cursor.close()
-    return link_id
+    async with db_cursor() as cursor:
+        condition, value = link_condition(link)
+        sql = "SELECT LinkId FROM links WHERE " + condition
+        val = (value,)
+        await cursor.execute(sql, val)
+        link_id = (await cursor.fetchone())[0]
+        return link_id
 
 
-def remove_link(group, member, link):
+async def remove_link(group, member, link):
     """Removes a link from a member."""
-    cursor = db.cursor()
-    # sql = """UPDATE Links, Link_Members, Link_Tags
-    #             SET
-    #                 Links.IsDeleted = 1,
-    #                 Links_Members.IsDeleted = 1,
-    #                 Links_Tags.IsDeleted = 1
-    #             WHERE
-    #                 Links.LinkId = %s
-    #                 AND
-    #                 Links.LinkId = Link_Tags.LinkId
-    #                 AND
-    #                 Link_Members.MemberId = %s
-    #                 AND
-    #                 Link_Members.LinkId = Links.LinkId;
-    #         """
-    # sql = """DELETE Link_Members FROM Link_Members
-    #             INNER JOIN Links
-    #                 ON Link_Members.LinkId = Links.LinkId
-    #             INNER JOIN Members
-    #                 ON Members.MemberId = Link_Members.MemberId
-    #             INNER JOIN Groupz
-    #                 ON Groupz.GroupId = Members.GroupId
-    #             WHERE
-    #                 Groupz.RomanName = %s
-    #                 AND
-    #                 Members.RomanName = %s
-    #                 AND
-    #                 Links.Link = %s
-    #                 """
-    # sql = """DELETE link_members, link_tags, links  FROM links
-    #             left JOIN groupz
-    #                 ON groupz.RomanName = %s
-    #             left JOIN members
-    #                 ON members.RomanName = %s
-    #             left JOIN link_members
-    #                 ON members.MemberId = link_members.MemberId
-    #             left JOIN link_tags
-    #                 ON link_tags.LinkId = link_members.linkId
-    #             WHERE links.Link = %s;"""
-    sql = """delete links FROM links
-             left JOIN groupz_aliases
-             ON groupz_aliases.Alias = %s
-             left JOIN groupz
-             ON groupz.GroupId = groupz_aliases.GroupId
-             left JOIN member_aliases
-             ON member_aliases.Alias = %s
-             left JOIN members
-             ON members.MemberId = member_aliases.MemberId
-             left JOIN link_members 
-             ON members.MemberId = link_members.MemberId
-             WHERE links.Link = %s
-             and links.LinkId = link_members.LinkId;"""
-    value = (group, member, link)
-    cursor.execute(sql, value)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
-
-
-def add_link_to_member(member_id, link_id):
-    cursor = db.cursor()
-    sql = """INSERT INTO link_members(LinkId, MemberId) VALUES (%s, %s);"""
-    values = (link_id, member_id)
-    try:
-        cursor.execute(sql, values)
-    except Exception as e:
-        print(e)
-        return False
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
+    async with db_cursor() as cursor:
+        # sql = """UPDATE Links, Link_Members, Link_Tags
+        #             SET
+        #                 Links.IsDeleted = 1,
+        #                 Links_Members.IsDeleted = 1,
+        #                 Links_Tags.IsDeleted = 1
+        #             WHERE
+        #                 Links.LinkId = %s
+        #                 AND
+        #                 Links.LinkId = Link_Tags.LinkId
+        #                 AND
+        #                 Link_Members.MemberId = %s
+        #                 AND
+        #                 Link_Members.LinkId = Links.LinkId;
+        #         """
+        # sql = """DELETE Link_Members FROM Link_Members
+        #             INNER JOIN Links
+        #                 ON Link_Members.LinkId = Links.LinkId
+        #             INNER JOIN Members
+        #                 ON Members.MemberId = Link_Members.MemberId
+        #             INNER JOIN Groupz
+        #                 ON Groupz.GroupId = Members.GroupId
+        #             WHERE
+        #                 Groupz.RomanName = %s
+        #                 AND
+        #                 Members.RomanName = %s
+        #                 AND
+        #                 Links.Link = %s
+        #                 """
+        # sql = """DELETE link_members, link_tags, links  FROM links
+        #             left JOIN groupz
+        #                 ON groupz.RomanName = %s
+        #             left JOIN members
+        #                 ON members.RomanName = %s
+        #             left JOIN link_members
+        #                 ON members.MemberId = link_members.MemberId
+        #             left JOIN link_tags
+        #                 ON link_tags.LinkId = link_members.linkId
+        #             WHERE links.Link = %s;"""
+        sql = """delete links FROM links
+                 left JOIN groupz_aliases
+                 ON groupz_aliases.Alias = %s
+                 left JOIN groupz
+                 ON groupz.GroupId = groupz_aliases.GroupId
+                 left JOIN member_aliases
+                 ON member_aliases.Alias = %s
+                 left JOIN members
+                 ON members.MemberId = member_aliases.MemberId
+                 left JOIN link_members 
+                 ON members.MemberId = link_members.MemberId
+                 WHERE {}
+                 and links.LinkId = link_members.LinkId;"""
+        condition, link_value = link_condition(link)
+        sql = sql.format(condition)
+        value = (group, member, link_value)
+        link_members = await find_link_members(cursor, link)
+        await cursor.execute(sql, value)
+        rowcount = cursor.rowcount
+        if rowcount > 0:
+            forget_links(link_members)
+        return rowcount > 0
+
+
+async def add_link_to_member(member_id, link_id):
+    async with db_cursor() as cursor:
+        sql = """INSERT INTO link_members(LinkId, MemberId) VALUES (%s, %s);"""
+        values = (link_id, member_id)
+        try:
+            await cursor.execute(sql, values)
+        except Exception as e:
+            print(e)
+            return False
+        link_pool_cache.invalidate(member_id)
+        link_sampler.add_pair(link_id, member_id)
+        link_index.add_pair(link_id, member_id)
+        rowcount = cursor.rowcount
+        return rowcount > 0
+
+
+def values_list(rows, width):
+    """Returns the VALUES placeholders of a multi-row insert."""
+    return ", ".join(["(" + ", ".join(["%s"] * width) + ")"] * rows)
+
+
+async def add_links_to_member(member_id, link_tags, new_tags, added_by):
+    """Adds links and their tags to a member in one transaction, with a single statement per table.
+    link_tags is {CanonicalLink: [TagName]}, the date tags in new_tags are created first.
+    Returns (added links, count of duplicate links, {TagName: links tagged}, {TagName: [links already tagged]}),
+    nothing is written if it raises."""
+    links = list(link_tags)
+    if not links:
+        return [], 0, {}, {}
+    keys = list({x.key for x in links})
+    select_links = "SELECT LinkKey, LinkId FROM links WHERE LinkKey IN (" + ", ".join(["%s"] * len(keys)) + ")"
+    created_tags = []
+    async with db_transaction() as cursor:
+        tag_ids = {}
+        for tag in {x for tags in link_tags.values() for x in tags} - set(new_tags):
+            tag_row = alias_index.tag(tag)
+            if tag_row is not None:
+                tag_ids[tag] = tag_row[1]
+        if new_tags:
+            new_tags = list(new_tags)
+            in_new_tags = "(" + ", ".join(["%s"] * len(new_tags)) + ")"
+            # ignored rows are tags someone else created since they were looked up, the select finds them
+            await cursor.execute("INSERT IGNORE INTO tags(TagName, AddedBy) VALUES " + values_list(len(new_tags), 2),
+                                 [x for tag in new_tags for x in (tag, added_by)])
+            await cursor.execute("SELECT TagId, TagName FROM tags WHERE TagName IN " + in_new_tags, new_tags)
+            created_tags = await cursor.fetchall()
+            # every tag is an alias of itself, which a tag created by someone else already has
+            await cursor.execute("""INSERT IGNORE INTO tag_aliases(TagId, Alias, AddedBy)
+                                    SELECT TagId, TagName, %s FROM tags
+                                    WHERE TagName IN """ + in_new_tags + """ AND NOT EXISTS
+                                      (SELECT 1 FROM tag_aliases
+                                       WHERE tag_aliases.TagId = tags.TagId AND tag_aliases.Alias = tags.TagName)""",
+                                 [added_by] + new_tags)
+            tag_ids.update((name, tag_id) for tag_id, name in created_tags)
+        await cursor.execute(select_links, keys)
+        link_ids = dict(await cursor.fetchall())
+        new_links = list({x.key: x for x in links if x.key not in link_ids}.values())
+        if new_links:
+            # ignored rows were added by someone else since the select, the second select finds them
+            await cursor.execute("INSERT IGNORE INTO links(Link, LinkKey, AddedBy) VALUES " +
+                                 values_list(len(new_links), 3),
+                                 [x for link in new_links for x in (link.url, link.key, added_by)])
+            await cursor.execute(select_links, keys)
+            link_ids = dict(await cursor.fetchall())
+        ids = {link: link_ids[link.key] for link in links}
+        await cursor.execute("SELECT LinkId FROM link_members WHERE MemberId = %s AND LinkId IN (" +
+                             ", ".join(["%s"] * len(ids)) + ")", [member_id] + list(ids.values()))
+        on_member = {x[0] for x in await cursor.fetchall()}
+        added = []
+        for link in links:
+            if ids[link] not in on_member:
+                added.append(link)
+                on_member.add(ids[link])
+        if added:
+            await cursor.execute("INSERT INTO link_members(LinkId, MemberId) VALUES " + values_list(len(added), 2),
+                                 [x for link in added for x in (ids[link], member_id)])
+        wanted = {}  # (LinkId, TagId) -> (link, TagName)
+        for link, tags in link_tags.items():
+            for tag in tags:
+                if tag in tag_ids:
+                    wanted.setdefault((ids[link], tag_ids[tag]), (link.url, tag))
+        await cursor.execute("SELECT LinkId, TagId FROM link_tags WHERE LinkId IN (" +
+                             ", ".join(["%s"] * len(ids)) + ")", list(ids.values()))
+        tagged = set(await cursor.fetchall())
+        tags_added = {}
+        duplicate_tags = {}
+        new_link_tags = []
+        for pair, (link, tag) in wanted.items():
+            if pair in tagged:
+                duplicate_tags.setdefault(tag, []).append(link)
+            else:
+                new_link_tags.append(pair)
+                tags_added[tag] = tags_added.get(tag, 0) + 1
+        link_members = {}
+        if new_link_tags:
+            await cursor.execute("INSERT INTO link_tags(LinkId, TagId) VALUES " +
+                                 values_list(len(new_link_tags), 2), [x for pair in new_link_tags for x in pair])
+            tagged_ids = list({x[0] for x in new_link_tags})
+            await cursor.execute("SELECT LinkId, MemberId FROM link_members WHERE LinkId IN (" +
+                                 ", ".join(["%s"] * len(tagged_ids)) + ")", tagged_ids)
+            for link_id, tagged_member in await cursor.fetchall():
+                link_members.setdefault(link_id, []).append(tagged_member)
+        if added:
+            await cursor.execute("""INSERT INTO users(UserId, Xp, Cont) VALUES (%s, 0, %s)
+                                    ON DUPLICATE KEY UPDATE Cont = Cont + VALUES(Cont)""", (added_by, len(added)))
+    for tag_id, name in created_tags:
+        alias_index.add_tag(tag_id, name)
+        alias_index.add_tag_alias(tag_id, name)
+    for link in new_links:
+        link_index.add_link(link_ids[link.key], link.url)
+    for link in added:
+        link_sampler.add_pair(ids[link], member_id)
+        link_index.add_pair(ids[link], member_id)
+    if added:
+        link_pool_cache.invalidate(member_id)
+    for link_id, tag_id in new_link_tags:
+        link_sampler.add_tag(link_id, link_members.get(link_id, []))
+        link_index.add_tag(link_id, tag_id)
+    return [x.url for x in added], len(links) - len(added), tags_added, duplicate_tags
 
 
 # --- TAG COMMANDS --- #
 
 
-def add_tag(tag_name, added_by):
-    """Adds a new tag to the database."""
-    cursor = db.cursor()
-    sql = "INSERT INTO tags(TagName, AddedBy) VALUES (%s, %s);"
-    value = (tag_name, added_by)
-    cursor.execute(sql, value)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
-
-
-def add_tag_alias(tag_id, alias, added_by):
-    cursor = db.cursor()
-    sql = "INSERT INTO tag_aliases(TagId, Alias, AddedBy) VALUES (%s, %s, %s);"
-    values = (tag_id, alias, added_by)
-    cursor.execute(sql, values)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
-
-
-def get_all_tag_names():
+async def add_tag(tag_name, added_by):
+    """Adds a new tag to the database, returns False if the tag already exists."""
+    async with db_cursor() as cursor:
+        sql = "INSERT INTO tags(TagName, AddedBy) VALUES (%s, %s);"
+        value = (tag_name, added_by)
+        try:
+            await cursor.execute(sql, value)
+        except aiomysql.IntegrityError:
+            return False
+        rowcount = cursor.rowcount
+        if rowcount > 0:
+            alias_index.add_tag(cursor.lastrowid, tag_name)
+        return rowcount > 0
+
+
+async def add_tag_alias(tag_id, alias, added_by):
+    async with db_cursor() as cursor:
+        sql = "INSERT INTO tag_aliases(TagId, Alias, AddedBy) VALUES (%s, %s, %s);"
+        values = (tag_id, alias, added_by)
+        await cursor.execute(sql, values)
+        rowcount = cursor.rowcount
+        if rowcount > 0:
+            alias_index.add_tag_alias(tag_id, alias)
+        return rowcount > 0
+
+
+async def get_all_tag_names():
     """Returns all tag names."""
-    cursor = db.cursor()
-    sql = "SELECT TagName FROM tags ORDER BY TagName"
-    # sql = """SELECT Alias FROM Tag_Aliases ORDER BY Alias"""
-    cursor.execute(sql)
-    result = cursor.fetchall()
-    cursor.close()
-    return result
+    async with db_cursor() as cursor:
+        sql = "SELECT TagName FROM tags ORDER BY TagName"
+        # sql = """SELECT Alias FROM Tag_Aliases ORDER BY Alias"""
+        await cursor.execute(sql)
+        result = await cursor.fetchall()
+        return result
 
 
-def get_all_tag_alias_names():
+async def get_all_tag_alias_names():
     """Returns all tag names."""
-    cursor = db.cursor()
-    sql = "SELECT Alias FROM tag_aliases ORDER BY Alias"
-    # sql = """SELECT Alias FROM Tag_Aliases ORDER BY Alias"""
-    cursor.execute(sql)
-    result = cursor.fetchall()
-    cursor.close()
-    return result
+    async with db_cursor() as cursor:
+        sql = "SELECT Alias FROM tag_aliases ORDER BY Alias"
+        # sql = """SELECT Alias FROM Tag_Aliases ORDER BY Alias"""
+        await cursor.execute(sql)
+        result = await cursor.fetchall()
+        return result
 
 
 def get_tag_parent_from_alias(tag):
     """gets parent tag name"""
-    cursor = db.cursor()
-    sql = """SELECT TagName, tags.TagId FROM tags
-             LEFT JOIN tag_aliases ON tags.TagId = tag_aliases.TagId
-             WHERE tag_aliases.Alias = %s"""
-    try:
-        cursor.execute(sql, (tag,))
-    except Exception as e:
-        print(e)
-    result = cursor.fetchone()
-    cursor.close()
-    return result
-
-
-def get_all_alias_of_tag(tag_id):
-    """Returns all aliases of tag from db."""
-    cursor = db.cursor()
-    sql = """select alias from tag_aliases
-             left join tags
-             on tags.TagId = tag_aliases.TagId
-             where tag_aliases.TagId = %s"""
-    val = (tag_id,)
-    cursor.execute(sql, val)
-    result = cursor.fetchall()
-    cursor.close()
-    return result
-
-
-def add_tag_alias_db(tag, alias, user_id):
-    """Adds a new alias to an existing tag."""
-    cursor = db.cursor()
-    sql = """INSERT INTO tag_aliases(TagId, Alias, AddedBy)
-             VALUES ((SELECT TagId FROM tags WHERE TagName = %s), %s, %s)"""
-    val = (tag, alias, user_id)
-    cursor.execute(sql, val)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
+    return alias_index.tag(tag)
 
 
-def remove_tag_alias_db(tag, alias):
+async def get_all_alias_of_tag(tag_id):
+    """Returns all aliases of tag from db."""
+    async with db_cursor() as cursor:
+        sql = """select alias from tag_aliases
+                 left join tags
+                 on tags.TagId = tag_aliases.TagId
+                 where tag_aliases.TagId = %s"""
+        val = (tag_id,)
+        await cursor.execute(sql, val)
+        result = await cursor.fetchall()
+        return result
+
+
+async def add_tag_alias_db(tag, alias, user_id):
     """Adds a new alias to an existing tag."""
-    cursor = db.cursor()
-    sql = """delete from tag_aliases where tag_aliases.TagId = ANY(select tags.TagId from tags WHERE TagName = %s)
-             AND tag_aliases.Alias = %s"""
-    val = (tag, alias)
-    cursor.execute(sql, val)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
-
-
-def find_tag_id(tag_name):
+    async with db_cursor() as cursor:
+        sql = """INSERT INTO tag_aliases(TagId, Alias, AddedBy)
+                 VALUES ((SELECT TagId FROM tags WHERE TagName = %s), %s, %s)"""
+        val = (tag, alias, user_id)
+        await cursor.execute(sql, val)
+        rowcount = cursor.rowcount
+        if rowcount > 0:
+            await cursor.execute("SELECT TagId FROM tag_aliases WHERE AliasID = %s", (cursor.lastrowid,))
+            alias_index.add_tag_alias((await cursor.fetchone())[0], alias)
+        return rowcount > 0
+
+
+async def remove_tag_alias_db(tag, alias):
+    """Adds a new alias to an existing tag."""
+    async with db_cursor() as cursor:
+        sql = """delete from tag_aliases where tag_aliases.TagId = ANY(select tags.TagId from tags WHERE TagName = %s)
+                 AND tag_aliases.Alias = %s"""
+        val = (tag, alias)
+        await cursor.execute(sql, val)
+        rowcount = cursor.rowcount
+        if rowcount > 0:
+            alias_index.remove_tag_alias(alias)
+        return rowcount > 0
+
+
+async def find_tag_id(tag_name):
     """Returns the unique ID of a tag by name."""
-    cursor = db.cursor()
-    sql = "SELECT TagId FROM tags WHERE TagName = %s"
-    # sql = """SELECT tags.TagId FROM Tags
-    #             left join tag_aliases
-    #                 on tag_aliases.TagId = tags.TagId
-    #             WHERE tag_aliases.Alias = %s"""
-    val = (tag_name,)
-    cursor.execute(sql, val)
-    tag_id = cursor.fetchone()
-    cursor.close()
-    return tag_id
-
-
-def find_tags_on_link(link):
+    async with db_cursor() as cursor:
+        sql = "SELECT TagId FROM tags WHERE TagName = %s"
+        # sql = """SELECT tags.TagId FROM Tags
+        #             left join tag_aliases
+        #                 on tag_aliases.TagId = tags.TagId
+        #             WHERE tag_aliases.Alias = %s"""
+        val = (tag_name,)
+        await cursor.execute(sql, val)
+        tag_id = await cursor.fetchone()
+        return tag_id
+
+
+async def find_tags_on_link(link):
     """Returns a dict of tagnames and IDs that are on a link."""
-    cursor = db.cursor()
-    sql = """SELECT TagName, TagId, links.LinkId
-             FROM tags, links
-                WHERE
-                    links.Link = %s
-                    AND
-                    tags.LinkId = links.LinkId;"""
-    val = (link,)
-    cursor.execute(sql, val)
-    tags = dict(cursor.fetchall())
-    cursor.close()
-    return tags
-
-
-def remove_tag(tag):
-    cursor = db.cursor()
-    # sql = """UPDATE Tags, Link_Tags
-    #             SET
-    #                 Tags.IsDeleted = 1,
-    #                 Link_Tags.IsDeleted = 1
-    #             WHERE
-    #                 Tags.TagId = %s
-    #                 AND
-    #                 Link_Tags.TagId = Tags.TagId;
-    #                 """
-    # sql = """DELETE tags, link_tags FROM tags
-    #             INNER JOIN link_tags ON tags.TagId = link_tags.TagId
-    #             WHERE tags.TagName = %s;"""
-    sql = "DELETE FROM tags WHERE TagName = %s"
-    value = (tag,)
-    cursor.execute(sql, value)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
-
-
-def add_link_tags(link, tag_name):
-    cursor = db.cursor()
-    # sql = """INSERT INTO Link_Tags(LinkId, TagId) SELECT Links.LinkId, Tags.TagId FROM Links
-    #          LEFT JOIN Tags ON Tags.TagName = %s
-    #          WHERE Links.Link = %s"""
-    sql = """INSERT INTO link_tags(LinkId, TagId) SELECT links.LinkId, tags.TagId FROM links
-             LEFT JOIN tag_aliases ON tag_aliases.Alias = %s
-             LEFT JOIN tags ON tags.TagId = tag_aliases.TagId
-             WHERE links.Link = %s"""
-    values = (tag_name, link)
-    try:
-        cursor.execute(sql, values)
-    except Exception as e:
-        print(e)
-        return False
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
-
-
-def remove_tag_from_link(link, tag):
-    cursor = db.cursor()
-    # sql = """UPDATE Link_Tags
-    #             INNER JOIN Links ON
-    #                 Links.LinkId = Link_Tags.LinkId
-    #             INNER JOIN Tags ON
-    #                 Tags.TagId = Link_Tags.TagId
-    #             SET
-    #                 Link_Tags.IsDeleted = 1
-    #             WHERE
-    #                 Links.Link = %s
-    #                 AND
-    #                 Tags.TagName = %s;"""
-    sql = """DELETE FROM link_tags
-          WHERE LinkId = ANY(SELECT LinkId FROM links WHERE Link = %s) 
-          AND TagId = ANY(SELECT TagId FROM tags WHERE TagName = %s)"""
-    values = (link, tag)
-    cursor.execute(sql, values)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
-
-
-def get_links_with_tag(tag_name):
-    cursor = db.cursor()
-    sql = """select link from links
-                inner join link_tags on link_tags.LinkId = links.LinkId
-                inner join tags on tags.TagId = link_tags.TagId
-                inner join tag_aliases on tags.TagId = tag_aliases.TagId
-                where tag_aliases.Alias = %s;"""
-    val = (tag_name,)
-    try:
-        cursor.execute(sql, val)
-    except Exception as e:
-        print(e)
-    result = cursor.fetchall()
-    cursor.close()
-    return result
-
-
-def member_link_count(group_name, member_name):
-    cursor = db.cursor()
-    sql = """select count(*) from link_members
-                inner join members on members.RomanName = %s
-                inner join groupz on groupz.RomanName = %s
-                where groupz.GroupId = members.GroupId
-                and members.MemberId = link_members.MemberId"""
-    values = (member_name, group_name)
-    cursor.execute(sql, values)
-    result = cursor.fetchone()
-    cursor.close()
-    return result
+    async with db_cursor() as cursor:
+        sql = """SELECT TagName, TagId, links.LinkId
+                 FROM tags, links
+                    WHERE
+                        links.Link = %s
+                        AND
+                        tags.LinkId = links.LinkId;"""
+        val = (link,)
+        await cursor.execute(sql, val)
+        tags = dict(await cursor.fetchall())
+        return tags
+
+
+async def remove_tag(tag):
+    async with db_cursor() as cursor:
+        # sql = """UPDATE Tags, Link_Tags
+        #             SET
+        #                 Tags.IsDeleted = 1,
+        #                 Link_Tags.IsDeleted = 1
+        #             WHERE
+        #                 Tags.TagId = %s
+        #                 AND
+        #                 Link_Tags.TagId = Tags.TagId;
+        #                 """
+        # sql = """DELETE tags, link_tags FROM tags
+        #             INNER JOIN link_tags ON tags.TagId = link_tags.TagId
+        #             WHERE tags.TagName = %s;"""
+        await cursor.execute("SELECT TagId FROM tags WHERE TagName = %s", (tag,))
+        tag_ids = await cursor.fetchall()
+        await cursor.execute("""SELECT link_tags.LinkId, MemberId FROM link_tags
+                                JOIN tags ON tags.TagId = link_tags.TagId
+                                LEFT JOIN link_members ON link_members.LinkId = link_tags.LinkId
+                                WHERE tags.TagName = %s""", (tag,))
+        link_members = {}
+        for link_id, member_id in await cursor.fetchall():
+            member_ids = link_members.setdefault(link_id, [])
+            if member_id is not None:
+                member_ids.append(member_id)
+        sql = "DELETE FROM tags WHERE TagName = %s"
+        value = (tag,)
+        await cursor.execute(sql, value)
+        rowcount = cursor.rowcount
+        if rowcount > 0:
+            for row in tag_ids:
+                alias_index.remove_tag(row[0])
+                link_index.drop_tag(row[0])
+            for link_id, member_ids in link_members.items():
+                link_sampler.remove_tag(link_id, member_ids)
+        return rowcount > 0
+
+
+async def add_link_tags(link, tag_name):
+    async with db_cursor() as cursor:
+        # sql = """INSERT INTO Link_Tags(LinkId, TagId) SELECT Links.LinkId, Tags.TagId FROM Links
+        #          LEFT JOIN Tags ON Tags.TagName = %s
+        #          WHERE Links.Link = %s"""
+        tag_row = alias_index.tag(tag_name)
+        if tag_row is None:
+            return False
+        condition, value = link_condition(link)
+        sql = "INSERT INTO link_tags(LinkId, TagId) SELECT LinkId, %s FROM links WHERE " + condition
+        values = (tag_row[1], value)
+        try:
+            await cursor.execute(sql, values)
+        except Exception as e:
+            print(e)
+            return False
+        rowcount = cursor.rowcount
+        if rowcount > 0:
+            for link_id, member_ids in (await find_link_members(cursor, link)).items():
+                link_sampler.add_tag(link_id, member_ids)
+                link_index.add_tag(link_id, tag_row[1])
+        return rowcount > 0
+
+
+async def remove_tag_from_link(link, tag):
+    async with db_cursor() as cursor:
+        # sql = """UPDATE Link_Tags
+        #             INNER JOIN Links ON
+        #                 Links.LinkId = Link_Tags.LinkId
+        #             INNER JOIN Tags ON
+        #                 Tags.TagId = Link_Tags.TagId
+        #             SET
+        #                 Link_Tags.IsDeleted = 1
+        #             WHERE
+        #                 Links.Link = %s
+        #                 AND
+        #                 Tags.TagName = %s;"""
+        condition, value = link_condition(link)
+        sql = """DELETE FROM link_tags
+              WHERE LinkId = ANY(SELECT LinkId FROM links WHERE {}) 
+              AND TagId = ANY(SELECT TagId FROM tags WHERE TagName = %s)""".format(condition)
+        values = (value, tag)
+        await cursor.execute("SELECT TagId FROM tags WHERE TagName = %s", (tag,))
+        tag_ids = await cursor.fetchall()
+        await cursor.execute(sql, values)
+        rowcount = cursor.rowcount
+        if rowcount > 0:
+            for link_id, member_ids in (await find_link_members(cursor, link)).items():
+                link_sampler.remove_tag(link_id, member_ids)
+                for row in tag_ids:
+                    link_index.remove_tag(link_id, row[0])
+        return rowcount > 0
+
+
+async def member_link_count(group_name, member_name):
+    async with db_cursor() as cursor:
+        sql = """select count(*) from link_members
+                    inner join members on members.RomanName = %s
+                    inner join groupz on groupz.RomanName = %s
+                    where groupz.GroupId = members.GroupId
+                    and members.MemberId = link_members.MemberId"""
+        values = (member_name, group_name)
+        await cursor.execute(sql, values)
+        result = await cursor.fetchone()
+        return result
 
 
 # --- GROUPZ COMMANDS --- #
 
 
-def add_group(group_name, added_by):
-    cursor = db.cursor()
-    sql = "INSERT INTO groupz(RomanName, AddedBy) VALUES (%s, %s);"
-    values = (group_name, added_by)
-    try:
-        cursor.execute(sql, values)
-    except mysql.connector.errors.IntegrityError:
-        return None
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
-
-
-def remove_group(group):
-    cursor = db.cursor()
-    # sql = """UPDATE Groupz, Members, Link_Members, Links
-    #             SET
-    #                 Groupz.IsDeleted = 1,
-    #                 Members.IsDeleted = 1,
-    #                 Link_Members.IsDeleted = 1,
-    #                 Links.IsDeleted = 1
-    #             WHERE
-    #                 Groupz.RomanName = %s
-    #                 AND
-    #                 Members.GroupId = Groupz.GroupId
-    #                 AND
-    #                 Link_Members.MemberId = Members.MemberId
-    #                 AND
-    #                 Links.LinkId = Link_Members.LinkId;"""
-    # sql = """DELETE groupz, members, member_aliases, groupz_aliases, link_members, link_tags, links FROM groupz
-    #             left JOIN members
-    #                 ON members.GroupId  is not null and  members.GroupId = groupz.GroupId
-    #             left JOIN member_aliases
-    #                 ON member_aliases.MemberId  is not null and member_aliases.MemberId = members.MemberId
-    #             left JOIN groupz_aliases
-    #                 ON  groupz_aliases.GroupId is not null and groupz_aliases.GroupId = groupz.GroupId
-    #             left JOIN link_members
-    #                 ON members.MemberId is not null and members.MemberId = link_members.MemberId
-    #             left JOIN links
-    #                 ON links.LinkId is not null and links.LinkId = link_members.LinkId
-    #             left JOIN link_tags
-    #                 ON links.LinkId is not null and links.LinkId = link_tags.LinkId
-    #             WHERE groupz.RomanName = %s;"""
-    sql = "DELETE FROM groupz WHERE RomanName = %s;"
-    values = (group,)
-    try:
-        cursor.execute(sql, values)
-    except mysql.connector.errors.IntegrityError:
-        return None
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
+async def add_group(group_name, added_by):
+    async with db_cursor() as cursor:
+        sql = "INSERT INTO groupz(RomanName, AddedBy) VALUES (%s, %s);"
+        values = (group_name, added_by)
+        try:
+            await cursor.execute(sql, values)
+        except aiomysql.IntegrityError:
+            return None
+        rowcount = cursor.rowcount
+        if rowcount > 0:
+            alias_index.add_group(cursor.lastrowid, group_name)
+        return rowcount > 0
+
+
+async def remove_group(group):
+    async with db_cursor() as cursor:
+        # sql = """UPDATE Groupz, Members, Link_Members, Links
+        #             SET
+        #                 Groupz.IsDeleted = 1,
+        #                 Members.IsDeleted = 1,
+        #                 Link_Members.IsDeleted = 1,
+        #                 Links.IsDeleted = 1
+        #             WHERE
+        #                 Groupz.RomanName = %s
+        #                 AND
+        #                 Members.GroupId = Groupz.GroupId
+        #                 AND
+        #                 Link_Members.MemberId = Members.MemberId
+        #                 AND
+        #                 Links.LinkId = Link_Members.LinkId;"""
+        # sql = """DELETE groupz, members, member_aliases, groupz_aliases, link_members, link_tags, links FROM groupz
+        #             left JOIN members
+        #                 ON members.GroupId  is not null and  members.GroupId = groupz.GroupId
+        #             left JOIN member_aliases
+        #                 ON member_aliases.MemberId  is not null and member_aliases.MemberId = members.MemberId
+        #             left JOIN groupz_aliases
+        #                 ON  groupz_aliases.GroupId is not null and groupz_aliases.GroupId = groupz.GroupId
+        #             left JOIN link_members
+        #                 ON members.MemberId is not null and members.MemberId = link_members.MemberId
+        #             left JOIN links
+        #                 ON links.LinkId is not null and links.LinkId = link_members.LinkId
+        #             left JOIN link_tags
+        #                 ON links.LinkId is not null and links.LinkId = link_tags.LinkId
+        #             WHERE groupz.RomanName = %s;"""
+        await cursor.execute("SELECT GroupId FROM groupz WHERE RomanName = %s", (group,))
+        group_ids = await cursor.fetchall()
+        await cursor.execute("""SELECT LinkId, link_members.MemberId FROM link_members
+                                JOIN members ON members.MemberId = link_members.MemberId
+                                JOIN groupz ON groupz.GroupId = members.GroupId
+                                WHERE groupz.RomanName = %s""", (group,))
+        pairs = await cursor.fetchall()
+        sql = "DELETE FROM groupz WHERE RomanName = %s;"
+        values = (group,)
+        try:
+            await cursor.execute(sql, values)
+        except aiomysql.IntegrityError:
+            return None
+        rowcount = cursor.rowcount
+        if rowcount > 0:
+            for row in group_ids:
+                alias_index.remove_group(row[0])
+            for link_id, member_id in pairs:
+                link_sampler.remove_pair(link_id, member_id)
+                link_index.remove_pair(link_id, member_id)
+                link_pool_cache.invalidate(member_id)
+        return rowcount > 0
 
 
 def find_group_id(group_name):
-    cursor = db.cursor()
-    sql = """SELECT groupz.GroupId, RomanName FROM groupz
-                left join groupz_aliases
-                    on groupz_aliases.Alias = %s
-                where groupz.GroupId = groupz_aliases.GroupId;"""
-    value = (group_name,)
-    try:
-        cursor.execute(sql, value)
-    except Exception as e:
-        print(e)
-        return None
-    g_id = cursor.fetchone()
-    cursor.close()
-    return g_id
+    """Returns (GroupId, RomanName) of the group with this alias."""
+    return alias_index.group(group_name)
 
 
 def find_group_id_and_name(group_name):
-    cursor = db.cursor()
-    sql = """SELECT groupz.GroupId, groupz.RomanName FROM groupz
-                left join groupz_aliases
-                    on groupz_aliases.Alias = %s
-                where groupz.GroupId = groupz_aliases.GroupId;"""
-    value = (group_name,)
-    try:
-        cursor.execute(sql, value)
-    except Exception as e:
-        print(e)
-        return None
-    name_and_g_id = cursor.fetchone()
-    cursor.close()
-    return name_and_g_id
-
-
-def find_group_and_member_id(group_name, member_name):
-    cursor = db.cursor()
-    sql = """select groupz.GroupId, members.MemberId from groupz, members
-             where groupz.RomanName = %s
-             and members.RomanName = %s"""
-    values = (group_name, member_name)
-    cursor.execute(sql, values)
-    result = cursor.fetchone()
-    cursor.close()
-    return result
-
-
-def get_groups():
-    cursor = db.cursor()
-    sql = """SELECT RomanName FROM groupz
-                ORDER BY RomanName"""
-    cursor.execute(sql)
-    result = cursor.fetchall()
-    cursor.close()
-    return result
-
-
-def add_group_alias_db(group_name, alias, user_id):
-    cursor = db.cursor()
-    sql = """INSERT INTO groupz_aliases(GroupId, Alias, AddedBy)
-             VALUES ((SELECT GroupId FROM groupz WHERE RomanName = %s), %s, %s)"""
-    val = (group_name, alias, user_id)
-    cursor.execute(sql, val)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
+    return alias_index.group(group_name)
+
+
+async def find_group_and_member_id(group_name, member_name):
+    async with db_cursor() as cursor:
+        sql = """select groupz.GroupId, members.MemberId from groupz, members
+                 where groupz.RomanName = %s
+                 and members.RomanName = %s"""
+        values = (group_name, member_name)
+        await cursor.execute(sql, values)
+        result = await cursor.fetchone()
+        return result
+
+
+async def get_groups():
+    async with db_cursor() as cursor:
+        sql = """SELECT RomanName FROM groupz
+                    ORDER BY RomanName"""
+        await cursor.execute(sql)
+        result = await cursor.fetchall()
+        return result
+
+
+async def add_group_alias_db(group_name, alias, user_id):
+    async with db_cursor() as cursor:
+        sql = """INSERT INTO groupz_aliases(GroupId, Alias, AddedBy)
+                 VALUES ((SELECT GroupId FROM groupz WHERE RomanName = %s), %s, %s)"""
+        val = (group_name, alias, user_id)
+        await cursor.execute(sql, val)
+        rowcount = cursor.rowcount
+        if rowcount > 0:
+            await cursor.execute("SELECT GroupId FROM groupz_aliases WHERE AliasID = %s", (cursor.lastrowid,))
+            alias_index.add_group_alias((await cursor.fetchone())[0], alias)
+        return rowcount > 0
+
+
+async def remove_group_alias_db(group_name, alias):
+    async with db_cursor() as cursor:
+        sql = """delete from groupz_aliases where groupz_aliases.GroupId = ANY(
+                 select groupz.GroupId from groupz WHERE RomanName = %s)
+                 AND groupz_aliases.Alias = %s"""
+        val = (group_name, alias)
+        await cursor.execute(sql, val)
+        rowcount = cursor.rowcount
+        if rowcount > 0:
+            alias_index.remove_group_alias(alias)
+        return rowcount > 0
+
+
+async def get_group_aliases(group_name):
+    async with db_cursor() as cursor:
+        sql = "select Alias from groupz_aliases WHERE GroupId = %s"
+        val = (group_name,)
+        await cursor.execute(sql, val)
+        result = await cursor.fetchall()
+        return result
 
 
-def remove_group_alias_db(group_name, alias):
-    cursor = db.cursor()
-    sql = """delete from groupz_aliases where groupz_aliases.GroupId = ANY(
-             select groupz.GroupId from groupz WHERE RomanName = %s)
-             AND groupz_aliases.Alias = %s"""
-    val = (group_name, alias)
-    cursor.execute(sql, val)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
+# --- Members Commands --- #
 
 
-def get_group_aliases(group_name):
-    cursor = db.cursor()
-    sql = "select Alias from groupz_aliases WHERE GroupId = %s"
-    val = (group_name,)
-    cursor.execute(sql, val)
-    result = cursor.fetchall()
-    cursor.close()
-    return result
+async def add_member(group_name, member_name, addedby):
+    async with db_cursor() as cursor:
+        sql = """INSERT INTO members(GroupId, RomanName, AddedBy)
+                    VALUES ((SELECT groupz.GroupId FROM groupz WHERE groupz.RomanName = %s),
+                             %s, %s);"""
+        values = (group_name, member_name, addedby)
+        try:
+            await cursor.execute(sql, values)
+        except aiomysql.IntegrityError:
+            return None
+        rowcount = cursor.rowcount
+        if rowcount > 0:
+            member_id = cursor.lastrowid
+            await cursor.execute("SELECT GroupId FROM members WHERE MemberId = %s", (member_id,))
+            alias_index.add_member(member_id, (await cursor.fetchone())[0], member_name)
+        return rowcount > 0
+
+
+async def remove_member(group_id, member_name):
+    async with db_cursor() as cursor:
+        # sql = """UPDATE Members, Link_Members, Links
+        #             SET
+        #                 Members.IsDeleted = 1,
+        #                 Link_Members.IsDeleted = 1,
+        #                 Links.IsDeleted = 1
+        #             WHERE
+        #                 Members.MemberId = %s
+        #                 AND
+        #                 Link_Members.MemberId = Members.MemberId
+        #                 AND
+        #                 Links.LinkId = Link_Members.LinkId;"""
+        # sql = """DELETE Members, Link_Members, Links FROM Members
+        #             left JOIN link_members
+        #                 ON members.MemberId = link_members.MemberId
+        #             left JOIN links
+        #                 ON links.LinkId = link_members.LinkId
+        #             WHERE members.RomanName = %s
+        #             AND members.GroupId = %s;"""
+        await cursor.execute("SELECT MemberId FROM members WHERE RomanName = %s AND GroupId = %s",
+                             (member_name, group_id))
+        member_ids = await cursor.fetchall()
+        await cursor.execute("""SELECT LinkId, link_members.MemberId FROM link_members
+                                JOIN members ON members.MemberId = link_members.MemberId
+                                WHERE RomanName = %s AND GroupId = %s""", (member_name, group_id))
+        pairs = await cursor.fetchall()
+        sql = "DELETE FROM members WHERE RomanName = %s AND GroupId = %s"
+        values = (member_name, group_id)
+        try:
+            await cursor.execute(sql, values)
+        except Exception as e:
+            print(e)
+        rowcount = cursor.rowcount
+        if rowcount > 0:
+            for row in member_ids:
+                alias_index.remove_member(row[0])
+                link_pool_cache.invalidate(row[0])
+            for link_id, member_id in pairs:
+                link_sampler.remove_pair(link_id, member_id)
+                link_index.remove_pair(link_id, member_id)
+        return rowcount > 0
 
 
-# --- Members Commands --- #
+def find_member_id(group_id, member_name):
+    """Returns (MemberId, RomanName) of the member of the group with this alias."""
+    return alias_index.member(group_id, member_name)
 
 
-def add_member(group_name, member_name, addedby):
-    cursor = db.cursor()
-    sql = """INSERT INTO members(GroupId, RomanName, AddedBy)
-                VALUES ((SELECT groupz.GroupId FROM groupz WHERE groupz.RomanName = %s),
-                         %s, %s);"""
-    values = (group_name, member_name, addedby)
-    try:
-        cursor.execute(sql, values)
-    except mysql.connector.errors.IntegrityError:
-        return None
-    db.commit()
-    rowcount = cursor.rowcount
-    cursor.close()
-    return rowcount > 0
+def find_member_id_and_name(group_id, member_name):
+    return alias_index.member(group_id, member_name)
+
+
+async def add_member_alias_db(group, idol, alias, user_id):
+    async with db_cursor() as cursor:
+        sql = """INSERT INTO member_aliases(MemberId, Alias, AddedBy) VALUES (
+                 (SELECT MemberId FROM members
+                 left join groupz on groupz.GroupId = members.GroupId
+                 left join groupz_aliases on groupz.GroupId = groupz_aliases.GroupId
+                 WHERE groupz_aliases.Alias = %s AND members.RomanName = %s),
+                 %s, %s)"""
+        val = (group, idol, alias, user_id)
+        try:
+            await cursor.execute(sql, val)
+        except Exception as e:
+            print(e)
+        rowcount = cursor.rowcount
+        if rowcount > 0:
+            await cursor.execute("SELECT MemberId FROM member_aliases WHERE AliasID = %s", (cursor.lastrowid,))
+            alias_index.add_member_alias((await cursor.fetchone())[0], alias)
+        return rowcount > 0
+
+
+async def remove_member_alias_db(group, idol, alias):
+    async with db_cursor() as cursor:
+        sql = """delete from member_aliases
+                 where member_aliases.MemberId = ANY(
+                 select members.MemberId from members
+                 left join groupz on groupz.GroupId = members.GroupId 
+                 left join groupz_aliases on groupz.GroupId = groupz_aliases.GroupId
+                 WHERE members.RomanName = %s AND groupz_aliases.Alias = %s
+                 )
+                 AND member_aliases.Alias = %s"""
+        val = (idol, group, alias)
+        await cursor.execute(sql, val)
+        rowcount = cursor.rowcount
+        if rowcount > 0:
+            group_row = alias_index.group(group)
+            if group_row:
+                alias_index.remove_member_alias(group_row[0], alias)
+        return rowcount > 0
+
+
+async def find_member_aliases(member_id):
+    async with db_cursor() as cursor:
+        sql = "select Alias from member_aliases where MemberId = %s ORDER BY Alias"
+        val = (member_id,)
+        await cursor.execute(sql, val)
+        result = await cursor.fetchall()
+        return result
+
+
+async def get_members_of_group(group_name):
+    """Returns a dict of members of a group."""
+    async with db_cursor() as cursor:
+        sql = """SELECT members.RomanName FROM members
+                    INNER JOIN groupz ON groupz.RomanName = %s
+                    WHERE members.GroupId = groupz.GroupId;"""
+        val = (group_name,)
+        await cursor.execute(sql, val)
+        members = await cursor.fetchall()
+        return members
+
+
+async def get_members_of_group_by_group_id(group_id):
+    async with db_cursor() as cursor:
+        sql = """SELECT members.RomanName FROM members
+                    INNER JOIN groupz ON groupz.GroupId = %s
+                    WHERE members.GroupId = groupz.GroupId;"""
+        val = group_id
+        await cursor.execute(sql, val)
+        members = await cursor.fetchall()
+        return members
+
+
+async def get_member_links(member_id):
+    async with db_cursor() as cursor:
+        sql = """select Link from links
+                    inner join link_members 
+                    on links.LinkId = link_members.LinkId
+                    where link_members.MemberId = %s
+                    order by links.LinkId;"""
+        vals = (member_id,)
+        try:
+            await cursor.execute(sql, vals)
+        except Exception as e:
+            print(e)
+        result = await cursor.fetchall()
+        return result
+
+
+async def get_members_of_group_and_link_count(group_id):
+    async with db_cursor() as cursor:
+        sql = """SELECT members.RomanName,
+                    (SELECT COUNT(*) FROM link_members WHERE link_members.MemberId = members.MemberId)
+                    FROM members
+                    INNER JOIN groupz ON groupz.GroupId = %s
+                    WHERE members.GroupId = groupz.GroupId
+                    ORDER BY members.RomanName"""
+        val = (group_id,)
+        await cursor.execute(sql, val)
+        result = await cursor.fetchall()
+        return result
+
+
+async def count_links_of_member(member_id):
+    async with db_cursor() as cursor:
+        sql = "SELECT COUNT(*) FROM link_members WHERE MemberId = (%s)"
+        val = (member_id,)
+        try:
+            await cursor.execute(sql, val)
+        except Exception as e:
+            print(e)
+        result = (await cursor.fetchone())[0]
+        return result
+
+
+async def last_three_links(member_id):
+    async with db_cursor() as cursor:
+        sql = """SELECT Link FROM links
+                    INNER JOIN link_members ON links.LinkId = link_members.LinkId
+                    WHERE link_members.MemberId = %s
+                    ORDER BY links.LinkId DESC
+                    LIMIT 3"""
+        val = (member_id,)
+        try:
+            await cursor.execute(sql, val)
+        except Exception as e:
+            print(e)
+        result = await cursor.fetchall()
+        return result
+
+
+async def get_all_tags_on_member_and_count(member_id):
+    async with db_cursor() as cursor:
+        sql = """SELECT TagName, Count(*) FROM link_tags
+                    INNER JOIN tags on tags.TagId = link_tags.TagId
+                    INNER JOIN link_members on link_members.LinkId = link_tags.LinkId
+                    WHERE link_members.MemberId = %s
+                    GROUP BY TagName
+                    ORDER BY TagName"""
+        vals = (member_id,)
+        await cursor.execute(sql, vals)
+        result = await cursor.fetchall()
+        return result
+
+
+async def add_link_members(link_id, member_id):
+    async with db_cursor() as cursor:
+        sql = "INSERT INTO link_members(LinkId, MemberId) VALUES (%s, %s);"
+        values = (link_id, member_id)
+        await cursor.execute(sql, values)
+        rowcount = cursor.rowcount
+        if rowcount > 0:
+            link_pool_cache.invalidate(member_id)
+            link_sampler.add_pair(link_id, member_id)
+            link_index.add_pair(link_id, member_id)
+        return rowcount > 0
+
+
+# --- USER XP --- #
+
+
+class XpAccumulator:
+    """Adds up xp per user in memory, the totals are written in one upsert by flush."""
+
+    def __init__(self, max_pending):
+        self.max_pending = max_pending
+        self.pending = {}  # UserId -> xp not yet written
+        self.inflight = {}  # UserId -> xp being written, until it is committed
+        self.task = None  # the write in progress, there is at most one
+
+    def add(self, user_id, xp):
+        """Returns True once enough users are pending that a flush is due."""
+        self.pending[user_id] = self.pending.get(user_id, 0) + xp
+        return len(self.pending) >= self.max_pending
+
+    def unwritten(self, user_id):
+        return self.pending.get(user_id, 0) + self.inflight.get(user_id, 0)
+
+    def schedule(self):
+        """Starts writing the pending xp unless a write is already in progress, returns that write."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._write())
+        return self.task
+
+    async def flush(self):
+        """Writes all pending xp, waiting for a write in progress first."""
+        if self.task is not None and not self.task.done():
+            await self.task
+        if self.pending:
+            await self.schedule()
+
+    async def _write(self):
+        if not self.pending:
+            return
+        self.inflight, self.pending = self.pending, {}
+        sql = "INSERT INTO users(UserId, Xp, Cont) VALUES " + ", ".join(["(%s, %s, 0)"] * len(self.inflight)) + \
+              " ON DUPLICATE KEY UPDATE Xp = Xp + VALUES(Xp)"
+        vals = [x for row in self.inflight.items() for x in row]
+        written = False
+        try:
+            async with db_cursor() as cursor:
+                await cursor.execute(sql, vals)
+            written = True
+        except Exception as e:
+            print(f"xp flush failed for {len(self.inflight)} users: {e}")
+        finally:
+            if not written:
+                # keep the xp for the next flush
+                for user_id, xp in self.inflight.items():
+                    self.pending[user_id] = self.pending.get(user_id, 0) + xp
+            self.inflight = {}
+
+
+xp_accumulator = XpAccumulator(apis_dict.get("xp_flush_size", 500))
+xp_flush_interval = apis_dict.get("xp_flush_interval", 30)
 
 
-def remove_member(group_id, member_name):
-    cursor = db.cursor()
-    # sql = """UPDATE Members, Link_Members, Links
-    #             SET
-    #                 Members.IsDeleted = 1,
-    #                 Link_Members.IsDeleted = 1,
-    #                 Links.IsDeleted = 1
-    #             WHERE
-    #                 Members.MemberId = %s
-    #                 AND
-    #                 Link_Members.MemberId = Members.MemberId
-    #                 AND
-    #                 Links.LinkId = Link_Members.LinkId;"""
-    # sql = """DELETE Members, Link_Members, Links FROM Members
-    #             left JOIN link_members
-    #                 ON members.MemberId = link_members.MemberId
-    #             left JOIN links
-    #                 ON links.LinkId = link_members.LinkId
-    #             WHERE members.RomanName = %s
-    #             AND members.GroupId = %s;"""
-    sql = "DELETE FROM members WHERE RomanName = %s AND GroupId = %s"
-    values = (member_name, group_id)
-    try:
-        cursor.execute(sql, values)
-    except Exception as e:
-        print(e)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
+def add_user_xp(discord_id, xp_to_add=1):
+    """Queues xp for a user, the user is created on flush if they don't exist yet."""
+    if xp_accumulator.add(int(discord_id), xp_to_add):
+        xp_accumulator.schedule()
 
 
-def find_member_id(group_id, member_name):
-    cursor = db.cursor()
-    # sql = "SELECT MemberId FROM Members WHERE RomanName = (%s) AND GroupId = (%s)"
-    sql = """SELECT members.MemberId, RomanName FROM members
-                left join member_aliases
-                    on member_aliases.MemberId = members.MemberId
-                WHERE alias = %s AND members.GroupId = %s"""
-    val = (member_name, group_id)
-    try:
-        cursor.execute(sql, val)
-    except Exception as e:
-        print(e)
-    member_id = cursor.fetchone()
-    cursor.close()
-    return member_id
+def get_pending_xp(discord_id):
+    """Returns the xp of a user that has not been written to the database yet."""
+    return xp_accumulator.unwritten(int(discord_id))
 
 
-def find_member_id_and_name(group_id, member_name):
-    cursor = db.cursor()
-    # sql = "SELECT MemberId FROM Members WHERE RomanName = (%s) AND GroupId = (%s)"
-    sql = """SELECT members.MemberId, members.RomanName FROM members
-                left join member_aliases
-                    on member_aliases.MemberId = members.MemberId
-                WHERE alias = %s AND members.GroupId = %s"""
-    val = (member_name, group_id)
-    try:
-        cursor.execute(sql, val)
-    except Exception as e:
-        print(e)
-    member_id_and_name = cursor.fetchone()
-    cursor.close()
-    return member_id_and_name
-
-
-def add_member_alias_db(group, idol, alias, user_id):
-    cursor = db.cursor()
-    sql = """INSERT INTO member_aliases(MemberId, Alias, AddedBy) VALUES (
-             (SELECT MemberId FROM members
-             left join groupz on groupz.GroupId = members.GroupId
-             left join groupz_aliases on groupz.GroupId = groupz_aliases.GroupId
-             WHERE groupz_aliases.Alias = %s AND members.RomanName = %s),
-             %s, %s)"""
-    val = (group, idol, alias, user_id)
-    try:
-        cursor.execute(sql, val)
-    except Exception as e:
-        print(e)
-    db.commit()
-    rowcount = cursor.rowcount
-    cursor.close()
-    return rowcount > 0
+async def flush_user_xp():
+    await xp_accumulator.flush()
 
 
-def remove_member_alias_db(group, idol, alias):
-    cursor = db.cursor()
-    sql = """delete from member_aliases
-             where member_aliases.MemberId = ANY(
-             select members.MemberId from members
-             left join groupz on groupz.GroupId = members.GroupId 
-             left join groupz_aliases on groupz.GroupId = groupz_aliases.GroupId
-             WHERE members.RomanName = %s AND groupz_aliases.Alias = %s
-             )
-             AND member_aliases.Alias = %s"""
-    val = (idol, group, alias)
-    cursor.execute(sql, val)
-    db.commit()
-    rowcount = cursor.rowcount
-    cursor.close()
-    return rowcount > 0
+async def flush_user_xp_loop():
+    while True:
+        await asyncio.sleep(xp_flush_interval)
+        await xp_accumulator.flush()
 
 
-def find_member_aliases(member_id):
-    cursor = db.cursor()
-    sql = "select Alias from member_aliases where MemberId = %s ORDER BY Alias"
-    val = (member_id,)
-    cursor.execute(sql, val)
-    result = cursor.fetchall()
-    cursor.close()
-    return result
+async def add_user(discord_id, xp=0, contri=0):
+    async with db_cursor() as cursor:
+        sql = "INSERT INTO users(UserId, Xp, Cont) VALUES (%s, %s, %s);"
+        values = (discord_id, xp, contri)
+        await cursor.execute(sql, values)
 
 
-def get_members_of_group(group_name):
-    """Returns a dict of members of a group."""
-    cursor = db.cursor()
-    sql = """SELECT members.RomanName FROM members
-                INNER JOIN groupz ON groupz.RomanName = %s
-                WHERE members.GroupId = groupz.GroupId;"""
-    val = (group_name,)
-    cursor.execute(sql, val)
-    members = cursor.fetchall()
-    cursor.close()
-    return members
-
-
-def get_members_of_group_by_group_id(group_id):
-    cursor = db.cursor()
-    sql = """SELECT members.RomanName FROM members
-                INNER JOIN groupz ON groupz.GroupId = %s
-                WHERE members.GroupId = groupz.GroupId;"""
-    val = group_id
-    cursor.execute(sql, val)
-    members = cursor.fetchall()
-    cursor.close()
-    return members
-
-
-def get_member_links(member_id):
-    cursor = db.cursor()
-    sql = """select Link from links
-                inner join link_members 
-                on links.LinkId = link_members.LinkId
-                where link_members.MemberId = %s;"""
-    vals = (member_id,)
-    try:
-        cursor.execute(sql, vals)
-    except Exception as e:
-        print(e)
-    result = cursor.fetchall()
-    cursor.close()
-    return result
-
-
-def get_members_of_group_and_link_count(group_id):
-    cursor = db.cursor()
-    sql = """SELECT members.RomanName,
-                (SELECT COUNT(*) FROM link_members WHERE link_members.MemberId = members.MemberId)
-                FROM members
-                INNER JOIN groupz ON groupz.GroupId = %s
-                WHERE members.GroupId = groupz.GroupId
-                ORDER BY members.RomanName"""
-    val = (group_id,)
-    cursor.execute(sql, val)
-    result = cursor.fetchall()
-    cursor.close()
-    return result
-
-
-def get_member_links_with_tag(member_id, tag):
-    cursor = db.cursor()
-    sql = """select Link from links
-             left join link_members 
-                on links.LinkId = link_members.LinkId
-            left join link_tags 
-                on link_tags.LinkId = links.LinkId 
-            left join tags 
-                on tags.TagId = link_tags.TagId
-            left join tag_aliases
-                on tag_aliases.TagId = tags.TagId
-            WHERE tag_aliases.Alias = %s
-            AND link_members.MemberId = %s
-            """
-    vals = (tag, member_id)
-    try:
-        cursor.execute(sql, vals)
-    except Exception as e:
-        print(e)
-    result = cursor.fetchall()
-    cursor.close()
-    return result
-
-
-def count_links_of_member(member_id):
-    cursor = db.cursor()
-    sql = "SELECT COUNT(*) FROM link_members WHERE MemberId = (%s)"
-    val = (member_id,)
-    try:
-        cursor.execute(sql, val)
-    except Exception as e:
-        print(e)
-    result = cursor.fetchone()[0]
-    return result
-
-
-def last_three_links(member_id):
-    cursor = db.cursor()
-    sql = """SELECT Link FROM links
-                INNER JOIN link_members ON links.LinkId = link_members.LinkId
-                WHERE link_members.MemberId = %s
-                ORDER BY links.LinkId DESC
-                LIMIT 3"""
-    val = (member_id,)
-    try:
-        cursor.execute(sql, val)
-    except Exception as e:
-        print(e)
-    result = cursor.fetchall()
-    return result
-
-
-def get_all_tags_on_member_and_count(member_id):
-    cursor = db.cursor()
-    sql = """SELECT TagName, Count(*) FROM link_tags
-                INNER JOIN tags on tags.TagId = link_tags.TagId
-                INNER JOIN link_members on link_members.LinkId = link_tags.LinkId
-                WHERE link_members.MemberId = %s
-                GROUP BY TagName
-                ORDER BY TagName"""
-    vals = (member_id,)
-    cursor.execute(sql, vals)
-    result = cursor.fetchall()
-    cursor.close()
-    return result
-
-
-def add_link_members(link_id, member_id):
-    cursor = db.cursor()
-    sql = "INSERT INTO link_members(LinkId, MemberId) VALUES (%s, %s);"
-    values = (link_id, member_id)
-    cursor.execute(sql, values)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
+async def find_user(discord_id):
+    async with db_cursor() as cursor:
+        sql = "SELECT UserId, Xp, Cont FROM users WHERE UserId = %s;"
+        val = (discord_id,)
+        await cursor.execute(sql, val)
+        user = await cursor.fetchone()
+        return user
 
 
-def add_user(discord_id, xp=0, contri=0):
-    cursor = db.cursor()
-    sql = "INSERT INTO users(UserId, Xp, Cont) VALUES (%s, %s, %s);"
-    values = (discord_id, xp, contri)
-    cursor.execute(sql, values)
-    db.commit()
-    cursor.close()
+async def add_user_contribution(discord_id, contribution=1):
+    async with db_cursor() as cursor:
+        sql = """UPDATE users
+                    SET
+                        Cont = Cont + %s
+                    WHERE
+                        UserId = %s"""
+        vals = (contribution, discord_id)
+        await cursor.execute(sql, vals)
 
 
-def add_user_xp(discord_id, xp_to_add=1):
-    cursor = db.cursor()
-    sql = """UPDATE users
-                SET
-                    Xp = Xp + %s
-                WHERE
-                    UserId = %s;
-            """
-    vals = (xp_to_add, discord_id)
-    cursor.execute(sql, vals)
-    db.commit()
-    cursor.close()
-
-
-def find_user(discord_id):
-    cursor = db.cursor()
-    sql = "SELECT UserId, Xp, Cont FROM users WHERE UserId = %s;"
-    val = (discord_id,)
-    cursor.execute(sql, val)
-    user = cursor.fetchone()
-    cursor.close()
-    return user
-
-
-def add_user_contribution(discord_id, contribution=1):
-    cursor = db.cursor()
-    sql = """UPDATE users
-                SET
-                    Cont = Cont + %s
-                WHERE
-                    UserId = %s"""
-    vals = (contribution, discord_id)
-    cursor.execute(sql, vals)
-    db.commit()
-    cursor.close()
-
-
-def add_cont_from_one_user_to_other(from_id, to_id):
-    cursor = db.cursor()
-    sql = """UPDATE users as U, users AS OldUser
-             SET U.Cont = U.Cont + OldUser.Cont
-             WHERE U.UserId = %s AND OldUser.UserId = %s"""
-    val = (to_id, from_id)
-    try:
-        cursor.execute(sql, val)
-    except Exception as e:
-        print(e)
-    db.commit()
-    cursor.close()
+async def add_cont_from_one_user_to_other(from_id, to_id):
+    async with db_cursor() as cursor:
+        sql = """UPDATE users as U, users AS OldUser
+                 SET U.Cont = U.Cont + OldUser.Cont
+                 WHERE U.UserId = %s AND OldUser.UserId = %s"""
+        val = (to_id, from_id)
+        try:
+            await cursor.execute(sql, val)
+        except Exception as e:
+            print(e)
 
 
 # def remove_user(discord_id):
@@ -1023,196 +1708,213 @@ def add_cont_from_one_user_to_other(from_id, to_id):
 #     return rowcount > 0
 
 
-def get_leaderboard(number_of_users=10):
-    cursor = db.cursor()
-    sql = "SELECT UserId, Cont FROM users ORDER BY Cont DESC LIMIT %s;"
-    val = (number_of_users,)
-    cursor.execute(sql, val)
-    leaderboard = cursor.fetchall()
-    cursor.close()
-    return leaderboard
-
-
-def get_idol_leaderboard(number_of_entries=10):
-    cursor = db.cursor()
-    sql = """SELECT members.RomanName, groupz.RomanName, COUNT(*) FROM link_members
-             JOIN members ON members.MemberId = link_members.MemberId
-             JOIN groupz ON members.GroupId = groupz.GroupId
-             GROUP BY members.MemberId
-             ORDER BY COUNT(*) DESC
-             LIMIT %s"""
-    val = (number_of_entries,)
-    cursor.execute(sql, val)
-    leaderboard = cursor.fetchall()
-    cursor.close()
-    return leaderboard
-
-
-def get_group_leaderboard(number_of_entries=10):
-    cursor = db.cursor()
-    sql = """SELECT groupz.RomanName, COUNT(*) FROM link_members
-             JOIN members ON members.MemberId = link_members.MemberId
-             JOIN groupz ON members.GroupId = groupz.GroupId
-             GROUP BY groupz.GroupId
-             ORDER BY count(*) DESC
-             LIMIT %s"""
-    val = (number_of_entries,)
-    cursor.execute(sql, val)
-    leaderboard = cursor.fetchall()
-    cursor.close()
-    return leaderboard
-
-
-def add_moderator(discord_id):
-    cursor = db.cursor()
-    sql = "INSERT INTO moderators(UserId) VALUES (%s);"
-    value = (discord_id,)
-    try:
-        cursor.execute(sql, value)
-    except mysql.connector.errors.IntegrityError:
-        return None
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
-
-
-def remove_moderator(discord_id):
-    cursor = db.cursor()
-    # sql = """UPDATE Moderators
-    #             SET
-    #                 Moderators.IsDeleted = 1
-    #             WHERE
-    #                 Moderators.UserId = %s;"""
-    sql = "DELETE FROM moderators WHERE UserId = %s"
-    value = (discord_id,)
-    cursor.execute(sql, value)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
+async def get_leaderboard(number_of_users=10):
+    async with db_cursor() as cursor:
+        sql = "SELECT UserId, Cont FROM users ORDER BY Cont DESC LIMIT %s;"
+        val = (number_of_users,)
+        await cursor.execute(sql, val)
+        leaderboard = await cursor.fetchall()
+        return leaderboard
 
 
-def find_moderator(discord_id):
-    cursor = db.cursor()
-    sql = "SELECT UserId FROM moderators WHERE UserId = %s"
-    val = (discord_id,)
-    cursor.execute(sql, val)
-    result = cursor.fetchone()
-    cursor.close()
-    return result
-
-
-def add_channel(discord_id):
-    cursor = db.cursor()
-    sql = "INSERT INTO channels(Channel) VALUES (%s);"
-    value = (discord_id,)
-    try:
-        cursor.execute(sql, value)
-    except mysql.connector.errors.IntegrityError:
+async def get_idol_leaderboard(number_of_entries=10):
+    async with db_cursor() as cursor:
+        sql = """SELECT members.RomanName, groupz.RomanName, COUNT(*) FROM link_members
+                 JOIN members ON members.MemberId = link_members.MemberId
+                 JOIN groupz ON members.GroupId = groupz.GroupId
+                 GROUP BY members.MemberId
+                 ORDER BY COUNT(*) DESC
+                 LIMIT %s"""
+        val = (number_of_entries,)
+        await cursor.execute(sql, val)
+        leaderboard = await cursor.fetchall()
+        return leaderboard
+
+
+async def get_group_leaderboard(number_of_entries=10):
+    async with db_cursor() as cursor:
+        sql = """SELECT groupz.RomanName, COUNT(*) FROM link_members
+                 JOIN members ON members.MemberId = link_members.MemberId
+                 JOIN groupz ON members.GroupId = groupz.GroupId
+                 GROUP BY groupz.GroupId
+                 ORDER BY count(*) DESC
+                 LIMIT %s"""
+        val = (number_of_entries,)
+        await cursor.execute(sql, val)
+        leaderboard = await cursor.fetchall()
+        return leaderboard
+
+
+async def add_moderator(discord_id):
+    async with db_cursor() as cursor:
+        sql = "INSERT INTO moderators(UserId) VALUES (%s);"
+        value = (discord_id,)
+        try:
+            await cursor.execute(sql, value)
+        except aiomysql.IntegrityError:
+            return None
+        rowcount = cursor.rowcount
+        return rowcount > 0
+
+
+async def remove_moderator(discord_id):
+    async with db_cursor() as cursor:
+        # sql = """UPDATE Moderators
+        #             SET
+        #                 Moderators.IsDeleted = 1
+        #             WHERE
+        #                 Moderators.UserId = %s;"""
+        sql = "DELETE FROM moderators WHERE UserId = %s"
+        value = (discord_id,)
+        await cursor.execute(sql, value)
+        rowcount = cursor.rowcount
+        return rowcount > 0
+
+
+async def find_moderator(discord_id):
+    async with db_cursor() as cursor:
+        sql = "SELECT UserId FROM moderators WHERE UserId = %s"
+        val = (discord_id,)
+        await cursor.execute(sql, val)
+        result = await cursor.fetchone()
+        return result
+
+
+async def add_channel(discord_id, guild_id=None):
+    async with db_cursor() as cursor:
+        # channels added before guilds were recorded get theirs here
+        sql = """INSERT INTO channels(Channel, Guild) VALUES (%s, %s)
+                 ON DUPLICATE KEY UPDATE Guild = COALESCE(Guild, VALUES(Guild));"""
+        value = (discord_id, guild_id)
+        await cursor.execute(sql, value)
+
+
+async def get_channels_without_guild():
+    async with db_cursor() as cursor:
+        sql = "SELECT Channel FROM channels WHERE Guild IS NULL;"
+        await cursor.execute(sql)
+        result = [x[0] for x in await cursor.fetchall()]
+        return result
+
+
+async def set_channel_guilds(guilds):
+    """Stores the guild of every channel in {channel: guild id}, with one statement."""
+    if not guilds:
         return
-    db.commit()
-    cursor.close()
-
-
-def remove_channel(discord_id):
-    cursor = db.cursor()
-    sql = """DELETE channels, auditing_channels, reddit_channels
-                FROM channels
-                INNER JOIN auditing_channels 
-                    ON channels.ChannelId = auditing_channels.ChannelId
-                INNER JOIN reddit_channels 
-                    ON channels.ChannelId = reddit_channels.ChannelId
-                WHERE channels.ChannelId = %s;"""
-    value = (discord_id,)
-    cursor.execute(sql, value)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
-
-
-def find_channel(discord_id):
-    cursor = db.cursor()
-    sql = "SELECT ChannelId FROM channels WHERE Channel = %s;"
-    val = (discord_id,)
-    cursor.execute(sql, val)
-    result = cursor.fetchone()
-    cursor.close()
-    return result
-
-
-def add_auditing_channel(discord_id):
-    cursor = db.cursor()
-    sql = """INSERT INTO auditing_channels(ChannelId)
-            SELECT ChannelId FROM channels 
-            WHERE channels.Channel = %s"""
-    value = (discord_id,)
-    cursor.execute(sql, value)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
-
-
-def remove_auditing_channel(discord_id):
-    cursor = db.cursor()
-    # sql = """UPDATE Auditing_Channels
-    #             SET
-    #                 Auditing_Channels.IsDeleted = 1
-    #             WHERE
-    #                 Auditing_Channels.ChannelId = %s"""
-    # sql = """DELETE FROM auditing_channels
-    #             WHERE ChannelId = %s"""
-    sql = """DELETE FROM auditing_channels
-                WHERE ChannelId = ANY(
-                SELECT ChannelId FROM channels
-                WHERE Channel = %s);"""
-    value = (discord_id,)
-    try:
-        cursor.execute(sql, value)
-    except Exception as e:
-        print(e)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
-
-
-def find_auditing_channel(channel_id):
-    cursor = db.cursor()
-    sql = "SELECT ChannelId FROM auditing_channels WHERE ChannelId = %s"
-    val = (channel_id,)
-    cursor.execute(sql, val)
-    result = cursor.fetchone()
-    cursor.close()
-    return result
-
-
-def get_auditing_channels():
-    cursor = db.cursor()
-    sql = """select channels.Channel from channels
-             inner join auditing_channels
-             on auditing_channels.ChannelId = channels.ChannelId"""
-    cursor.execute(sql)
-    result = cursor.fetchall()
-    cursor.close()
-    return result
-
-
-def add_reddit(reddit_name):
-    cursor = db.cursor()
-    sql = "INSERT INTO reddit(RedditName) VALUES (%s);"
-    value = (reddit_name,)
-    try:
-        cursor.execute(sql, value)
-    except Exception as e:
-        print(e)
+    cases = " ".join(["WHEN %s THEN %s"] * len(guilds))
+    async with db_cursor() as cursor:
+        sql = f"""UPDATE channels SET Guild = CASE Channel {cases} END
+                  WHERE Channel IN ({", ".join(["%s"] * len(guilds))})"""
+        await cursor.execute(sql, [x for pair in guilds.items() for x in pair] + list(guilds))
+
+
+async def remove_channel(discord_id):
+    async with db_cursor() as cursor:
+        sql = """DELETE channels, auditing_channels, reddit_channels
+                    FROM channels
+                    INNER JOIN auditing_channels 
+                        ON channels.ChannelId = auditing_channels.ChannelId
+                    INNER JOIN reddit_channels 
+                        ON channels.ChannelId = reddit_channels.ChannelId
+                    WHERE channels.ChannelId = %s;"""
+        value = (discord_id,)
+        await cursor.execute(sql, value)
+        rowcount = cursor.rowcount
+        return rowcount > 0
+
+
+# every table of things posted to a channel
+channel_tables = ("auditing_channels", "linked_channels", "reddit_channels", "twitter_channels",
+                  "instagram_channels", "twitch_channels")
+
+
+async def remove_dead_channels(discord_ids):
+    """Removes everything posted to channels that no longer exist, in one transaction."""
+    if not discord_ids:
         return
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
+    placeholders = ", ".join(["%s"] * len(discord_ids))
+    async with db_transaction() as cursor:
+        for table in channel_tables:
+            sql = f"""DELETE {table} FROM {table}
+                      JOIN channels ON channels.ChannelId = {table}.ChannelId
+                      WHERE channels.Channel IN ({placeholders})"""
+            await cursor.execute(sql, discord_ids)
+    for discord_id in discord_ids:
+        subscriptions.remove_channel(discord_id)
+
+
+async def find_channel(discord_id):
+    async with db_cursor() as cursor:
+        sql = "SELECT ChannelId FROM channels WHERE Channel = %s;"
+        val = (discord_id,)
+        await cursor.execute(sql, val)
+        result = await cursor.fetchone()
+        return result
+
+
+async def add_auditing_channel(discord_id):
+    async with db_cursor() as cursor:
+        sql = """INSERT INTO auditing_channels(ChannelId)
+                SELECT ChannelId FROM channels 
+                WHERE channels.Channel = %s"""
+        value = (discord_id,)
+        await cursor.execute(sql, value)
+        rowcount = cursor.rowcount
+        return rowcount > 0
+
+
+async def remove_auditing_channel(discord_id):
+    async with db_cursor() as cursor:
+        # sql = """UPDATE Auditing_Channels
+        #             SET
+        #                 Auditing_Channels.IsDeleted = 1
+        #             WHERE
+        #                 Auditing_Channels.ChannelId = %s"""
+        # sql = """DELETE FROM auditing_channels
+        #             WHERE ChannelId = %s"""
+        sql = """DELETE FROM auditing_channels
+                    WHERE ChannelId = ANY(
+                    SELECT ChannelId FROM channels
+                    WHERE Channel = %s);"""
+        value = (discord_id,)
+        try:
+            await cursor.execute(sql, value)
+        except Exception as e:
+            print(e)
+        rowcount = cursor.rowcount
+        return rowcount > 0
+
+
+async def find_auditing_channel(channel_id):
+    async with db_cursor() as cursor:
+        sql = "SELECT ChannelId FROM auditing_channels WHERE ChannelId = %s"
+        val = (channel_id,)
+        await cursor.execute(sql, val)
+        result = await cursor.fetchone()
+        return result
+
+
+async def get_auditing_channels():
+    async with db_cursor() as cursor:
+        sql = """select channels.Channel from channels
+                 inner join auditing_channels
+                 on auditing_channels.ChannelId = channels.ChannelId"""
+        await cursor.execute(sql)
+        result = await cursor.fetchall()
+        return result
+
+
+async def add_reddit(reddit_name):
+    async with db_cursor() as cursor:
+        sql = "INSERT INTO reddit(RedditName) VALUES (%s);"
+        value = (reddit_name,)
+        try:
+            await cursor.execute(sql, value)
+        except Exception as e:
+            print(e)
+            return
+        rowcount = cursor.rowcount
+        return rowcount > 0
 
 
 # def remove_reddit(reddit_name):
@@ -1230,48 +1932,50 @@ def add_reddit(reddit_name):
 #     return rowcount > 0
 
 
-def get_subreddit_id(reddit_name):
-    cursor = db.cursor()
-    sql = """SELECT RedditId FROM reddit
-                WHERE RedditName = %s"""
-    val = (reddit_name,)
-    try:
-        cursor.execute(sql, val)
-    except Exception as e:
-        print(e)
-    result = cursor.fetchone()
-    cursor.close()
-    return result
-
-
-def add_reddit_channel(channel_id, reddit_id):
-    cursor = db.cursor()
-    sql = "INSERT INTO reddit_channels(ChannelId, RedditId) VALUES (%s, %s);"
-    values = (channel_id, reddit_id)
-    try:
-        cursor.execute(sql, values)
-    except Exception as e:
-        print(e)
-        return
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
+async def get_subreddit_id(reddit_name):
+    async with db_cursor() as cursor:
+        sql = """SELECT RedditId FROM reddit
+                    WHERE RedditName = %s"""
+        val = (reddit_name,)
+        try:
+            await cursor.execute(sql, val)
+        except Exception as e:
+            print(e)
+        result = await cursor.fetchone()
+        return result
+
+
+async def add_reddit_channel(channel_id, subreddit_name):
+    async with db_cursor() as cursor:
+        sql = """INSERT INTO reddit_channels(ChannelId, RedditId) VALUES (
+                  (SELECT ChannelId FROM channels WHERE Channel = %s),
+                  (SELECT RedditId FROM reddit WHERE RedditName = %s))"""
+        values = (channel_id, subreddit_name)
+        try:
+            await cursor.execute(sql, values)
+        except Exception as e:
+            print(e)
+            return
+        rowcount = cursor.rowcount
+    if rowcount > 0:
+        subscriptions.add("reddit", subreddit_name, channel_id)
     return rowcount > 0
 
 
-def remove_channel_from_subreddit(channel_id, subreddit_name):
-    cursor = db.cursor()
-    sql = """DELETE FROM reddit_channels
-                WHERE RedditId = %s
-                AND ChannelId = %s"""
-    vals = (subreddit_name, channel_id)
-    try:
-        cursor.execute(sql, vals)
-    except Exception as e:
-        print(e)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
+async def remove_channel_from_subreddit(channel_id, subreddit_name):
+    async with db_cursor() as cursor:
+        sql = """DELETE reddit_channels FROM reddit_channels
+                 JOIN reddit ON reddit.RedditId = reddit_channels.RedditId
+                 JOIN channels ON channels.ChannelId = reddit_channels.ChannelId
+                 WHERE reddit.RedditName = %s AND channels.Channel = %s;"""
+        vals = (subreddit_name, channel_id)
+        try:
+            await cursor.execute(sql, vals)
+        except Exception as e:
+            print(e)
+        rowcount = cursor.rowcount
+    if rowcount > 0:
+        subscriptions.remove("reddit", subreddit_name, channel_id)
     return rowcount > 0
 
 
@@ -1292,574 +1996,569 @@ def remove_channel_from_subreddit(channel_id, subreddit_name):
 #     return rowcount > 0
 
 
-def get_all_reddit_channels():
-    cursor = db.cursor()
-    sql = """select Channel from channels 
-                inner join reddit_channels on channels.ChannelId = reddit_channels.ChannelId"""
-    cursor.execute(sql)
-    result = cursor.fetchall()
-    cursor.close()
-    return result
-
-
-def get_all_subreddits():
-    cursor = db.cursor()
-    sql = """select RedditName from reddit"""
-    cursor.execute(sql)
-    result = cursor.fetchall()
-    cursor.close()
-    return result
-
-
-def get_all_reddit_channels_and_sub():
-    cursor = db.cursor()
-    sql = """SELECT Channel, RedditName FROM reddit_channels
-             JOIN channels on channels.ChannelId = reddit_channels.ChannelId 
-             JOIN reddit on reddit.RedditId = reddit_channels.RedditId
-             ORDER BY Channel"""
-    cursor.execute(sql)
-    result = cursor.fetchall()
-    cursor.close()
-    return result
-
-
-def get_channels_with_sub(reddit_name):
-    cursor = db.cursor()
-    sql = """select channel from channels
-                inner join reddit on reddit.RedditName = %s
-                inner join reddit_channels on reddit_channels.RedditId = reddit.RedditId
-                where channels.ChannelId = reddit_channels.ChannelId"""
-    val = (reddit_name,)
-    cursor.execute(sql, val)
-    result = cursor.fetchall()
-    cursor.close()
-    return result
-
-
-def random_link_from_links(limit=1):
-    cursor = db.cursor()
-    sql = """SELECT Link, members.RomanName, groupz.RomanName FROM links
-                INNER JOIN link_members ON link_members.LinkId = links.LinkId
-                INNER JOIN members ON members.MemberId = link_members.MemberId
-                INNER JOIN groupz ON groupz.GroupId = members.GroupId
-                ORDER BY RAND()
-                LIMIT %s;"""
-    val = (limit,)
-    cursor.execute(sql, val)
-    result = cursor.fetchone()
-    cursor.close()
-    return result
-
-
-def random_links_without_tags(limit=1, group_name=None, idol_name=None):
-    """Returns a list of tuples"""
-    cursor = db.cursor()
-    if group_name and idol_name:
-        print('group and idol name')
-        sql = """SELECT links.Link, members.RomanName, groupz.RomanName FROM links
-                 JOIN link_members ON link_members.LinkId = links.LinkId
-                 JOIN members ON members.MemberId = link_members.MemberId
-                 JOIN groupz ON groupz.GroupId = members.GroupId
-                 JOIN groupz_aliases ON groupz_aliases.GroupId = groupz.GroupId
-                 JOIN member_aliases ON member_aliases.MemberId = members.MemberId
-                 WHERE links.LinkId NOT IN (SELECT link_tags.LinkId FROM link_tags)
-                 AND groupz_aliases.Alias = %s
-                 AND member_aliases.Alias = %s
-                 ORDER BY RAND()
-                 LIMIT %s;"""
-        val = (group_name, idol_name, limit)
-    elif group_name and not idol_name:
-        print('group not idol')
-        sql = """SELECT links.Link, members.RomanName, groupz.RomanName FROM links
-                 JOIN link_members ON link_members.LinkId = links.LinkId
-                 JOIN members ON members.MemberId = link_members.MemberId
-                 JOIN groupz ON groupz.GroupId = members.GroupId
-                 JOIN groupz_aliases ON groupz_aliases.GroupId = groupz.GroupId
-                 WHERE links.LinkId NOT IN (SELECT link_tags.LinkId FROM link_tags)
-                 AND groupz_aliases.Alias = %s
-                 ORDER BY RAND()
-                 LIMIT %s;"""
-        val = (group_name, limit)
-    else:
-        sql = """SELECT links.Link, members.RomanName, groupz.RomanName FROM links
-                 JOIN link_members ON link_members.LinkId = links.LinkId
-                 JOIN members ON members.MemberId = link_members.MemberId
-                 JOIN groupz ON groupz.GroupId = members.GroupId
-                 WHERE links.LinkId NOT IN (SELECT link_tags.LinkId FROM link_tags)
-                 ORDER BY RAND()
-                 LIMIT %s;"""
-        val = (limit,)
-    try:
-        cursor.execute(sql, val)
-    except Exception as e:
-        print(e)
-    result = [x for x in cursor.fetchall()]
-    cursor.close()
-    return result
-
-
-def add_guild_db(guild_id):
-    cursor = db.cursor()
-    sql = """INSERT INTO guilds(Guild, Prefix, TimerLimit) VALUES(%s, %s, %s)"""
-    val = (guild_id, default_prefix, 10)
-    try:
-        cursor.execute(sql, val)
-    except mysql.connector.errors.IntegrityError:
-        pass
-    rowcount = cursor.rowcount
-    cursor.close()
-    return rowcount > 0
+async def get_all_reddit_channels():
+    async with db_cursor() as cursor:
+        sql = """select Channel from channels 
+                    inner join reddit_channels on channels.ChannelId = reddit_channels.ChannelId"""
+        await cursor.execute(sql)
+        result = await cursor.fetchall()
+        return result
 
 
-def get_prefix_db(guild_id):
-    cursor = db.cursor()
-    sql = """SELECT Prefix FROM guilds WHERE Guild = %s;"""
-    val = (guild_id,)
-    try:
-        cursor.execute(sql, val)
-    except Exception as e:
-        print(f'get_prefix_db {e}')
-    result = cursor.fetchone()
-    cursor.close()
-    return result
-
-
-def set_guild_prefix_db(guild_id, prefix):
-    cursor = db.cursor()
-    sql = """UPDATE guilds
-                SET
-                    Prefix = %s
-                WHERE
-                    Guild = %s"""
-    val = (prefix, guild_id,)
-    cursor.execute(sql, val)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
+async def get_all_subreddits():
+    async with db_cursor() as cursor:
+        sql = """select RedditName from reddit"""
+        await cursor.execute(sql)
+        result = await cursor.fetchall()
+        return result
 
 
-def set_guild_max_timer_db(max_time, guild_id):
-    cursor = db.cursor()
-    sql = """UPDATE guilds
-                SET
-                    TimerLimit = %s
-                WHERE
-                    Guild = %s"""
-    val = (max_time, guild_id,)
-    try:
-        cursor.execute(sql, val)
-    except Exception as e:
-        print(e)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
+async def get_all_reddits_followed_in_guild(guild_id):
+    async with db_cursor() as cursor:
+        sql = """SELECT Channel, RedditName FROM channels
+                 JOIN reddit_channels on reddit_channels.ChannelId = channels.ChannelId
+                 JOIN reddit on reddit.RedditId = reddit_channels.RedditId
+                 WHERE channels.Guild = %s
+                 ORDER BY Channel"""
+        await cursor.execute(sql, (guild_id,))
+        result = await cursor.fetchall()
+        return result
 
 
-def get_guild_max_duration(guild_id):
-    cursor = db.cursor()
-    sql = "SELECT TimerLimit FROM guilds WHERE Guild = %s"
-    val = (guild_id,)
-    try:
-        cursor.execute(sql, val)
-    except Exception as e:
-        print(e)
-    result = cursor.fetchone()
-    cursor.close()
-    return result
+async def random_link_from_links(limit=1):
+    """Returns a random row of Link, member name, group name, MemberId."""
+    rows = await rows_from_pairs(link_sampler.links.sample(limit))
+    return rows[0] if rows else None
 
 
-def get_banned_words(guild_id):
-    cursor = db.cursor()
-    sql = """SELECT Word FROM banned_words
-             JOIN guild_banned_words ON banned_words.WordId = guild_banned_words.WordId
-             JOIN guilds ON guilds.GuildId = guild_banned_words.GuildId
-             WHERE guilds.Guild = %s"""
-    val = (guild_id,)
-    cursor.execute(sql, val)
-    result = [x[0] for x in cursor.fetchall()]
-    cursor.close()
-    return result
-
-
-def add_banned_word(guild_id, word):
-    cursor = db.cursor()
-    sql = """"""
-    val = (guild_id, word)
-    cursor.execute(sql, val)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
+async def random_links_without_tags(limit=1, group_name=None, idol_name=None):
+    """Returns a list of tuples"""
+    if group_name:
+        g_id = find_group_id(group_name)
+        if not g_id:
+            return []
+        if idol_name:
+            m_id = find_member_id(g_id[0], idol_name)
+            if not m_id or m_id[0] not in link_sampler.untagged_by_member:
+                return []
+            pairs = [(x, m_id[0]) for x in link_sampler.untagged_by_member[m_id[0]].sample(limit)]
+        else:
+            if g_id[0] not in link_sampler.untagged_by_group:
+                return []
+            pairs = link_sampler.untagged_by_group[g_id[0]].sample(limit)
+    else:
+        pairs = link_sampler.untagged.sample(limit)
+    return [x[:3] for x in await rows_from_pairs(pairs)]
+
+
+# --- GUILD SETTINGS --- #
+
+
+class GuildSettings:
+    """Cached row of the guilds table, with the guilds banned words and restricted users.
+    banned_words is a frozenset that is replaced whenever the guilds words change, the lookups
+    find_banned_word uses are built again with it."""
+
+    __slots__ = ("prefix", "timer_limit", "banned_words", "banned_tokens", "banned_phrases", "longest_phrase",
+                 "restricted_users")
+
+    def __init__(self, prefix, timer_limit):
+        self.prefix = prefix
+        self.timer_limit = timer_limit
+        self.set_banned_words(())
+        self.restricted_users = set()
+
+    def set_banned_words(self, words):
+        self.banned_words = frozenset(words)
+        phrases = {banned_word_tokens(word): word for word in self.banned_words}
+        phrases.pop((), None)
+        # a word of one token is looked up by itself, longer ones by the run of tokens they start
+        self.banned_tokens = frozenset(tokens[0] for tokens in phrases if len(tokens) == 1)
+        self.banned_phrases = {tokens: word for tokens, word in phrases.items() if len(tokens) > 1}
+        self.longest_phrase = max(map(len, self.banned_phrases), default=0)
+
+
+guild_settings = {}  # Guild -> GuildSettings
+
+
+async def load_guild_settings():
+    """Reads the settings of every guild into guild_settings."""
+    settings = {}
+    async with db_cursor() as cursor:
+        await cursor.execute("SELECT Guild, Prefix, TimerLimit FROM guilds")
+        for guild_id, prefix, timer_limit in await cursor.fetchall():
+            settings[guild_id] = GuildSettings(prefix, timer_limit)
+        await cursor.execute("""SELECT guilds.Guild, Word FROM banned_words
+                                JOIN guild_banned_words ON banned_words.WordId = guild_banned_words.WordId
+                                JOIN guilds ON guilds.GuildId = guild_banned_words.GuildId""")
+        banned_words = {}
+        for guild_id, word in await cursor.fetchall():
+            banned_words.setdefault(guild_id, set()).add(normalise_banned_word(word))
+        for guild_id, words in banned_words.items():
+            settings[guild_id].set_banned_words(words)
+        await cursor.execute("""SELECT guilds.Guild, UserId FROM restricted_users
+                                JOIN guilds ON guilds.GuildId = restricted_users.GuildId""")
+        for guild_id, user_id in await cursor.fetchall():
+            settings[guild_id].restricted_users.add(user_id)
+    guild_settings.clear()
+    guild_settings.update(settings)
+    print(f"Loaded settings for {len(settings)} guilds.")
+
+
+async def add_guild_db(guild_id):
+    async with db_cursor() as cursor:
+        sql = """INSERT INTO guilds(Guild, Prefix, TimerLimit) VALUES(%s, %s, %s)"""
+        val = (guild_id, default_prefix, 10)
+        try:
+            await cursor.execute(sql, val)
+        except aiomysql.IntegrityError:
+            pass
+        rowcount = cursor.rowcount
+        if rowcount > 0:
+            guild_settings[guild_id] = GuildSettings(default_prefix, 10)
+        return rowcount > 0
 
 
-def find_restricted_user_db(guild_id, user_id):
-    cursor = db.cursor()
-    sql = """SELECT UserId FROM restricted_users
-             JOIN guilds ON guilds.GuildId = restricted_users.GuildId
-             WHERE guilds.Guild = %s AND UserId = %s"""
-    val = (guild_id, user_id,)
-    try:
-        cursor.execute(sql, val)
-    except Exception as e:
-        print(e)
-    rowcount = cursor.rowcount
-    cursor.close()
-    return rowcount > 0
+def get_prefix_db(guild_id):
+    """Returns the (Prefix,) of a guild from the settings cache."""
+    settings = guild_settings.get(guild_id)
+    if settings is None:
+        return None
+    return settings.prefix,
+
+
+async def set_guild_prefix_db(guild_id, prefix):
+    async with db_cursor() as cursor:
+        sql = """UPDATE guilds
+                    SET
+                        Prefix = %s
+                    WHERE
+                        Guild = %s"""
+        val = (prefix, guild_id,)
+        await cursor.execute(sql, val)
+        rowcount = cursor.rowcount
+        if rowcount > 0 and guild_id in guild_settings:
+            guild_settings[guild_id].prefix = prefix
+        return rowcount > 0
+
+
+async def set_guild_max_timer_db(max_time, guild_id):
+    async with db_cursor() as cursor:
+        sql = """UPDATE guilds
+                    SET
+                        TimerLimit = %s
+                    WHERE
+                        Guild = %s"""
+        val = (max_time, guild_id,)
+        try:
+            await cursor.execute(sql, val)
+        except Exception as e:
+            print(e)
+            return False
+        rowcount = cursor.rowcount
+        if rowcount > 0 and guild_id in guild_settings:
+            guild_settings[guild_id].timer_limit = int(max_time)
+        return rowcount > 0
 
 
-def add_restricted_user(guild_id, user_id):
-    cursor = db.cursor()
-    sql = """INSERT INTO restricted_users(GuildId, UserId) VALUES ((
-             SELECT GuildId FROM guilds WHERE Guild = %s), %s)"""
-    val = (guild_id, user_id,)
-    cursor.execute(sql, val)
-    rowcount = cursor.rowcount
-    cursor.close()
-    db.commit()
-    return rowcount > 0
+def get_guild_max_duration(guild_id):
+    """Returns the (TimerLimit,) of a guild from the settings cache."""
+    settings = guild_settings.get(guild_id)
+    if settings is None:
+        return None
+    return settings.timer_limit,
 
 
-def remove_restricted_user(guild_id, user_id):
-    cursor = db.cursor()
-    sql = """DELETE FROM restricted_users WHERE GuildId = ANY(SELECT GuildId FROM guilds WHERE Guild = %s)
-             AND UserId = %s"""
-    val = (guild_id, user_id,)
-    cursor.execute(sql, val)
-    rowcount = cursor.rowcount
-    cursor.close()
-    db.commit()
-    return rowcount > 0
+def get_banned_words(guild_id):
+    settings = guild_settings.get(guild_id)
+    if settings is None:
+        return frozenset()
+    return settings.banned_words
 
 
-def perma_user_db(user_id):
-    cursor = db.cursor()
-    sql = """INSERT INTO perma_users(UserId) VALUES (%s)"""
-    val = (user_id,)
-    cursor.execute(sql, val)
-    rowcount = cursor.rowcount
-    cursor.close()
-    db.commit()
-    return rowcount > 0
+def normalise_banned_word(word):
+    """Returns how a banned word is stored, lower case with single spaces between its words."""
+    return " ".join(word.lower().split())
 
 
-def find_perma_db(user_id):
-    cursor = db.cursor()
-    sql = """SELECT UserId FROM perma_users WHERE UserId = %s"""
-    val = (user_id,)
-    cursor.execute(sql, val)
-    result = cursor.fetchone()
-    cursor.close()
-    db.commit()
-    return result
-
-
-def remove_perma_user_db(user_id):
-    cursor = db.cursor()
-    sql = """DELETE FROM perma_users WHERE UserId = %s"""
-    val = (user_id,)
-    cursor.execute(sql, val)
-    rowcount = cursor.rowcount
-    cursor.close()
-    db.commit()
-    return rowcount > 0
+# a run of word characters or a single punctuation mark, so "c++" and "f.u" can be banned as well as words
+token_pattern = re.compile(r"\w+|[^\w\s]")
 
 
-def add_linked_channel_db(channel_id, group, idol):
-    cursor = db.cursor()
-    sql = """INSERT INTO linked_channels (ChannelId, GroupId, MemberId) VALUES (%s,
-             (SELECT GroupId FROM groupz_aliases WHERE Alias = %s),
-             (SELECT MemberId FROM member_aliases WHERE Alias = %s));"""
-    val = (channel_id, group, idol)
-    cursor.execute(sql, val)
-    rowcount = cursor.rowcount
-    cursor.close()
-    db.commit()
-    return rowcount > 0
+def banned_word_tokens(word):
+    return tuple(token_pattern.findall(word.lower()))
 
 
-def remove_linked_channel_db(channel_id):
-    cursor = db.cursor()
-    sql = """DELETE FROM linked_channels WHERE ChannelId = %s"""
-    val = (channel_id,)
-    cursor.execute(sql, val)
-    rowcount = cursor.rowcount
-    cursor.close()
-    db.commit()
-    return rowcount > 0
+def find_banned_word(guild_id, content):
+    """Returns the first banned word in the message, one set lookup per token and per phrase it could start."""
+    settings = guild_settings.get(guild_id)
+    if settings is None or not settings.banned_words:
+        return None
+    tokens = token_pattern.findall(content.lower())
+    for i, token in enumerate(tokens):
+        # longest first, so a phrase is found rather than a banned word it starts with
+        for n in range(min(settings.longest_phrase, len(tokens) - i), 1, -1):
+            word = settings.banned_phrases.get(tuple(tokens[i:i + n]))
+            if word is not None:
+                return word
+        if token in settings.banned_tokens:
+            return token
+    return None
+
+
+async def add_banned_word(guild_id, word):
+    word = normalise_banned_word(word)
+    async with db_cursor() as cursor:
+        await cursor.execute("INSERT IGNORE INTO banned_words(Word) VALUES (%s)", (word,))
+        sql = """INSERT INTO guild_banned_words(WordId, GuildId)
+                 SELECT banned_words.WordId, guilds.GuildId FROM banned_words, guilds
+                 WHERE banned_words.Word = %s AND guilds.Guild = %s
+                 AND NOT EXISTS (SELECT * FROM guild_banned_words
+                                 WHERE guild_banned_words.WordId = banned_words.WordId
+                                 AND guild_banned_words.GuildId = guilds.GuildId)"""
+        val = (word, guild_id)
+        await cursor.execute(sql, val)
+        rowcount = cursor.rowcount
+        if rowcount > 0 and guild_id in guild_settings:
+            guild_settings[guild_id].set_banned_words(guild_settings[guild_id].banned_words | {word})
+        return rowcount > 0
+
+
+async def remove_banned_word(guild_id, word):
+    word = normalise_banned_word(word)
+    async with db_cursor() as cursor:
+        sql = """DELETE guild_banned_words FROM guild_banned_words
+                 JOIN banned_words ON banned_words.WordId = guild_banned_words.WordId
+                 JOIN guilds ON guilds.GuildId = guild_banned_words.GuildId
+                 WHERE banned_words.Word = %s AND guilds.Guild = %s"""
+        val = (word, guild_id)
+        await cursor.execute(sql, val)
+        rowcount = cursor.rowcount
+        if rowcount > 0 and guild_id in guild_settings:
+            guild_settings[guild_id].set_banned_words(guild_settings[guild_id].banned_words - {word})
+        return rowcount > 0
 
 
-def get_twitter_users_from_db():
-    cursor = db.cursor()
-    sql = """SELECT Twitter FROM twitter"""
-    cursor.execute(sql)
-    result = [str(x[0]) for x in cursor.fetchall()]
-    cursor.close()
-    return result
-
-
-def add_twitter_channel_to_db(channel_id, twitter_id):
-    cursor = db.cursor()
-    sql = """INSERT INTO twitter_channels(ChannelId, TwitterId) VALUES (
-              (SELECT ChannelId FROM channels WHERE Channel = %s),
-              (SELECT TwitterId FROM twitter WHERE Twitter = %s))"""
-    vals = (channel_id, twitter_id)
-    try:
-        cursor.execute(sql, vals)
-    except Exception as e:
-        print(e)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
+def find_restricted_user_db(guild_id, user_id):
+    settings = guild_settings.get(guild_id)
+    return settings is not None and user_id in settings.restricted_users
+
+
+async def add_restricted_user(guild_id, user_id):
+    async with db_cursor() as cursor:
+        sql = """INSERT INTO restricted_users(GuildId, UserId) VALUES ((
+                 SELECT GuildId FROM guilds WHERE Guild = %s), %s)"""
+        val = (guild_id, user_id,)
+        await cursor.execute(sql, val)
+        rowcount = cursor.rowcount
+        if rowcount > 0 and guild_id in guild_settings:
+            guild_settings[guild_id].restricted_users.add(user_id)
+        return rowcount > 0
+
+
+async def remove_restricted_user(guild_id, user_id):
+    async with db_cursor() as cursor:
+        sql = """DELETE FROM restricted_users WHERE GuildId = ANY(SELECT GuildId FROM guilds WHERE Guild = %s)
+                 AND UserId = %s"""
+        val = (guild_id, user_id,)
+        await cursor.execute(sql, val)
+        rowcount = cursor.rowcount
+        if guild_id in guild_settings:
+            guild_settings[guild_id].restricted_users.discard(user_id)
+        return rowcount > 0
+
+
+async def perma_user_db(user_id):
+    async with db_cursor() as cursor:
+        sql = """INSERT INTO perma_users(UserId) VALUES (%s)"""
+        val = (user_id,)
+        await cursor.execute(sql, val)
+        rowcount = cursor.rowcount
+        return rowcount > 0
+
+
+async def find_perma_db(user_id):
+    async with db_cursor() as cursor:
+        sql = """SELECT UserId FROM perma_users WHERE UserId = %s"""
+        val = (user_id,)
+        await cursor.execute(sql, val)
+        result = await cursor.fetchone()
+        return result
+
+
+async def remove_perma_user_db(user_id):
+    async with db_cursor() as cursor:
+        sql = """DELETE FROM perma_users WHERE UserId = %s"""
+        val = (user_id,)
+        await cursor.execute(sql, val)
+        rowcount = cursor.rowcount
+        return rowcount > 0
+
+
+async def add_linked_channel_db(channel_id, group, idol):
+    async with db_cursor() as cursor:
+        sql = """INSERT INTO linked_channels (ChannelId, GroupId, MemberId) VALUES (%s,
+                 (SELECT GroupId FROM groupz_aliases WHERE Alias = %s),
+                 (SELECT MemberId FROM member_aliases WHERE Alias = %s));"""
+        val = (channel_id, group, idol)
+        await cursor.execute(sql, val)
+        rowcount = cursor.rowcount
+        return rowcount > 0
+
+
+async def remove_linked_channel_db(channel_id):
+    async with db_cursor() as cursor:
+        sql = """DELETE FROM linked_channels WHERE ChannelId = %s"""
+        val = (channel_id,)
+        await cursor.execute(sql, val)
+        rowcount = cursor.rowcount
+        return rowcount > 0
+
+
+async def get_twitter_users_from_db():
+    async with db_cursor() as cursor:
+        sql = """SELECT Twitter FROM twitter"""
+        await cursor.execute(sql)
+        result = [str(x[0]) for x in await cursor.fetchall()]
+        return result
+
+
+async def add_twitter_channel_to_db(channel_id, twitter_id):
+    async with db_cursor() as cursor:
+        sql = """INSERT INTO twitter_channels(ChannelId, TwitterId) VALUES (
+                  (SELECT ChannelId FROM channels WHERE Channel = %s),
+                  (SELECT TwitterId FROM twitter WHERE Twitter = %s))"""
+        vals = (channel_id, twitter_id)
+        try:
+            await cursor.execute(sql, vals)
+        except Exception as e:
+            print(e)
+        rowcount = cursor.rowcount
+    if rowcount > 0:
+        subscriptions.add("twitter", twitter_id, channel_id)
     return rowcount > 0
 
 
-def add_twitter_to_db(twitter_id):
-    cursor = db.cursor()
-    sql = """INSERT INTO twitter(Twitter) VALUES(%s)"""
-    vals = (twitter_id,)
-    try:
-        cursor.execute(sql, vals)
-    except mysql.connector.errors.IntegrityError:
-        return
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
+async def add_twitter_to_db(twitter_id):
+    async with db_cursor() as cursor:
+        sql = """INSERT INTO twitter(Twitter) VALUES(%s)"""
+        vals = (twitter_id,)
+        try:
+            await cursor.execute(sql, vals)
+        except aiomysql.IntegrityError:
+            return
+        rowcount = cursor.rowcount
+        return rowcount > 0
+
+
+async def remove_twitter_user_from_db(channel_id, twitter_id):
+    async with db_cursor() as cursor:
+        sql = """DELETE twitter_channels FROM twitter_channels
+                 JOIN twitter ON twitter.TwitterId = twitter_channels.TwitterId
+                 JOIN channels ON channels.ChannelId = twitter_channels.ChannelId
+                 WHERE twitter.Twitter = %s AND channels.Channel = %s;"""
+        vals = (twitter_id, channel_id)
+        await cursor.execute(sql, vals)
+        rowcount = cursor.rowcount
+    if rowcount > 0:
+        subscriptions.remove("twitter", twitter_id, channel_id)
     return rowcount > 0
 
 
-def remove_twitter_user_from_db(channel_id, twitter_id):
-    cursor = db.cursor()
-    sql = """DELETE twitter_channels FROM twitter_channels
-             JOIN twitter ON twitter.TwitterId = twitter_channels.TwitterId
-             JOIN channels ON channels.ChannelId = twitter_channels.ChannelId
-             WHERE twitter.Twitter = %s AND channels.Channel = %s;"""
-    vals = (twitter_id, channel_id)
-    cursor.execute(sql, vals)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
+async def get_all_twitters_followed_in_guild(guild_id):
+    async with db_cursor() as cursor:
+        sql = """SELECT Channel, Twitter, Handle FROM channels
+                 JOIN twitter_channels on twitter_channels.ChannelId = channels.ChannelId
+                 JOIN twitter on twitter.TwitterId = twitter_channels.TwitterId
+                 WHERE channels.Guild = %s
+                 ORDER BY Channel"""
+        await cursor.execute(sql, (guild_id,))
+        result = await cursor.fetchall()
+        return result
+
+
+async def get_insta_users_to_check():
+    async with db_cursor() as cursor:
+        sql = "SELECT Instagram FROM instagram;"
+        await cursor.execute(sql)
+        result = [x[0] for x in await cursor.fetchall()]
+        return result
+
+
+async def add_insta_user_to_db(user_id):
+    async with db_cursor() as cursor:
+        sql = "INSERT INTO instagram (Instagram, MinTimestamp) VALUES (%s, UNIX_TIMESTAMP());"
+        val = (user_id,)
+        try:
+            await cursor.execute(sql, val)
+        except Exception as e:
+            print(e)
+        rowcount = cursor.rowcount
+        return rowcount > 0
+
+
+async def follow_insta_user_db(user_id, channel_id):
+    async with db_cursor() as cursor:
+        sql = """INSERT INTO instagram_channels (InstagramId, ChannelId) VALUES(
+                 (SELECT InstagramId FROM instagram WHERE Instagram = %s), 
+                 (SELECT ChannelId FROM channels WHERE Channel = %s))"""
+        vals = (user_id, channel_id)
+        try:
+            await cursor.execute(sql, vals)
+        except Exception as e:
+            print(e)
+        result = cursor.rowcount
+    if result > 0:
+        subscriptions.add("instagram", user_id, channel_id)
+    return result > 0
 
 
-def get_twitter_channels_following_user(twitter_id):
-    cursor = db.cursor()
-    sql = """SELECT Channel FROM channels
-             JOIN twitter_channels on twitter_channels.ChannelId = channels.ChannelId
-             JOIN twitter on twitter.TwitterId = twitter_channels.TwitterId
-             WHERE twitter.Twitter = %s;"""
-    vals = (twitter_id,)
-    cursor.execute(sql, vals)
-    result = [x[0] for x in cursor.fetchall()]
-    cursor.close()
-    return result
-
-
-def get_all_twitter_channels_and_twitters():
-    cursor = db.cursor()
-    sql = """SELECT Channel, Twitter FROM twitter_channels
-             JOIN channels on channels.ChannelId = twitter_channels.ChannelId 
-             JOIN twitter on twitter.TwitterId = twitter_channels.TwitterId
-             ORDER BY Channel"""
-    cursor.execute(sql)
-    result = cursor.fetchall()
-    cursor.close()
-    return result
-
-
-def get_insta_users_to_check():
-    cursor = db.cursor()
-    sql = "SELECT Instagram FROM instagram;"
-    cursor.execute(sql)
-    result = [x[0] for x in cursor.fetchall()]
-    cursor.close()
-    return result
-
-
-def add_insta_user_to_db(user_id):
-    cursor = db.cursor()
-    sql = "INSERT INTO instagram (Instagram, MinTimestamp) VALUES (%s, UNIX_TIMESTAMP());"
-    val = (user_id,)
-    try:
-        cursor.execute(sql, val)
-    except Exception as e:
-        print(e)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
+async def set_min_timestamp(insta_id, timestamp):
+    async with db_cursor() as cursor:
+        sql = """UPDATE instagram
+                 SET MinTimestamp = %s
+                 WHERE Instagram = %s"""
+        vals = (timestamp, insta_id)
+        await cursor.execute(sql, vals)
+        rowcount = cursor.rowcount
+        return rowcount > 0
+
+
+async def get_min_timestamp(insta_id):
+    async with db_cursor() as cursor:
+        sql = """SELECT MinTimestamp FROM instagram WHERE Instagram = %s"""
+        vals = (insta_id,)
+        await cursor.execute(sql, vals)
+        result = await cursor.fetchone()
+        return result[0]
+
+
+async def unfollow_insta_user_db(user_id, channel_id):
+    async with db_cursor() as cursor:
+        sql = """DELETE instagram_channels FROM instagram_channels
+                 JOIN instagram ON instagram.InstagramId = instagram_channels.InstagramId
+                 JOIN channels ON channels.ChannelId = instagram_channels.ChannelId
+                 WHERE instagram.Instagram = %s AND channels.Channel = %s;"""
+        vals = (user_id, channel_id)
+        await cursor.execute(sql, vals)
+        rowcount = cursor.rowcount
+    if rowcount > 0:
+        subscriptions.remove("instagram", user_id, channel_id)
     return rowcount > 0
 
 
-def follow_insta_user_db(user_id, channel_id):
-    cursor = db.cursor()
-    sql = """INSERT INTO instagram_channels (InstagramId, ChannelId) VALUES(
-             (SELECT InstagramId FROM instagram WHERE Instagram = %s), 
-             (SELECT ChannelId FROM channels WHERE Channel = %s))"""
-    vals = (user_id, channel_id)
-    try:
-        cursor.execute(sql, vals)
-    except Exception as e:
-        print(e)
-    result = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return result > 0
+async def get_all_instas_followed_in_guild(guild_id):
+    async with db_cursor() as cursor:
+        sql = """SELECT Channel, Instagram, Handle FROM channels
+                 JOIN instagram_channels on instagram_channels.ChannelId = channels.ChannelId
+                 JOIN instagram on instagram.InstagramId = instagram_channels.InstagramId
+                 WHERE channels.Guild = %s
+                 ORDER BY Channel"""
+        await cursor.execute(sql, (guild_id,))
+        result = await cursor.fetchall()
+        return result
+
+
+async def add_twitch_channel_to_db(twitch_id):
+    async with db_cursor() as cursor:
+        sql = "INSERT INTO twitch(Twitch, LastLive) VALUES (%s, NOW());"
+        val = (twitch_id,)
+        try:
+            await cursor.execute(sql, val)
+        except Exception as e:
+            print(e)
+        rowcount = cursor.rowcount
+        return rowcount > 0
+
+
+async def follow_twitch_channel_db(channel_id, twitch_id):
+    async with db_cursor() as cursor:
+        sql = """INSERT INTO twitch_channels(ChannelId, TwitchId) VALUES(
+                 (SELECT ChannelId FROM channels WHERE Channel = %s),
+                 (SELECT TwitchId FROM twitch WHERE Twitch = %s))"""
+        val = (channel_id, twitch_id)
+        await cursor.execute(sql, val)
+        rowcount = cursor.rowcount
+    if rowcount > 0:
+        subscriptions.add("twitch", twitch_id, channel_id)
+    return rowcount > 0
 
 
-def get_channels_following_insta_user(user_id):
-    cursor = db.cursor()
-    sql = """SELECT Channel FROM channels
-             JOIN instagram_channels on instagram_channels.ChannelId = channels.ChannelId
-             JOIN instagram on instagram.InstagramId = instagram_channels.InstagramId
-             WHERE instagram.Instagram = %s;"""
-    val = (user_id,)
-    cursor.execute(sql, val)
-    result = [x[0] for x in cursor.fetchall()]
-    cursor.close()
-    return result
-
-
-def set_min_timestamp(insta_id, timestamp):
-    cursor = db.cursor()
-    sql = """UPDATE instagram
-             SET MinTimestamp = %s
-             WHERE Instagram = %s"""
-    vals = (timestamp, insta_id)
-    cursor.execute(sql, vals)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
+async def unfollow_twitch_channel_db(channel_id, twitch_id):
+    async with db_cursor() as cursor:
+        sql = """DELETE tc FROM twitch_channels tc
+                 JOIN channels c ON c.ChannelId = tc.ChannelId
+                 JOIN twitch t ON t.TwitchId = tc.TwitchId
+                 WHERE c.Channel = %s AND t.Twitch = %s"""
+        val = (channel_id, twitch_id)
+        await cursor.execute(sql, val)
+        rowcount = cursor.rowcount
+    if rowcount > 0:
+        subscriptions.remove("twitch", twitch_id, channel_id)
     return rowcount > 0
 
 
-def get_min_timestamp(insta_id):
-    cursor = db.cursor()
-    sql = """SELECT MinTimestamp FROM instagram WHERE Instagram = %s"""
-    vals = (insta_id,)
-    cursor.execute(sql, vals)
-    result = cursor.fetchone()
-    db.commit()
-    cursor.close()
-    return result[0]
-
-
-def unfollow_insta_user_db(user_id, channel_id):
-    cursor = db.cursor()
-    sql = """DELETE instagram_channels FROM instagram_channels
-             JOIN instagram ON instagram.InstagramId = instagram_channels.InstagramId
-             JOIN channels ON channels.ChannelId = instagram_channels.ChannelId
-             WHERE instagram.Instagram = %s AND channels.Channel = %s;"""
-    vals = (user_id, channel_id)
-    cursor.execute(sql, vals)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
+async def get_all_twitch_channels_to_check(hour=1):
+    """Returns a list of all twitch ids that have not been live in the last hour"""
+    async with db_cursor() as cursor:
+        sql = """SELECT Twitch, LastLive FROM twitch WHERE LastLive < NOW() - INTERVAL %s HOUR;"""
+        val = (str(hour),)
+        await cursor.execute(sql, val)
+        result = dict(await cursor.fetchall())
+        return result
 
 
-def get_all_instas_followed_in_guild():
-    cursor = db.cursor()
-    sql = """SELECT Channel, Instagram FROM instagram_channels
-             JOIN channels on channels.ChannelId = instagram_channels.ChannelId 
-             JOIN instagram on instagram.InstagramId = instagram_channels.InstagramId
-             ORDER BY Channel"""
-    cursor.execute(sql)
-    result = cursor.fetchall()
-    cursor.close()
-    return result
-
-
-def add_twitch_channel_to_db(twitch_id):
-    cursor = db.cursor()
-    sql = "INSERT INTO twitch(Twitch, LastLive) VALUES (%s, NOW());"
-    val = (twitch_id,)
-    try:
-        cursor.execute(sql, val)
-    except Exception as e:
-        print(e)
-    db.commit()
-    rowcount = cursor.rowcount
-    cursor.close()
-    return rowcount > 0
+async def get_all_twitch_followed_in_guild(guild_id):
+    async with db_cursor() as cursor:
+        sql = """SELECT Channel, Twitch, Handle FROM channels
+                 JOIN twitch_channels on twitch_channels.ChannelId = channels.ChannelId
+                 JOIN twitch on twitch.TwitchId = twitch_channels.TwitchId
+                 WHERE channels.Guild = %s
+                 ORDER BY Channel"""
+        await cursor.execute(sql, (guild_id,))
+        result = await cursor.fetchall()
+        return result
 
 
-def follow_twitch_channel_db(channel_id, twitch_id):
-    cursor = db.cursor()
-    sql = """INSERT INTO twitch_channels(ChannelId, TwitchId) VALUES(
-             (SELECT ChannelId FROM channels WHERE Channel = %s),
-             (SELECT TwitchId FROM twitch WHERE Twitch = %s))"""
-    val = (channel_id, twitch_id)
-    cursor.execute(sql, val)
-    db.commit()
-    rowcount = cursor.rowcount
-    cursor.close()
-    return rowcount > 0
+# table -> column of the id an account has on its site, for the tables that cache account handles
+handle_tables = {"twitch": "Twitch", "twitter": "Twitter", "instagram": "Instagram"}
 
 
-def unfollow_twitch_channel_db(channel_id, twitch_id):
-    cursor = db.cursor()
-    sql = """DELETE tc FROM twitch_channels tc
-             JOIN channels c ON c.ChannelId = tc.ChannelId
-             JOIN twitch t ON t.TwitchId = tc.TwitchId
-             WHERE c.Channel = %s AND t.Twitch = %s"""
-    val = (channel_id, twitch_id)
-    cursor.execute(sql, val)
-    db.commit()
-    rowcount = cursor.rowcount
-    cursor.close()
-    return rowcount > 0
+async def set_handles(table, handles):
+    """Stores the handles of {account id: handle} in table, with one statement."""
+    if not handles:
+        return
+    column = handle_tables[table]
+    cases = " ".join(["WHEN %s THEN %s"] * len(handles))
+    async with db_cursor() as cursor:
+        sql = f"""UPDATE {table} SET Handle = CASE {column} {cases} END, HandleUpdated = NOW()
+                  WHERE {column} IN ({", ".join(["%s"] * len(handles))})"""
+        await cursor.execute(sql, [x for pair in handles.items() for x in pair] + list(handles))
+
+
+async def get_stale_handles(table, hours):
+    """Returns the account ids in table whose handle was never looked up, or not in the last hours."""
+    column = handle_tables[table]
+    async with db_cursor() as cursor:
+        sql = f"""SELECT {column} FROM {table}
+                  WHERE HandleUpdated IS NULL OR HandleUpdated < NOW() - INTERVAL %s HOUR"""
+        await cursor.execute(sql, (hours,))
+        result = [x[0] for x in await cursor.fetchall()]
+        return result
+
+
+async def update_twitch_last_lives(last_lives):
+    """Sets LastLive of every twitch id in {twitch id: datetime} with one statement."""
+    if not last_lives:
+        return
+    cases = " ".join(["WHEN %s THEN %s"] * len(last_lives))
+    async with db_cursor() as cursor:
+        # an UPDATE, so a stream unfollowed while the poll was running is not added back
+        sql = f"""UPDATE twitch SET LastLive = CASE Twitch {cases} END
+                  WHERE Twitch IN ({", ".join(["%s"] * len(last_lives))})"""
+        await cursor.execute(sql, [x for pair in last_lives.items() for x in pair] + list(last_lives))
 
 
-def get_all_twitch_channels_to_check(hour=1):
-    """Returns a list of all twitch ids that have not been live in the last hour"""
-    cursor = db.cursor()
-    sql = """SELECT Twitch, LastLive FROM twitch WHERE LastLive < NOW() - INTERVAL %s HOUR;"""
-    val = (str(hour),)
-    cursor.execute(sql, val)
-    result = dict(cursor.fetchall())
-    cursor.close()
-    return result
-
-
-def get_channels_following_twitch_stream(twitch_id):
-    cursor = db.cursor()
-    sql = """SELECT Channel FROM channels c
-             JOIN twitch_channels tc ON c.ChannelId = tc.ChannelId
-             JOIN twitch t ON t.TwitchId = tc.TwitchId
-             WHERE t.Twitch = %s"""
-    val = (twitch_id,)
-    cursor.execute(sql, val)
-    result = [x[0] for x in cursor.fetchall()]
-    cursor.close()
-    return result
-
-
-def get_all_twitch_followed_in_guild():
-    cursor = db.cursor()
-    sql = """SELECT Channel, Twitch FROM twitch_channels
-             JOIN channels on channels.ChannelId = twitch_channels.ChannelId 
-             JOIN twitch on twitch.TwitchId = twitch_channels.TwitchId
-             ORDER BY Channel"""
-    cursor.execute(sql)
-    result = cursor.fetchall()
-    cursor.close()
-    return result
-
-
-def update_twitch_last_live(twitch_id, time):
-    cursor = db.cursor()
-    sql = """UPDATE twitch
-                SET
-                    LastLive = %s
-                WHERE
-                    Twitch = %s"""
-    val = (time, twitch_id)
-    cursor.execute(sql, val)
-    rowcount = cursor.rowcount
-    db.commit()
-    cursor.close()
-    return rowcount > 0
 # def get_all_links_from_group(group_name):
 #     cursor = db.cursor()
 #     sql = """"""
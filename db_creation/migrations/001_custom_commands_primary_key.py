@@ -0,0 +1,38 @@
+# Gives custom_commands a primary key, scoped by guild.
+# GuildId 0 is a command that works in every server, which is every command added before this migration.
+# The rows are copied into a new table that is swapped in with one RENAME TABLE, so the commands are never
+# missing. Each step checks what an interrupted run left behind, so the migration can be run again.
+
+create_table = """CREATE TABLE {} (
+                    GuildId bigint NOT NULL DEFAULT 0,
+                    CommandName varchar(255) CHARACTER SET utf32 COLLATE utf32_general_ci NOT NULL,
+                    Command varchar(255) CHARACTER SET utf32 COLLATE utf32_general_ci NOT NULL,
+                    AddedBy bigint DEFAULT NULL,
+                    PRIMARY KEY (GuildId, CommandName)
+                  )"""
+
+
+def table_exists(cursor, name):
+    cursor.execute("SHOW TABLES LIKE %s", (name,))
+    return bool(cursor.fetchall())
+
+
+def migrate(cursor):
+    if table_exists(cursor, "custom_commands"):
+        cursor.execute("SHOW COLUMNS FROM custom_commands LIKE 'GuildId'")
+        if not cursor.fetchall():
+            # a copy left by an interrupted run may be incomplete, start it again
+            cursor.execute("DROP TABLE IF EXISTS custom_commands_new")
+            cursor.execute(create_table.format("custom_commands_new"))
+            cursor.execute("""INSERT IGNORE INTO custom_commands_new(GuildId, CommandName, Command, AddedBy)
+                              SELECT 0, CommandName, Command, AddedBy FROM custom_commands
+                              WHERE CommandName IS NOT NULL AND Command IS NOT NULL""")
+            cursor.execute("DROP TABLE IF EXISTS custom_commands_old")
+            cursor.execute("""RENAME TABLE custom_commands TO custom_commands_old,
+                                           custom_commands_new TO custom_commands""")
+    elif table_exists(cursor, "custom_commands_new"):
+        # the old table was dropped before the copy was renamed, the copy is all there is
+        cursor.execute("RENAME TABLE custom_commands_new TO custom_commands")
+    else:
+        cursor.execute(create_table.format("custom_commands"))
+    cursor.execute("DROP TABLE IF EXISTS custom_commands_old")
@@ -0,0 +1,36 @@
+-- Indexes for the columns that links, aliases and tags are looked up by.
+-- custom_commands is covered by its (GuildId, CommandName) primary key from 001.
+
+CREATE INDEX Link ON links (Link);
+
+CREATE INDEX Alias ON groupz_aliases (Alias);
+
+CREATE INDEX Alias ON member_aliases (Alias);
+
+CREATE INDEX Alias ON tag_aliases (Alias);
+
+-- Tags with the same name, as the index compares them, are merged into the oldest one before it is made unique.
+-- Their links and aliases move to the kept tag, deleting the duplicate cascades to the link_tags rows left behind.
+DROP TABLE IF EXISTS tag_duplicates;
+
+CREATE TABLE tag_duplicates AS
+  SELECT tags.TagId, kept.TagId AS KeptId
+  FROM tags
+  JOIN (SELECT TagName, MIN(TagId) AS TagId FROM tags GROUP BY TagName) AS kept
+    ON kept.TagName = tags.TagName AND kept.TagId <> tags.TagId;
+
+INSERT IGNORE INTO link_tags (LinkId, TagId)
+  SELECT link_tags.LinkId, tag_duplicates.KeptId
+  FROM link_tags
+  JOIN tag_duplicates ON tag_duplicates.TagId = link_tags.TagId;
+
+UPDATE tag_aliases
+  JOIN tag_duplicates ON tag_duplicates.TagId = tag_aliases.TagId
+  SET tag_aliases.TagId = tag_duplicates.KeptId;
+
+DELETE tags FROM tags
+  JOIN tag_duplicates ON tag_duplicates.TagId = tags.TagId;
+
+DROP TABLE tag_duplicates;
+
+CREATE UNIQUE INDEX TagName ON tags (TagName);
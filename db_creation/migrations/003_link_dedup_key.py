@@ -0,0 +1,35 @@
+from canonical import canonicalise
+
+# Adds links.LinkKey, the canonical identity of a link from canonical.py.
+# Links that share a key are merged into the oldest one, then the key is made unique
+# so a duplicate is found with one index probe instead of a failed insert.
+
+
+def migrate(cursor):
+    cursor.execute("SHOW COLUMNS FROM links LIKE 'LinkKey'")
+    if not cursor.fetchall():
+        cursor.execute("""ALTER TABLE links
+                          ADD COLUMN LinkKey varchar(320) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin DEFAULT NULL""")
+    cursor.execute("SELECT LinkId, Link FROM links ORDER BY LinkId")
+    kept = {}  # LinkKey -> LinkId of the oldest link with it
+    merges = []  # (duplicate LinkId, kept LinkId)
+    for link_id, link in cursor.fetchall():
+        canonical = canonicalise(link)
+        if canonical is None:
+            continue
+        if canonical.key in kept:
+            merges.append((link_id, kept[canonical.key]))
+        else:
+            kept[canonical.key] = link_id
+    print(f"  merging {len(merges)} duplicate link(s)")
+    for duplicate_id, kept_id in merges:
+        cursor.execute("""INSERT IGNORE INTO link_members(LinkId, MemberId)
+                          SELECT %s, MemberId FROM link_members WHERE LinkId = %s""", (kept_id, duplicate_id))
+        cursor.execute("""INSERT IGNORE INTO link_tags(LinkId, TagId)
+                          SELECT %s, TagId FROM link_tags WHERE LinkId = %s""", (kept_id, duplicate_id))
+        cursor.execute("DELETE FROM links WHERE LinkId = %s", (duplicate_id,))
+    print(f"  setting the key of {len(kept)} link(s)")
+    cursor.executemany("UPDATE links SET LinkKey = %s WHERE LinkId = %s", list(kept.items()))
+    cursor.execute("SHOW INDEX FROM links WHERE Key_name = 'LinkKey'")
+    if not cursor.fetchall():
+        cursor.execute("CREATE UNIQUE INDEX LinkKey ON links (LinkKey)")
@@ -0,0 +1,14 @@
+-- Caches the handle of every followed account, so listing them in a server needs no api calls.
+-- HandleUpdated is when the handle was last looked up, the cogs refresh the ones older than handle_ttl_hours.
+
+ALTER TABLE twitch
+  ADD COLUMN Handle varchar(255) DEFAULT NULL,
+  ADD COLUMN HandleUpdated datetime DEFAULT NULL;
+
+ALTER TABLE twitter
+  ADD COLUMN Handle varchar(255) DEFAULT NULL,
+  ADD COLUMN HandleUpdated datetime DEFAULT NULL;
+
+ALTER TABLE instagram
+  ADD COLUMN Handle varchar(255) DEFAULT NULL,
+  ADD COLUMN HandleUpdated datetime DEFAULT NULL;
@@ -0,0 +1,6 @@
+-- Records the guild of every channel, so a server's follows can be listed without reading every server's.
+-- Channels added before this get their guild filled in by the bot the next time it starts.
+
+ALTER TABLE channels ADD COLUMN Guild bigint DEFAULT NULL;
+
+CREATE INDEX Guild ON channels (Guild);
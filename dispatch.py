@@ -0,0 +1,105 @@
+import asyncio
+from collections import deque
+
+import discord
+
+# Every message the bot posts on its own, rather than in reply to a command, goes through here.
+# Each channel has a queue drained by its own task, so a slow channel only holds up itself.
+# discord.py rate limits per route and a channel's messages are one route, so one send in flight per
+# channel never waits on a bucket, the semaphore keeps all of them under the global limit.
+
+# discord's limit on the length of a message
+max_message_length = 2000
+# the error code of a channel that does not exist
+unknown_channel = 10003
+
+
+class Dispatcher:
+    """Per channel message queues sent with bounded concurrency.
+    Text messages queued back to back for a channel are joined into as few messages as fit.
+    Channels discord says no longer exist are collected and handed to remove_dead in one go,
+    a channel that is only missing from the cache is never removed."""
+
+    def __init__(self, client, remove_dead, concurrency=16, cleanup_delay=10):
+        self.client = client
+        self.remove_dead = remove_dead  # coroutine function, called with a list of discord channel ids
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.cleanup_delay = cleanup_delay
+        self.queues = {}  # channel id -> deque of (content, embed)
+        self.workers = {}  # channel id -> task draining its queue
+        self.dead = set()
+        self.cleanup = None
+
+    def send(self, channel_id, content=None, embed=None):
+        """Queues a message to a channel, messages to one channel are sent in the order they were queued."""
+        channel_id = int(channel_id)
+        self.queues.setdefault(channel_id, deque()).append((content, embed))
+        if channel_id not in self.workers:
+            self.workers[channel_id] = self.client.loop.create_task(self._drain(channel_id))
+
+    def fan_out(self, channel_ids, content=None, embed=None):
+        """Queues the same message to every channel, the embed is shared so it must not be changed after."""
+        for channel_id in channel_ids:
+            self.send(channel_id, content, embed)
+
+    @staticmethod
+    def _next_message(queue):
+        content, embed = queue.popleft()
+        if embed is None and content:
+            # join the text messages after it, as long as they fit in one message
+            while queue and queue[0][1] is None and queue[0][0] \
+                    and len(content) + len(queue[0][0]) < max_message_length:
+                content += "\n" + queue.popleft()[0]
+        return content, embed
+
+    async def _drain(self, channel_id):
+        queue = self.queues[channel_id]
+        try:
+            channel = self.client.get_channel(channel_id)
+            if channel is None:
+                # missing from the cache is not gone, its guild may be unavailable or still loading
+                async with self.semaphore:
+                    try:
+                        channel = await self.client.fetch_channel(channel_id)
+                    except discord.NotFound as e:
+                        if e.code == unknown_channel:
+                            self._mark_dead(channel_id)
+                        return
+                    except discord.HTTPException as e:
+                        print(f"Could not find channel {channel_id}, dropped {len(queue)} messages: {e}")
+                        return
+            while queue:
+                content, embed = self._next_message(queue)
+                async with self.semaphore:
+                    try:
+                        await channel.send(content=content, embed=embed)
+                    except discord.NotFound as e:
+                        if e.code == unknown_channel:
+                            self._mark_dead(channel_id)
+                        else:
+                            print(f"Could not send a message to {channel_id}: {e}")
+                        return
+                    except discord.Forbidden:
+                        print(f"Missing permissions to send in {channel_id}, dropped {len(queue) + 1} messages")
+                        return
+                    except discord.HTTPException as e:
+                        print(f"Could not send a message to {channel_id}: {e}")
+        finally:
+            self.queues.pop(channel_id, None)
+            self.workers.pop(channel_id, None)
+
+    def _mark_dead(self, channel_id):
+        self.dead.add(channel_id)
+        if self.cleanup is None:
+            self.cleanup = self.client.loop.create_task(self._remove_dead())
+
+    async def _remove_dead(self):
+        # wait a little, so a fan out that finds many dead channels removes them together
+        await asyncio.sleep(self.cleanup_delay)
+        dead, self.dead = list(self.dead), set()
+        self.cleanup = None
+        try:
+            await self.remove_dead(dead)
+            print(f"Removed {len(dead)} deleted channels")
+        except Exception as e:
+            print(f"Could not remove deleted channels: {e}")
@@ -1,6 +1,7 @@
 import mysql.connector.errors as errors
 import mysql.connector as conn
 import json
+from canonical import canonicalise
 
 
 with open('directories.json') as direc:
@@ -77,20 +78,16 @@ for group in gfys_dict["groups"]:
             print(e)
         # add links to links table
         for link in gfys_dict["groups"][group][member]:
-            if link.endswith("/"):
-                link = link[:-1]
-            if link.startswith("https://gfycat.com/"):
-                split = link.split("/")
-                if "-" in split[-1]:
-                    split[-1] = split[-1].split("-")
-                    split[-1] = split[-1][0]
-                link = "https://gfycat.com/" + split[-1]
-            lsql = "INSERT INTO links(Link, AddedBy) VALUES (%s, %s);"
-            valz = (link, my_id)
+            canonical = canonicalise(link)
+            if canonical is None:
+                print(f"skipped unknown link {link}")
+                continue
+            # the unique LinkKey makes a link that is already there a no-op
+            lsql = "INSERT IGNORE INTO links(Link, LinkKey, AddedBy) VALUES (%s, %s, %s);"
+            valz = (canonical.url, canonical.key, my_id)
             cursor.execute(lsql, valz)
-            # MIGHT BE SOME ERROR HERE #############################################################
-            lidsql = "SELECT * FROM links WHERE Link = (%s);"
-            cursor.execute(lidsql, (link,))
+            lidsql = "SELECT LinkId FROM links WHERE LinkKey = (%s);"
+            cursor.execute(lidsql, (canonical.key,))
             lid = cursor.fetchone()[0]
             # add to link_members table
             lmsql = "INSERT INTO link_members(LinkId, MemberId) VALUES (%s, %s);"
@@ -112,17 +109,11 @@ for tag in gfys_dict["tags"]:
     cursor.execute(alias_sql, (t_id, tag, my_id))
     # add to links_tags table
     for link in gfys_dict["tags"][tag]:
-        # MIGHT BE SOME ERROR HERE #############################################################
-        if link.endswith("/"):
-            link = link[:-1]
-        if link.startswith("https://gfycat.com/"):
-            split = link.split("/")
-            if "-" in split[-1]:
-                split[-1] = split[-1].split("-")
-                split[-1] = split[-1][0]
-            link = "https://gfycat.com/" + split[-1]
-        jkl = "SELECT * FROM links WHERE Link = (%s);"
-        cursor.execute(jkl, (link,))
+        canonical = canonicalise(link)
+        if canonical is None:
+            continue
+        jkl = "SELECT * FROM links WHERE LinkKey = (%s);"
+        cursor.execute(jkl, (canonical.key,))
         linkrow = cursor.fetchone()
         if linkrow is not None:
             l_id = linkrow[0]
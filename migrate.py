@@ -0,0 +1,106 @@
+import os
+import sys
+import json
+import importlib.util
+import mysql.connector as conn
+import mysql.connector.errors as errors
+from setup import get_directories_path
+
+# Applies the scripts in db_creation/migrations that have not been run against the database yet.
+# A migration is either a .sql script or a .py module with a migrate(cursor) function.
+# Usage: python migrate.py          apply every pending migration
+#        python migrate.py status   list the migrations and whether they are applied
+
+baseline_path = os.path.join("db_creation", "db_creation.sql")
+migrations_path = os.path.join("db_creation", "migrations")
+
+# duplicate index or column, the statement was already run by an earlier attempt
+already_applied_errors = (1060, 1061)
+
+
+def split_statements(script):
+    """Splits a sql script into statements, dropping comment lines."""
+    lines = [x for x in script.splitlines() if not x.strip().startswith("--")]
+    return [x.strip() for x in "\n".join(lines).split(";") if x.strip()]
+
+
+def run_script(cursor, path):
+    if path.endswith(".py"):
+        spec = importlib.util.spec_from_file_location(os.path.basename(path)[:-3], path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.migrate(cursor)
+        return
+    with open(path) as file:
+        statements = split_statements(file.read())
+    for statement in statements:
+        try:
+            cursor.execute(statement)
+        except errors.DatabaseError as e:
+            if e.errno not in already_applied_errors:
+                raise
+            print(f"  skipped, already applied: {e.msg}")
+
+
+def get_migrations():
+    """Returns (version, name, path) of every migration, ordered by version."""
+    migrations = []
+    for name in os.listdir(migrations_path):
+        if name.endswith((".sql", ".py")):
+            migrations.append((int(name.split("_")[0]), name, os.path.join(migrations_path, name)))
+    return sorted(migrations)
+
+
+def get_applied_versions(cursor):
+    cursor.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+                        Version int NOT NULL,
+                        Name varchar(255) NOT NULL,
+                        AppliedAt datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (Version)
+                      )""")
+    cursor.execute("SELECT Version FROM schema_migrations")
+    return {x[0] for x in cursor.fetchall()}
+
+
+def migrate(cursor):
+    cursor.execute("SHOW TABLES LIKE 'users'")
+    if not cursor.fetchall():
+        print(f"Empty database, running {baseline_path}")
+        run_script(cursor, baseline_path)
+    applied = get_applied_versions(cursor)
+    pending = [x for x in get_migrations() if x[0] not in applied]
+    for version, name, path in pending:
+        print(f"Applying {name}")
+        run_script(cursor, path)
+        cursor.execute("INSERT INTO schema_migrations(Version, Name) VALUES (%s, %s)", (version, name))
+    print(f"Applied {len(pending)} migration(s), the database is up to date.")
+
+
+def status(cursor):
+    applied = get_applied_versions(cursor)
+    for version, name, _ in get_migrations():
+        print(f"{'applied' if version in applied else 'pending'}  {name}")
+
+
+if __name__ == "__main__":
+    with open(get_directories_path) as direc:
+        direc_dict = json.load(direc)
+    with open(direc_dict["apis"], 'r') as apis:
+        apis_dict = json.load(apis)
+    db = conn.connect(
+        host="localhost",
+        user=apis_dict["database_user"],
+        passwd=apis_dict["database_password"],
+        database=apis_dict["database_name"],
+        auth_plugin='mysql_native_password',
+        autocommit=True
+    )
+    cursor = db.cursor(buffered=True)
+    try:
+        if sys.argv[1:] == ["status"]:
+            status(cursor)
+        else:
+            migrate(cursor)
+    finally:
+        cursor.close()
+        db.close()
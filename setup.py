@@ -43,6 +43,22 @@ if __name__ == "__main__":
         "database_name" : data_base_name,
         "database_user" : data_base_user,
         "database_password" : data_base_pass,
+        "database_pool_min_size" : 1,
+        "database_pool_max_size" : 10,
+        "link_cache_max_bytes" : 33554432,
+        "xp_flush_interval" : 30,
+        "xp_flush_size" : 500,
+        "state_flush_interval" : 5,
+        "state_compact_after" : 10000,
+        "reddit_poll_interval" : 600,
+        "reddit_concurrency" : 8,
+        "dispatch_concurrency" : 16,
+        "handle_ttl_hours" : 24,
+        "shuffle_bag_max_keys" : 50000,
+        "shuffle_bag_ttl_days" : 30,
+        "tweet_queue_size" : 1000,
+        "tweet_consumers" : 4,
+        "tweet_stats_interval" : 600,
         "gfy_client_id" : "",
         "gfy_client_secret" : "",
         "twitter_key" : "",
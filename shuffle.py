@@ -0,0 +1,84 @@
+import time
+from random import Random, SystemRandom
+
+# Shuffle bags deal every link of a pool once, in a random order, before any link repeats.
+
+
+class ShuffleBag:
+    """A lazy Fisher-Yates shuffle over the indexes 0..size-1.
+    Only the seed and cursor are needed to rebuild it, so that is all that gets persisted."""
+
+    __slots__ = ("size", "seed", "cursor", "_random", "_swaps")
+
+    def __init__(self, size, seed=None, cursor=0):
+        self.size = size
+        self.seed = SystemRandom().getrandbits(64) if seed is None else seed
+        self.cursor = 0
+        self._random = Random(self.seed)
+        # positions that have been swapped, every other position still holds its own index
+        self._swaps = {}
+        for _ in range(min(cursor, size)):
+            self._next_index()
+
+    def _next_index(self):
+        i = self.cursor
+        j = self._random.randrange(i, self.size)
+        picked = self._swaps.get(j, j)
+        self._swaps[j] = self._swaps.get(i, i)
+        # position i is never read again
+        self._swaps.pop(i, None)
+        self.cursor += 1
+        return picked
+
+    def draw(self):
+        """Returns the next index, starting a new shuffle once every index was dealt."""
+        if self.cursor >= self.size:
+            self.__init__(self.size)
+        return self._next_index()
+
+    def state(self):
+        return [self.seed, self.cursor, self.size]
+
+
+class ShuffleBags:
+    """Shuffle bags by key, with their state kept in a json serialisable dict.
+    Keys not drawn from for ttl seconds are dropped, and the least recently drawn once there are more than max_keys."""
+
+    def __init__(self, state, max_keys=50000, ttl=30 * 86400):
+        self.state = state  # "key" -> [seed, cursor, size, pool version, last draw]
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self.bags = {}  # "key" -> (ShuffleBag, version of the items it deals)
+        self.prune()
+
+    def draw(self, key, items, version):
+        """Returns a random item that has not been drawn for the key since its last shuffle.
+        version is kept by whoever owns the items and changes whenever they do, the bag then starts over."""
+        if not items:
+            return None
+        key = "|".join(str(x) for x in key)
+        bag, bag_version = self.bags.get(key, (None, None))
+        if bag is None or bag_version != version or bag.size != len(items):
+            saved = self.state.get(key)
+            if saved and len(saved) >= 5 and saved[2] == len(items) and saved[3] == version:
+                bag = ShuffleBag(saved[2], saved[0], saved[1])
+            else:
+                bag = ShuffleBag(len(items))
+            self.bags[key] = (bag, version)
+        item = items[bag.draw()]
+        self.state[key] = bag.state() + [version, int(time.time())]
+        if len(self.state) > self.max_keys:
+            self.prune()
+        return item
+
+    def prune(self):
+        """Drops the keys not drawn from within ttl, then the least recently drawn until a tenth of max_keys is free,
+        so pruning is not repeated on every new key."""
+        expired = int(time.time()) - self.ttl
+        # entries saved before they had a version or time are dropped
+        dropped = [key for key, saved in self.state.items() if len(saved) < 5 or saved[4] < expired]
+        kept = sorted((saved[4], key) for key, saved in self.state.items() if len(saved) >= 5 and saved[4] >= expired)
+        dropped += [key for _, key in kept[:max(len(kept) - self.max_keys * 9 // 10, 0)]]
+        for key in dropped:
+            del self.state[key]
+            self.bags.pop(key, None)
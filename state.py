@@ -0,0 +1,200 @@
+import json
+import os
+import threading
+import time
+
+# Cog state that outlives a restart. Every cog owns a namespace, a flat dict of json values.
+# Changed keys are appended to a journal by a worker thread, so a write costs what changed rather
+# than the whole state. The journal is folded into a snapshot that replaces the old one atomically.
+
+
+class Namespace(dict):
+    """A dict that tells its store which keys changed.
+    Call touch(key) after changing a value in place, e.g. appending to a list stored under key."""
+
+    def __init__(self, store, name, data):
+        super().__init__(data)
+        self.store = store
+        self.name = name
+
+    def touch(self, key):
+        self.store.mark(self.name, key)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.touch(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.touch(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self.touch(key)
+        return super().pop(key, *default)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+
+class StateStore:
+    """Namespaces backed by a json snapshot plus a journal of [sequence, namespace, key(, value)] lines."""
+
+    def __init__(self, path, flush_interval=5, compact_after=10000):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.flush_interval = flush_interval
+        self.compact_after = compact_after
+        self.lock = threading.Lock()
+        self.dirty = set()  # (namespace, key)
+        self.namespaces = {}
+        self.sequence = 0
+        self.journal_lines = 0
+        self.stopped = threading.Event()
+        self.thread = None
+        self.data, self.legacy = self._load()
+
+    def _load(self):
+        """Returns the data of every namespace and the old nested cache.json layout, if that is what was found."""
+        try:
+            with open(self.path) as file:
+                snapshot = json.load(file)
+        except (OSError, ValueError):
+            snapshot = {}
+        if "namespaces" in snapshot:
+            data, legacy = snapshot["namespaces"], {}
+            self.sequence = snapshot["sequence"]
+        else:
+            # written by the old write_cache, namespaces can still start from it
+            data, legacy = {}, snapshot
+        try:
+            with open(self.journal_path) as journal:
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # torn by a crash in the middle of a write
+                        continue
+                    self.journal_lines += 1
+                    if entry[0] <= self.sequence:
+                        continue
+                    self.sequence = entry[0]
+                    if len(entry) == 4:
+                        data.setdefault(entry[1], {})[entry[2]] = entry[3]
+                    else:
+                        data.get(entry[1], {}).pop(entry[2], None)
+        except OSError:
+            pass
+        return data, legacy
+
+    def namespace(self, name, legacy=()):
+        """Returns the namespace called name. legacy is the key path of its data in the old cache.json,
+        which is only read when the namespace is new."""
+        namespace = self.namespaces.get(name)
+        if namespace is not None:
+            return namespace
+        data = self.data.get(name)
+        if data is None:
+            data = self.legacy
+            for key in legacy:
+                data = data.get(key, {}) if isinstance(data, dict) else {}
+            data = data if legacy and isinstance(data, dict) else {}
+        namespace = Namespace(self, name, data)
+        self.namespaces[name] = namespace
+        with self.lock:
+            self.dirty.update((name, key) for key in namespace)
+        return namespace
+
+    def mark(self, name, key):
+        with self.lock:
+            self.dirty.add((name, key))
+
+    def start(self):
+        """Starts the worker thread that writes changes every flush_interval seconds."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="state-store", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"failed to write state: {e}")
+
+    def close(self):
+        """Stops the worker and writes a snapshot of everything, blocks until it is on disk."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        if not self.compact():
+            # the journal still has everything up to the last flush, add what changed since
+            self.flush()
+
+    def flush(self):
+        """Appends the changed keys to the journal, compacting once the journal is long."""
+        lines = []
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+            for name, key in dirty:
+                namespace = self.namespaces.get(name)
+                self.sequence += 1
+                try:
+                    if namespace is not None and key in namespace:
+                        lines.append(json.dumps([self.sequence, name, key, namespace[key]]))
+                    else:
+                        lines.append(json.dumps([self.sequence, name, key]))
+                except RuntimeError:
+                    # changed in place while being encoded, try again next flush
+                    self.dirty.add((name, key))
+                except (TypeError, ValueError) as e:
+                    print(f"state {name}[{key}] could not be written: {e}")
+        if lines:
+            with open(self.journal_path, "a") as journal:
+                journal.write("\n".join(lines) + "\n")
+            self.journal_lines += len(lines)
+        if self.journal_lines >= self.compact_after:
+            self.compact()
+
+    def _snapshot(self, attempts=5):
+        """Returns every namespace encoded as json, None if the event loop kept changing them while encoding."""
+        for attempt in range(attempts):
+            try:
+                with self.lock:
+                    data = dict(self.data)
+                    data.update((name, dict(namespace)) for name, namespace in self.namespaces.items())
+                    snapshot = json.dumps({"sequence": self.sequence, "namespaces": data})
+                    self.dirty.clear()
+                return snapshot
+            except RuntimeError:
+                # a dict or list was resized while being copied or encoded
+                time.sleep(0.01 * (attempt + 1))
+        return None
+
+    def compact(self):
+        """Writes every namespace to a new snapshot, renames it over the old one and empties the journal.
+        Returns False if no consistent snapshot could be taken, the journal is left as it was."""
+        snapshot = self._snapshot()
+        if snapshot is None:
+            print("state snapshot kept changing while being written, compacting later")
+            return False
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w") as file:
+            file.write(snapshot)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self.path)
+        # entries up to the snapshot's sequence are skipped on load, so a crash before this is harmless
+        open(self.journal_path, "w").close()
+        self.journal_lines = 0
+        return True
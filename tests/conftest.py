@@ -0,0 +1,31 @@
+import importlib
+import json
+import os
+import sys
+
+import pytest
+
+# the bot is run from the repository root, its modules import each other from there
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def data(tmp_path_factory):
+    """Imports data.py against throwaway settings files, it reads them on import."""
+    pytest.importorskip("aiomysql")
+    directory = tmp_path_factory.mktemp("settings")
+    files = {"apis": directory / "apis.json", "mods": directory / "mods.json"}
+    files["apis"].write_text(json.dumps({"command_prefix": ".", "database_name": "test",
+                                         "database_user": "test", "database_password": "test"}))
+    files["mods"].write_text(json.dumps({"owners": []}))
+    directories = {"apis": str(files["apis"]), "mods": str(files["mods"]),
+                   "insta_file_path": str(directory / "insta"), "cache_variables": str(directory / "cache.json")}
+    (directory / "directories.json").write_text(json.dumps(directories))
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        module = importlib.import_module("data")
+    finally:
+        os.chdir(cwd)
+    yield module
+    module.pool = None
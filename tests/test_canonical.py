@@ -0,0 +1,70 @@
+import pytest
+
+from canonical import canonicalise, media_type
+
+
+@pytest.mark.parametrize("link", [
+    "https://gfycat.com/HappyFluffyDog",
+    "https://www.gfycat.com/happyfluffydog/",
+    "https://gfycat.com/gifs/detail/HappyFluffyDog",
+    "https://gfycat.com/HappyFluffyDog-twice-nayeon",
+    "https://gfycat.com/HappyFluffyDog?utm_source=x",
+])
+def test_gfycat_links_share_a_key(link):
+    canonical = canonicalise(link)
+    assert canonical.key == "gfycat:happyfluffydog"
+    assert canonical.media_type == "gfy"
+
+
+def test_redgifs_and_gifdeliverynetwork_ids():
+    redgifs = canonicalise("https://www.redgifs.com/watch/HappyFluffyDog")
+    assert redgifs.key == "redgifs:happyfluffydog"
+    assert redgifs.url == "https://www.redgifs.com/watch/HappyFluffyDog"
+    assert canonicalise("https://redgifs.com/watch/happyfluffydog").key == redgifs.key
+    assert canonicalise("https://www.gifdeliverynetwork.com/HappyFluffyDog").key == \
+        "gifdeliverynetwork:happyfluffydog"
+
+
+@pytest.mark.parametrize("link, url", [
+    ("https://pbs.twimg.com/media/ABC", "https://pbs.twimg.com/media/ABC?format=jpg&name=orig"),
+    ("https://pbs.twimg.com/media/ABC.jpg", "https://pbs.twimg.com/media/ABC?format=jpg&name=orig"),
+    ("https://pbs.twimg.com/media/ABC.jpg:large", "https://pbs.twimg.com/media/ABC?format=jpg&name=orig"),
+    ("https://pbs.twimg.com/media/ABC:orig", "https://pbs.twimg.com/media/ABC?format=jpg&name=orig"),
+    ("https://pbs.twimg.com/media/ABC?format=png&name=small", "https://pbs.twimg.com/media/ABC?format=png&name=orig"),
+    ("https://pbs.twimg.com/media/ABC.png", "https://pbs.twimg.com/media/ABC?format=png&name=orig"),
+])
+def test_twimg_sizes_and_formats(link, url):
+    canonical = canonicalise(link)
+    assert canonical.key == "twimg:ABC"
+    assert canonical.url == url
+    assert canonical.media_type == "image"
+
+
+def test_twimg_ids_keep_their_case():
+    upper = canonicalise("https://pbs.twimg.com/media/AbC.jpg")
+    assert upper.key != canonicalise("https://pbs.twimg.com/media/abc.jpg").key
+
+
+@pytest.mark.parametrize("link", [
+    "https://www.youtube.com/watch?v=abcdefghijk",
+    "https://youtu.be/abcdefghijk",
+    "https://m.youtube.com/watch?feature=share&v=abcdefghijk",
+    "https://youtube.com/shorts/abcdefghijk",
+])
+def test_youtube_links(link):
+    canonical = canonicalise(link)
+    assert canonical.key == "youtube:abcdefghijk"
+    assert canonical.url == "https://www.youtube.com/watch?v=abcdefghijk"
+    assert canonical.media_type == "fancam"
+
+
+def test_plain_images_with_queries():
+    canonical = canonicalise("https://example.com/photo.JPG?width=500")
+    assert canonical.media_type == "image"
+    assert canonical.url == "https://example.com/photo.JPG?width=500"
+
+
+@pytest.mark.parametrize("link", ["https://example.com/page", "not a link", "https://gfycat.com/"])
+def test_other_links_are_not_accepted(link):
+    assert canonicalise(link) is None
+    assert media_type(link) is None
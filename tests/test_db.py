@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+
+class StandInCursor:
+    def __init__(self, events):
+        self.events = events
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.events.append("cursor closed")
+
+    async def execute(self, sql, args=None):
+        self.events.append(sql)
+
+
+class StandInConnection:
+    def __init__(self, events):
+        self.events = events
+
+    def cursor(self):
+        return StandInCursor(self.events)
+
+    async def begin(self):
+        self.events.append("begin")
+
+    async def commit(self):
+        self.events.append("commit")
+
+    async def rollback(self):
+        self.events.append("rollback")
+
+
+class StandInPool:
+    """Hands out one connection and records what is done with it, like aiomysql's pool.acquire()."""
+
+    def __init__(self):
+        self.events = []
+        self.connection = StandInConnection(self.events)
+
+    def acquire(self):
+        return self
+
+    async def __aenter__(self):
+        self.events.append("acquire")
+        return self.connection
+
+    async def __aexit__(self, *exc):
+        self.events.append("release")
+
+
+@pytest.fixture
+def pool(data):
+    data.pool = StandInPool()
+    yield data.pool
+    data.pool = None
+
+
+def test_db_cursor_releases_the_connection(data, pool):
+    async def run():
+        async with data.db_cursor() as cursor:
+            await cursor.execute("SELECT 1")
+
+    asyncio.run(run())
+    assert pool.events == ["acquire", "SELECT 1", "cursor closed", "release"]
+
+
+def test_db_transaction_commits(data, pool):
+    async def run():
+        async with data.db_transaction() as cursor:
+            await cursor.execute("DELETE FROM a")
+            await cursor.execute("DELETE FROM b")
+
+    asyncio.run(run())
+    assert pool.events == ["acquire", "begin", "DELETE FROM a", "DELETE FROM b", "cursor closed", "commit",
+                           "release"]
+
+
+def test_db_transaction_rolls_back_and_raises(data, pool):
+    async def run():
+        async with data.db_transaction() as cursor:
+            await cursor.execute("DELETE FROM a")
+            raise ValueError("failed half way")
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
+    assert "commit" not in pool.events
+    assert pool.events == ["acquire", "begin", "DELETE FROM a", "cursor closed", "rollback", "release"]
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+discord = pytest.importorskip("discord")
+
+from dispatch import Dispatcher, max_message_length
+
+
+class Response:
+    def __init__(self, status, reason):
+        self.status = status
+        self.reason = reason
+
+
+def not_found(code):
+    return discord.NotFound(Response(404, "Not Found"), {"code": code, "message": "Not Found"})
+
+
+class Channel:
+    def __init__(self, error=None):
+        self.sent = []
+        self.error = error
+
+    async def send(self, content=None, embed=None):
+        if self.error is not None:
+            raise self.error
+        self.sent.append((content, embed))
+
+
+class Client:
+    def __init__(self, channels, fetched=None):
+        self.loop = asyncio.get_running_loop()
+        self.channels = channels
+        self.fetched = fetched or {}
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    async def fetch_channel(self, channel_id):
+        result = self.fetched[channel_id]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def run(channels, sends, fetched=None):
+    """Queues the sends, waits for the queues and any cleanup, returns the channel ids passed to remove_dead."""
+    removed = []
+
+    async def remove_dead(channel_ids):
+        removed.append(sorted(channel_ids))
+
+    async def main():
+        dispatcher = Dispatcher(Client(channels, fetched), remove_dead, cleanup_delay=0)
+        for channel_id, content, embed in sends:
+            dispatcher.send(channel_id, content, embed)
+        await asyncio.gather(*dispatcher.workers.values())
+        if dispatcher.cleanup is not None:
+            await dispatcher.cleanup
+        assert not dispatcher.queues and not dispatcher.workers
+
+    asyncio.run(main())
+    return removed
+
+
+def test_queued_text_is_joined():
+    channel = Channel()
+    run({1: channel}, [(1, "a", None), (1, "b", None), (1, "c", None)])
+    assert channel.sent == [("a\nb\nc", None)]
+
+
+def test_embeds_and_long_text_are_not_joined():
+    channel = Channel()
+    embed = object()
+    long = "x" * (max_message_length - 1)
+    run({1: channel}, [(1, "a", None), (1, None, embed), (1, "b", None), (1, long, None)])
+    assert channel.sent == [("a", None), (None, embed), ("b", None), (long, None)]
+
+
+def test_channels_are_sent_to_separately():
+    first, second = Channel(), Channel()
+    run({1: first, 2: second}, [(1, "a", None), (2, "b", None), (1, "c", None)])
+    assert first.sent == [("a\nc", None)]
+    assert second.sent == [("b", None)]
+
+
+def test_unknown_channels_are_removed_together():
+    channels = {1: Channel(not_found(10003)), 2: Channel(not_found(10003)), 3: Channel()}
+    removed = run(channels, [(1, "a", None), (2, "b", None), (3, "c", None)])
+    assert removed == [[1, 2]]
+    assert channels[3].sent == [("c", None)]
+
+
+def test_unknown_channel_found_by_fetch_is_removed():
+    assert run({}, [(1, "a", None)], fetched={1: not_found(10003)}) == [[1]]
+
+
+def test_uncached_channel_is_fetched():
+    channel = Channel()
+    assert run({}, [(1, "a", None)], fetched={1: channel}) == []
+    assert channel.sent == [("a", None)]
+
+
+@pytest.mark.parametrize("error", [
+    not_found(10008),
+    discord.Forbidden(Response(403, "Forbidden"), {"code": 50013, "message": "Missing Permissions"}),
+    discord.HTTPException(Response(500, "Server Error"), "oops"),
+])
+def test_other_errors_never_remove_the_channel(error):
+    assert run({1: Channel(error)}, [(1, "a", None)]) == []
+    assert run({}, [(1, "a", None)], fetched={1: error}) == []
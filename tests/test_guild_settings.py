@@ -0,0 +1,75 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+
+@pytest.fixture
+def guild(data):
+    settings = data.GuildSettings(".", 10)
+    data.guild_settings[1] = settings
+    yield settings
+    data.guild_settings.pop(1, None)
+
+
+def ban(data, settings, *words):
+    settings.set_banned_words(settings.banned_words | {data.normalise_banned_word(x) for x in words})
+
+
+def test_banned_words_are_whole_words(data, guild):
+    ban(data, guild, "Bad")
+    assert data.find_banned_word(1, "this is BAD!") == "bad"
+    assert data.find_banned_word(1, "badly done") is None
+    assert data.find_banned_word(2, "bad") is None
+
+
+def test_banned_phrases_and_punctuation(data, guild):
+    ban(data, guild, "bad", "very  bad word", "c++", "f.u")
+    assert data.find_banned_word(1, "a Very bad\nword here") == "very bad word"
+    assert data.find_banned_word(1, "very bad") == "bad"
+    assert data.find_banned_word(1, "I like c++.") == "c++"
+    assert data.find_banned_word(1, "f.u") == "f.u"
+    assert data.find_banned_word(1, "fxu c") is None
+
+
+def test_unbanning_rebuilds_the_lookups(data, guild):
+    ban(data, guild, "very bad word")
+    guild.set_banned_words(guild.banned_words - {"very bad word"})
+    assert data.find_banned_word(1, "very bad word") is None
+    assert guild.longest_phrase == 0
+
+
+def test_cached_settings(data, guild):
+    guild.restricted_users.add(5)
+    assert data.get_prefix_db(1) == (".",)
+    assert data.get_prefix_db(2) is None
+    assert data.get_guild_max_duration(1) == (10,)
+    assert data.find_restricted_user_db(1, 5)
+    assert not data.find_restricted_user_db(1, 6)
+
+
+def test_load_guild_settings(data, monkeypatch):
+    rows = {
+        "SELECT Guild, Prefix": [(1, "!", 30)],
+        "SELECT guilds.Guild, Word": [(1, "Bad"), (1, "Very Bad")],
+        "SELECT guilds.Guild, UserId": [(1, 5)],
+    }
+
+    class Cursor:
+        async def execute(self, sql, args=None):
+            self.rows = next(r for prefix, r in rows.items() if sql.strip().startswith(prefix))
+
+        async def fetchall(self):
+            return self.rows
+
+    @asynccontextmanager
+    async def db_cursor():
+        yield Cursor()
+
+    monkeypatch.setattr(data, "db_cursor", db_cursor)
+    monkeypatch.setattr(data, "guild_settings", {})
+    asyncio.run(data.load_guild_settings())
+    assert data.get_prefix_db(1) == ("!",)
+    assert data.get_guild_max_duration(1) == (30,)
+    assert data.find_banned_word(1, "so very bad") == "very bad"
+    assert data.find_restricted_user_db(1, 5)
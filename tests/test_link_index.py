@@ -0,0 +1,66 @@
+import pytest
+
+
+@pytest.fixture
+def index(data):
+    """Member 1 has links 1-4, member 2 has 5. Tag 10 is on 1 2 5, tag 20 on 2 3, tag 30 on 3."""
+    index = data.LinkIndex()
+    links = {1: "https://gfycat.com/One", 2: "https://gfycat.com/Two", 3: "https://pbs.twimg.com/media/Three.jpg",
+             4: "https://youtu.be/abcdefghijk", 5: "https://gfycat.com/Five"}
+    for link_id, link in links.items():
+        index.add_link(link_id, link)
+        index.add_pair(link_id, 2 if link_id == 5 else 1)
+    for link_id, tag_id in [(1, 10), (2, 10), (5, 10), (2, 20), (3, 20), (3, 30)]:
+        index.add_tag(link_id, tag_id)
+    return index
+
+
+def test_member_and_media(index):
+    assert index.query(1) == [1, 2, 3, 4]
+    assert index.query(1, "gfy") == [1, 2]
+    assert index.query(1, "image") == [3]
+    assert index.query(1, "fancam") == [4]
+
+
+def test_tag_set_algebra(index):
+    assert index.query(1, any_tags=[10, 30]) == [1, 2, 3]
+    assert index.query(1, all_tags=[10, 20]) == [2]
+    assert index.query(1, any_tags=[10, 20], no_tags=[30]) == [1, 2]
+    assert index.query(any_tags=[10]) == [1, 2, 5]
+    assert index.query(media="gfy", all_tags=[20]) == [2]
+    assert index.query(1, all_tags=[99]) == []
+
+
+def test_a_query_needs_a_member_or_a_tag_to_include(index):
+    assert index.query() == []
+    assert index.query(media="gfy") == []
+    assert index.query(no_tags=[10]) == []
+
+
+def test_removing_links_and_tags(index):
+    index.remove_tag(2, 10)
+    assert index.query(any_tags=[10]) == [1, 5]
+    index.remove_link(3, [1])
+    assert index.query(1) == [1, 2, 4]
+    assert 30 not in index.tag_links
+    index.drop_tag(20)
+    assert index.query(1, any_tags=[20]) == []
+
+
+def test_versions_change_with_the_links_and_not_their_order(data, index):
+    version = index.version(1, any_tags=[10])
+    assert index.version(2, any_tags=[10]) != version
+    index.add_tag(4, 10)
+    assert index.version(1, any_tags=[10]) != version
+    index.remove_tag(4, 10)
+    assert index.version(1, any_tags=[10]) == version
+    # adding the same links in another order gives the same version, as it would after a restart
+    rebuilt = data.LinkIndex()
+    for link_id in (4, 3, 2, 1):
+        rebuilt.add_pair(link_id, 1)
+    for link_id in (5, 2, 1):
+        rebuilt.add_tag(link_id, 10)
+    assert rebuilt.version(1, any_tags=[10]) == version
+    # adding a link twice does not change it
+    rebuilt.add_pair(1, 1)
+    assert rebuilt.version(1, any_tags=[10]) == version
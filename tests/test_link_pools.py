@@ -0,0 +1,57 @@
+import asyncio
+
+
+def test_pool_splits_links_by_media(data):
+    pool = data.MemberLinkPool(["https://gfycat.com/HappyDog", "https://pbs.twimg.com/media/ABC.jpg",
+                                "https://youtu.be/abcdefghijk", "https://example.com/page"])
+    assert pool.gfys == ("https://gfycat.com/HappyDog",)
+    assert pool.images == ("https://pbs.twimg.com/media/ABC.jpg",)
+    assert pool.fancams == ("https://youtu.be/abcdefghijk",)
+    assert len(pool.links) == 4
+    assert pool.size > 0
+
+
+def test_cache_evicts_least_recently_used_by_size(data):
+    pools = {x: data.MemberLinkPool([f"https://gfycat.com/Link{x}"]) for x in range(3)}
+    cache = data.LinkPoolCache(pools[0].size * 2)
+    cache.put(0, pools[0])
+    cache.put(1, pools[1])
+    assert cache.get(0) is pools[0]
+    cache.put(2, pools[2])
+    # 1 was used least recently
+    assert cache.get(1) is None
+    assert cache.get(0) is pools[0]
+    assert cache.get(2) is pools[2]
+    assert cache.size == pools[0].size + pools[2].size
+
+
+def test_cache_skips_pools_larger_than_it(data):
+    pool = data.MemberLinkPool(["https://gfycat.com/Link"])
+    cache = data.LinkPoolCache(pool.size - 1)
+    cache.put(0, pool)
+    assert cache.get(0) is None
+    assert cache.size == 0
+
+
+def test_invalidate_drops_the_pool_and_moves_the_generation(data):
+    pool = data.MemberLinkPool(["https://gfycat.com/Link"])
+    cache = data.LinkPoolCache(1 << 20)
+    cache.put(0, pool)
+    generation = cache.generation
+    cache.invalidate(0)
+    assert cache.get(0) is None
+    assert cache.size == 0
+    assert cache.generation > generation
+
+
+def test_a_pool_read_during_a_change_is_not_cached(data, monkeypatch):
+    async def get_member_links(member_id):
+        # a link is added while the pool is being read
+        data.link_pool_cache.invalidate(99)
+        return [("https://gfycat.com/Link",)]
+
+    monkeypatch.setattr(data, "get_member_links", get_member_links)
+    monkeypatch.setattr(data, "link_pool_cache", data.LinkPoolCache(1 << 20))
+    pool = asyncio.run(data.get_member_link_pool(7))
+    assert pool.gfys == ("https://gfycat.com/Link",)
+    assert data.link_pool_cache.get(7) is None
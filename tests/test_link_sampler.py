@@ -0,0 +1,63 @@
+import pytest
+
+
+@pytest.fixture
+def groups(data, monkeypatch):
+    """Members 10 and 11 in group 1, member 20 in group 2."""
+    index = data.AliasIndex()
+    index.add_member(10, 1, "a")
+    index.add_member(11, 1, "b")
+    index.add_member(20, 2, "c")
+    monkeypatch.setattr(data, "alias_index", index)
+    return index
+
+
+def test_random_sampler_swap_removes(data):
+    sampler = data.RandomSampler()
+    for x in "abcde":
+        sampler.add(x)
+    sampler.add("a")
+    assert len(sampler) == 5
+    sampler.remove("b")
+    sampler.remove("z")
+    # the last item filled the hole
+    assert sampler.items == ["a", "e", "c", "d"]
+    assert all(sampler.items[position] == x for x, position in sampler.positions.items())
+    sampler.remove("d")
+    assert sampler.items == ["a", "e", "c"]
+    assert sorted(sampler.sample(10)) == ["a", "c", "e"]
+    assert len(sampler.sample(2)) == 2
+
+
+def test_untagged_pairs_by_member_and_group(data, groups):
+    sampler = data.LinkSampler()
+    for link_id, member_id in [(1, 10), (2, 11), (3, 20), (4, 10)]:
+        sampler.add_pair(link_id, member_id)
+    sampler.add_tag(4, [10])
+    assert len(sampler.links) == 4
+    assert sorted(sampler.untagged.items) == [(1, 10), (2, 11), (3, 20)]
+    assert sampler.untagged_by_member[10].items == [1]
+    assert sorted(sampler.untagged_by_group[1].items) == [(1, 10), (2, 11)]
+    assert sampler.untagged_by_group[2].items == [(3, 20)]
+
+
+def test_removing_the_last_tag_makes_a_link_untagged_again(data, groups):
+    sampler = data.LinkSampler()
+    sampler.add_pair(4, 10)
+    sampler.add_tag(4, [10])
+    sampler.add_tag(4, [10])
+    sampler.remove_tag(4, [10])
+    assert (4, 10) not in sampler.untagged.positions
+    sampler.remove_tag(4, [10])
+    assert (4, 10) in sampler.untagged.positions
+    assert (4, 10) in sampler.untagged_by_group[1].positions
+
+
+def test_pairs_leave_their_group_after_the_member_is_gone(data, groups):
+    sampler = data.LinkSampler()
+    sampler.add_pair(2, 11)
+    groups.remove_member(11)
+    sampler.remove_link(2, [11])
+    assert len(sampler.links) == 0
+    assert len(sampler.untagged_by_group[1]) == 0
+    assert len(sampler.untagged_by_member[11]) == 0
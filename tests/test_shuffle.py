@@ -0,0 +1,79 @@
+import time
+
+from shuffle import ShuffleBag, ShuffleBags
+
+
+def test_bag_deals_every_index_once_per_shuffle():
+    bag = ShuffleBag(50)
+    first = [bag.draw() for _ in range(50)]
+    second = [bag.draw() for _ in range(50)]
+    assert sorted(first) == list(range(50))
+    assert sorted(second) == list(range(50))
+
+
+def test_bag_resumes_from_its_seed_and_cursor():
+    bag = ShuffleBag(20)
+    dealt = [bag.draw() for _ in range(7)]
+    seed, cursor, size = bag.state()
+    resumed = ShuffleBag(size, seed, cursor)
+    rest = [resumed.draw() for _ in range(13)]
+    assert sorted(dealt + rest) == list(range(20))
+
+
+def test_bags_resume_after_a_restart():
+    state = {}
+    items = list("abcdefgh")
+    first = [ShuffleBags(state).draw(("gfy", 1), items, "v1") for _ in range(3)]
+    # a new ShuffleBags for every draw rebuilds the bag from state each time
+    rest = [ShuffleBags(state).draw(("gfy", 1), list(items), "v1") for _ in range(5)]
+    assert sorted(first + rest) == items
+
+
+def test_bags_start_over_when_the_version_changes():
+    state = {}
+    bags = ShuffleBags(state)
+    bags.draw(("gfy", 1), list("abcd"), "v1")
+    bags.draw(("gfy", 1), list("abcd"), "v1")
+    assert state["gfy|1"][1] == 2
+    bags.draw(("gfy", 1), list("abce"), "v2")
+    assert state["gfy|1"][1] == 1
+    assert state["gfy|1"][3] == "v2"
+    # a restart with a different version does not resume the old shuffle either
+    ShuffleBags(state).draw(("gfy", 1), list("abcf"), "v3")
+    assert state["gfy|1"][1] == 1
+    assert state["gfy|1"][3] == "v3"
+
+
+def test_bags_start_over_when_the_size_changes_under_the_same_version():
+    state = {}
+    bags = ShuffleBags(state)
+    for _ in range(3):
+        bags.draw(("gfy", 1), list("abcd"), "v1")
+    assert bags.draw(("gfy", 1), list("ab"), "v1") in "ab"
+    assert state["gfy|1"][1:3] == [1, 2]
+
+
+def test_nothing_is_drawn_from_an_empty_pool():
+    state = {}
+    assert ShuffleBags(state).draw(("gfy", 1), [], "v1") is None
+    assert state == {}
+
+
+def test_expired_and_old_format_keys_are_pruned_on_load():
+    now = int(time.time())
+    state = {"old": [1, 2, 3], "stale": [1, 0, 3, "v", now - 100], "fresh": [1, 0, 3, "v", now]}
+    ShuffleBags(state, ttl=50)
+    assert list(state) == ["fresh"]
+
+
+def test_least_recently_drawn_keys_are_pruned_above_max_keys(monkeypatch):
+    clock = [1000]
+    monkeypatch.setattr(time, "time", lambda: clock[0])
+    state = {}
+    bags = ShuffleBags(state, max_keys=10)
+    for key in range(11):
+        clock[0] += 1
+        bags.draw((key,), [1, 2], "v")
+    # pruned down to nine tenths, the oldest first
+    assert sorted(int(x) for x in state) == list(range(2, 11))
+    assert "0" not in bags.bags
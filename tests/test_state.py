@@ -0,0 +1,109 @@
+import json
+
+import state
+from state import StateStore
+
+
+def reload(path):
+    return StateStore(str(path))
+
+
+def test_changes_are_journaled_and_replayed(tmp_path):
+    path = tmp_path / "cache.json"
+    store = reload(path)
+    timers = store.namespace("timers")
+    timers["a"] = [1, 2]
+    timers["b"] = 3
+    store.flush()
+    del timers["b"]
+    timers["a"].append(4)
+    timers.touch("a")
+    store.flush()
+    assert not path.exists()
+    assert reload(path).namespace("timers") == {"a": [1, 2, 4]}
+
+
+def test_compact_replaces_the_snapshot_and_empties_the_journal(tmp_path):
+    path = tmp_path / "cache.json"
+    store = reload(path)
+    store.namespace("bags")["k"] = 1
+    store.flush()
+    assert store.compact()
+    assert json.loads(path.read_text()) == {"sequence": store.sequence, "namespaces": {"bags": {"k": 1}}}
+    assert (tmp_path / "cache.json.journal").read_text() == ""
+    assert not (tmp_path / "cache.json.tmp").exists()
+
+
+def test_entries_older_than_the_snapshot_are_skipped(tmp_path):
+    # a crash between writing the snapshot and emptying the journal leaves entries the snapshot already has
+    path = tmp_path / "cache.json"
+    store = reload(path)
+    bags = store.namespace("bags")
+    bags["k"] = 1
+    store.flush()
+    journal = (tmp_path / "cache.json.journal").read_text()
+    bags["k"] = 2
+    store.compact()
+    (tmp_path / "cache.json.journal").write_text(journal + '{"torn')
+    assert reload(path).namespace("bags") == {"k": 2}
+
+
+def test_a_journal_is_compacted_once_long(tmp_path):
+    path = tmp_path / "cache.json"
+    store = StateStore(str(path), compact_after=3)
+    bags = store.namespace("bags")
+    for x in range(3):
+        bags[str(x)] = x
+    store.flush()
+    assert store.journal_lines == 0
+    assert json.loads(path.read_text())["namespaces"]["bags"] == {"0": 0, "1": 1, "2": 2}
+
+
+def test_legacy_cache_seeds_new_namespaces(tmp_path):
+    path = tmp_path / "cache.json"
+    path.write_text(json.dumps({"reddit": {"recent_posts": {"kpop": {"1": ["x"]}}}}))
+    store = reload(path)
+    assert store.namespace("posts", legacy=("reddit", "recent_posts")) == {"kpop": {"1": ["x"]}}
+    assert store.namespace("missing", legacy=("reddit", "nothing")) == {}
+    store.close()
+    # the first snapshot replaces the old layout
+    assert reload(path).namespace("posts") == {"kpop": {"1": ["x"]}}
+
+
+def test_compact_retries_when_the_loop_changes_a_value_mid_encode(tmp_path, monkeypatch):
+    path = tmp_path / "cache.json"
+    store = reload(path)
+    store.namespace("bags")["k"] = 1
+    dumps = json.dumps
+    failures = [2]
+
+    def flaky_dumps(*args, **kwargs):
+        if failures[0]:
+            failures[0] -= 1
+            raise RuntimeError("dictionary changed size during iteration")
+        return dumps(*args, **kwargs)
+
+    monkeypatch.setattr(state.json, "dumps", flaky_dumps)
+    monkeypatch.setattr(state.time, "sleep", lambda seconds: None)
+    assert store.compact()
+    assert json.loads(path.read_text())["namespaces"] == {"bags": {"k": 1}}
+
+
+def test_close_falls_back_to_the_journal_when_the_snapshot_never_settles(tmp_path, monkeypatch):
+    path = tmp_path / "cache.json"
+    store = reload(path)
+    store.namespace("bags")["k"] = 1
+    dumps = json.dumps
+
+    def snapshot_fails(value, *args, **kwargs):
+        if isinstance(value, dict) and "namespaces" in value:
+            raise RuntimeError("dictionary changed size during iteration")
+        return dumps(value, *args, **kwargs)
+
+    monkeypatch.setattr(state.json, "dumps", snapshot_fails)
+    monkeypatch.setattr(state.time, "sleep", lambda seconds: None)
+    assert not store.compact()
+    assert store.dirty
+    store.close()
+    monkeypatch.undo()
+    assert reload(path).namespace("bags") == {"k": 1}
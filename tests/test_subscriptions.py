@@ -0,0 +1,64 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+def test_add_and_look_up(data):
+    subs = data.Subscriptions()
+    subs.add("twitter", "12", 100)
+    subs.add("twitter", 12, 101)
+    subs.add("reddit", "kpop", 100)
+    assert sorted(subs.channels("twitter", "12")) == [100, 101]
+    assert subs.channels("reddit", "kpop") == [100]
+    assert subs.channels("reddit", "Kpop") == []
+    assert subs.channels("twitch", 12) == []
+    assert {k: sorted(v) for k, v in subs.followed("twitter").items()} == {12: [100, 101]}
+    assert subs.followed("instagram") == {}
+
+
+def test_remove_drops_empty_routes(data):
+    subs = data.Subscriptions()
+    subs.add("twitch", 5, 100)
+    subs.add("twitch", 5, 101)
+    subs.remove("twitch", "5", 100)
+    assert subs.channels("twitch", 5) == [101]
+    assert 100 not in subs.channel_routes
+    subs.remove("twitch", 5, 101)
+    assert subs.followed("twitch") == {}
+    assert subs.channel_routes == {}
+    # removing what is not followed does nothing
+    subs.remove("twitch", 5, 101)
+    subs.remove("reddit", "kpop", 102)
+
+
+def test_remove_channel_leaves_other_channels(data):
+    subs = data.Subscriptions()
+    subs.add("reddit", "kpop", 100)
+    subs.add("instagram", 3, 100)
+    subs.add("instagram", 3, 101)
+    subs.remove_channel(100)
+    subs.remove_channel(100)
+    assert subs.followed("reddit") == {}
+    assert subs.followed("instagram") == {3: [101]}
+    assert subs.channel_routes == {101: {("instagram", 3)}}
+
+
+def test_load_subscriptions(data, monkeypatch):
+    rows = [("reddit", "kpop", 100), ("twitter", 12, 100), ("twitter", 12, 101), ("twitch", 7, 102)]
+
+    class Cursor:
+        async def execute(self, sql, args=None):
+            pass
+
+        async def fetchall(self):
+            return rows
+
+    @asynccontextmanager
+    async def db_cursor():
+        yield Cursor()
+
+    monkeypatch.setattr(data, "db_cursor", db_cursor)
+    monkeypatch.setattr(data, "subscriptions", data.Subscriptions())
+    asyncio.run(data.load_subscriptions())
+    assert sorted(data.get_subscribed_channels("twitter", "12")) == [100, 101]
+    assert data.get_subscriptions("reddit") == {"kpop": [100]}
+    assert data.get_subscriptions("twitch") == {7: [102]}
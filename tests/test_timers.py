@@ -0,0 +1,121 @@
+import asyncio
+import json
+import time
+
+from state import StateStore
+from timers import TimerScheduler
+
+# what the gfys and reddit cogs kept in cache.json before the state store
+pre_change_cache = {
+    "gfys": {
+        "loops": {"700000000000000001": {"800000000000000001": {"1": 5, "2": 3}}},
+        "recent_posts": {"twice": {"nayeon": ["https://gfycat.com/happyfluffydog"]}},
+    },
+    "reddit": {"recent_posts": {"kpop": {"900000000000000001": ["/r/kpop/comments/abc123/title/"]}}},
+}
+
+
+def nothing(timer):
+    pass
+
+
+def test_pre_change_cache_starts_without_timers(tmp_path):
+    # the old loops only had remaining counts, there is no idol or interval to restart them with
+    path = tmp_path / "cache.json"
+    path.write_text(json.dumps(pre_change_cache))
+    store = StateStore(str(path))
+    timers = TimerScheduler(store.namespace("timers"), nothing)
+    assert timers.channels == {}
+    assert timers.heap == []
+    # the reddit cog still finds its old posts
+    assert "kpop" in store.namespace("reddit_recent_posts", legacy=("reddit", "recent_posts"))
+
+
+def test_timers_survive_a_restart(tmp_path):
+    path = tmp_path / "cache.json"
+    path.write_text(json.dumps(pre_change_cache))
+    store = StateStore(str(path))
+    timers = TimerScheduler(store.namespace("timers"), nothing)
+    first = timers.start(1, 2, 30, ("cute",), 60, 5)
+    second = timers.start(1, 2, 31, (), 60, 5)
+    timers.stop(1, 2, second)
+    store.close()
+
+    store = StateStore(str(path))
+    timers = TimerScheduler(store.namespace("timers"), nothing)
+    restored = timers.running(1, 2)
+    assert list(restored) == [first]
+    assert restored[first].member_id == 30
+    assert restored[first].tags == ("cute",)
+    assert restored[first].remaining == 5
+
+
+def test_stop_filters():
+    timers = TimerScheduler({}, nothing)
+    timers.start(1, 5, 100, (), 10, 3)
+    timers.start(1, 5, 200, (), 10, 3)
+    timers.start(1, 6, 100, (), 10, 3)
+    timers.start(2, 5, 100, (), 10, 3)
+    assert timers.stop(1, 5, member_id=100) == 1
+    assert list(timers.running(1, 5)) == [2]
+    assert timers.stop(1, 5, number=1) == 0
+    assert timers.stop(1, member_id=100) == 1
+    assert list(timers.running(1)) == [5]
+    assert timers.stop(1) == 1
+    assert timers.running(1) == {}
+    assert list(timers.running(2)) == [5]
+
+
+def test_numbers_count_per_author_in_a_channel():
+    timers = TimerScheduler({}, nothing)
+    assert timers.start(1, 5, 100, (), 10, 3) == 1
+    assert timers.start(1, 5, 100, (), 10, 3) == 2
+    assert timers.start(1, 6, 100, (), 10, 3) == 1
+    timers.stop(1, 5, 1)
+    assert timers.start(1, 5, 100, (), 10, 3) == 3
+
+
+def test_run_fires_each_timer_until_it_is_done():
+    fired = []
+
+    async def fire(timer):
+        fired.append((timer.member_id, timer.remaining))
+
+    async def run():
+        state = {}
+        timers = TimerScheduler(state, fire)
+        task = asyncio.ensure_future(timers.run())
+        await asyncio.sleep(0)
+        timers.start(1, 5, 100, (), 0.02, 3)
+        stopped = timers.start(1, 5, 200, (), 0.02, 3)
+        await asyncio.sleep(0.01)
+        timers.stop(1, 5, stopped)
+        await asyncio.sleep(0.1)
+        task.cancel()
+        return state
+
+    state = asyncio.run(run())
+    assert [x for x in fired if x[0] == 100] == [(100, 2), (100, 1), (100, 0)]
+    # the stopped timer fired once, when it was started
+    assert [x for x in fired if x[0] == 200] == [(200, 2)]
+    assert state == {}
+
+
+def test_overdue_timers_carry_on_from_now():
+    now = time.time()
+    state = {"1 5 1": [1, 5, 1, 100, [], 60, 4, now - 3600]}
+    fired = []
+
+    async def fire(timer):
+        fired.append(timer.remaining)
+
+    async def run():
+        timers = TimerScheduler(state, fire)
+        task = asyncio.ensure_future(timers.run())
+        await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(run())
+    # one link for the time it was offline, not one per missed interval
+    assert fired == [3]
+    assert state["1 5 1"][7] >= now + 60
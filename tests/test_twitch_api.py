@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+web = pytest.importorskip("aiohttp.web")
+test_utils = pytest.importorskip("aiohttp.test_utils")
+
+from twitch_api import TwitchClient  # noqa: E402
+
+# how long the stub takes to answer, long enough that a client blocking on it would stall the loop
+latency = 0.2
+# how late the probe may wake up while requests are in flight
+max_lag = 0.05
+
+
+class StubTwitch:
+    """Answers the token, streams and users endpoints, rejecting the first token it handed out."""
+
+    def __init__(self, reject_first_token=False):
+        self.tokens = 0
+        self.reject_first_token = reject_first_token
+        self.requests = []
+        self.app = web.Application()
+        self.app.router.add_post("/oauth2/token", self.token)
+        self.app.router.add_get("/helix/streams", self.streams)
+        self.app.router.add_get("/helix/users", self.users)
+
+    async def token(self, request):
+        self.tokens += 1
+        return web.json_response({"access_token": f"token{self.tokens}", "expires_in": 3600})
+
+    def authorised(self, request):
+        token = request.headers.get("Authorization")
+        return not (self.reject_first_token and token == "Bearer token1")
+
+    async def streams(self, request):
+        if not self.authorised(request):
+            return web.json_response({"message": "invalid token"}, status=401)
+        self.requests.append(request.query.getall("user_id"))
+        await asyncio.sleep(latency)
+        return web.json_response({"data": [{"user_id": x} for x in request.query.getall("user_id")]})
+
+    async def users(self, request):
+        self.requests.append(request.query.getall("id", []) + request.query.getall("login", []))
+        await asyncio.sleep(latency)
+        users = [{"id": x, "login": f"user{x}"} for x in request.query.getall("id", [])]
+        users += [{"id": str(len(x)), "login": x} for x in request.query.getall("login", [])]
+        return web.json_response({"data": users})
+
+
+async def probe_lag(lags, interval=0.01):
+    """Records how much later than asked the loop wakes it up."""
+    loop = asyncio.get_event_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+
+async def run_against_stub(stub, calls):
+    server = test_utils.TestServer(stub.app)
+    await server.start_server()
+    twitch = TwitchClient("id", "secret")
+    twitch.api_url = str(server.make_url("/helix"))
+    twitch.token_url = str(server.make_url("/oauth2/token"))
+    lags = []
+    probe = asyncio.ensure_future(probe_lag(lags))
+    try:
+        result = await calls(twitch)
+    finally:
+        probe.cancel()
+        await twitch.close()
+        await server.close()
+    return result, lags
+
+
+def test_get_streams_batches_ids_and_keeps_the_loop_free():
+    stub = StubTwitch()
+    user_ids = [str(x) for x in range(250)]
+
+    async def calls(twitch):
+        return await asyncio.gather(twitch.get_streams(user_ids), twitch.get_streams(user_ids[:10]))
+
+    (streams, few), lags = asyncio.run(run_against_stub(stub, calls))
+    assert [x["user_id"] for x in streams] == user_ids
+    assert len(few) == 10
+    assert sorted(len(x) for x in stub.requests) == [10, 50, 100, 100]
+    # one token for both, the second waited for the first to fetch it
+    assert stub.tokens == 1
+    assert lags and max(lags) < max_lag
+
+
+def test_request_gets_a_new_token_once_rejected():
+    stub = StubTwitch(reject_first_token=True)
+
+    async def calls(twitch):
+        streams = await twitch.get_streams(["1"])
+        return streams, twitch.token
+
+    (streams, token), lags = asyncio.run(run_against_stub(stub, calls))
+    assert streams == [{"user_id": "1"}]
+    assert token == "token2"
+    assert max(lags) < max_lag
+
+
+def test_get_users_mixes_ids_and_logins():
+    stub = StubTwitch()
+
+    async def calls(twitch):
+        return await twitch.get_users(user_ids=range(150), logins=["joy"])
+
+    users, lags = asyncio.run(run_against_stub(stub, calls))
+    assert len(users) == 151
+    assert users[-1]["login"] == "joy"
+    assert [len(x) for x in stub.requests] == [100, 51]
+    assert max(lags) < max_lag
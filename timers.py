@@ -0,0 +1,124 @@
+import asyncio
+import heapq
+import time
+
+# Every .timer runs from one task, timers wait in a heap ordered by when they are next due.
+
+
+class Timer:
+    """A timer that sends a link of a member every interval seconds, remaining times."""
+
+    __slots__ = ("channel_id", "author_id", "number", "member_id", "tags", "interval", "remaining", "due",
+                 "stopped", "links")
+
+    def __init__(self, channel_id, author_id, number, member_id, tags, interval, remaining, due):
+        self.channel_id = channel_id
+        self.author_id = author_id
+        self.number = number
+        self.member_id = member_id
+        self.tags = tuple(tags)
+        self.interval = interval
+        self.remaining = remaining
+        self.due = due  # unix time, so it still means something after a restart
+        self.stopped = False
+        # (shuffle bag key, LinkIds, their version) worked out by whoever sends the links, not persisted
+        self.links = None
+
+    @property
+    def state_key(self):
+        return f"{self.channel_id} {self.author_id} {self.number}"
+
+    def state(self):
+        return [self.channel_id, self.author_id, self.number, self.member_id, list(self.tags),
+                self.interval, self.remaining, self.due]
+
+
+class TimerScheduler:
+    """Runs timers in a single task, starting and stopping one is O(log n).
+    Stopped timers are only flagged, they are skipped once they reach the top of the heap."""
+
+    def __init__(self, state, fire):
+        self.state = state  # "channel author number" -> Timer.state(), json serialisable
+        self.fire = fire  # coroutine function, called with a Timer every time it is due
+        self.heap = []  # (due, sequence, Timer)
+        self.channels = {}  # channel_id -> author_id -> number -> Timer
+        self.sequence = 0
+        self.wakeup = None
+        for saved in list(state.values()):
+            self._push(Timer(*saved))
+
+    def _push(self, timer):
+        self.channels.setdefault(timer.channel_id, {}).setdefault(timer.author_id, {})[timer.number] = timer
+        self.state[timer.state_key] = timer.state()
+        heapq.heappush(self.heap, (timer.due, self.sequence, timer))
+        self.sequence += 1
+
+    def _remove(self, timer):
+        timer.stopped = True
+        self.state.pop(timer.state_key, None)
+        authors = self.channels.get(timer.channel_id, {})
+        numbers = authors.get(timer.author_id, {})
+        numbers.pop(timer.number, None)
+        if not numbers:
+            authors.pop(timer.author_id, None)
+        if not authors:
+            self.channels.pop(timer.channel_id, None)
+
+    def start(self, channel_id, author_id, member_id, tags, interval, count):
+        """Starts a timer that is due right away and returns its number, counted per author in a channel."""
+        running = self.running(channel_id, author_id)
+        number = max(running, default=0) + 1
+        self._push(Timer(channel_id, author_id, number, member_id, tags, interval, count, time.time()))
+        if self.wakeup is not None:
+            self.wakeup.set()
+        return number
+
+    def running(self, channel_id, author_id=None):
+        """Returns {number: Timer} of an author in a channel, or {author_id: {number: Timer}} of the channel."""
+        authors = self.channels.get(channel_id, {})
+        if author_id is None:
+            return authors
+        return authors.get(author_id, {})
+
+    def stop(self, channel_id, author_id=None, number=None, member_id=None):
+        """Stops the timers of a channel, only those of author_id if given and only its timer number if given,
+        and of those only the timers of member_id if given. Returns how many timers were stopped."""
+        if author_id is None:
+            timers = [x for numbers in self.running(channel_id).values() for x in numbers.values()]
+        elif number is None:
+            timers = list(self.running(channel_id, author_id).values())
+        else:
+            timer = self.running(channel_id, author_id).get(number)
+            timers = [timer] if timer else []
+        if member_id is not None:
+            timers = [x for x in timers if x.member_id == member_id]
+        for timer in timers:
+            self._remove(timer)
+        return len(timers)
+
+    async def run(self):
+        self.wakeup = asyncio.Event()
+        while True:
+            self.wakeup.clear()
+            now = time.time()
+            while self.heap and self.heap[0][0] <= now:
+                _, _, timer = heapq.heappop(self.heap)
+                if timer.stopped:
+                    continue
+                timer.remaining -= 1
+                if timer.remaining > 0:
+                    timer.due += timer.interval
+                    if timer.due <= now:
+                        # the timer was due while the bot was offline, carry on from now
+                        timer.due = now + timer.interval
+                    heapq.heappush(self.heap, (timer.due, self.sequence, timer))
+                    self.sequence += 1
+                    self.state[timer.state_key] = timer.state()
+                else:
+                    self._remove(timer)
+                asyncio.ensure_future(self.fire(timer))
+            timeout = self.heap[0][0] - now if self.heap else None
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,85 @@
+import asyncio
+
+import aiohttp
+
+# The cog only needs a few endpoints of the helix api, kept apart from discord so it can be run on its own.
+
+
+class TwitchClient:
+    """The parts of the Twitch helix api the cog uses, on one pooled aiohttp session.
+    The app token is fetched on first use and refreshed in the background before it expires."""
+
+    api_url = "https://api.twitch.tv/helix"
+    token_url = "https://id.twitch.tv/oauth2/token"
+
+    def __init__(self, client_id, client_secret):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.session = None
+        self.token = None
+        self.token_lock = asyncio.Lock()
+        self.refresh_task = None
+
+    async def authenticate(self):
+        """Fetches a new app token, returns how many seconds it is valid for."""
+        if self.session is None:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        params = {"client_id": self.client_id, "client_secret": self.client_secret,
+                  "grant_type": "client_credentials"}
+        async with self.session.post(self.token_url, params=params) as response:
+            response.raise_for_status()
+            data = await response.json()
+        self.token = data["access_token"]
+        return data["expires_in"]
+
+    async def refresh_token(self, expires_in):
+        while True:
+            await asyncio.sleep(max(expires_in * 0.9, 60))
+            try:
+                async with self.token_lock:
+                    expires_in = await self.authenticate()
+            except Exception as e:
+                print(f"Could not refresh the twitch token: {e}")
+                expires_in = 600
+
+    async def request(self, path, params):
+        """Returns the json of a GET to the helix api, getting a new token once if it was rejected."""
+        for _ in range(2):
+            async with self.token_lock:
+                if self.token is None:
+                    expires_in = await self.authenticate()
+                    if self.refresh_task is None:
+                        self.refresh_task = asyncio.ensure_future(self.refresh_token(expires_in))
+                token = self.token
+            headers = {"Client-ID": self.client_id, "Authorization": f"Bearer {token}"}
+            async with self.session.get(f"{self.api_url}/{path}", params=params, headers=headers) as response:
+                if response.status == 401:
+                    if self.token == token:
+                        self.token = None
+                    continue
+                response.raise_for_status()
+                return await response.json()
+        raise aiohttp.ClientError("twitch rejected a new token")
+
+    async def get_streams(self, user_ids):
+        """Returns the live streams of the user ids, any number of them."""
+        streams = []
+        # at most 100 ids per request
+        for i in range(0, len(user_ids), 100):
+            params = [("user_id", x) for x in user_ids[i:i + 100]] + [("first", "100")]
+            streams += (await self.request("streams", params))["data"]
+        return streams
+
+    async def get_users(self, user_ids=(), logins=()):
+        """Returns the users of the user ids and logins, any number of them."""
+        keys = [("id", str(x)) for x in user_ids] + [("login", x) for x in logins]
+        users = []
+        for i in range(0, len(keys), 100):
+            users += (await self.request("users", keys[i:i + 100]))["data"]
+        return users
+
+    async def close(self):
+        if self.refresh_task is not None:
+            self.refresh_task.cancel()
+        if self.session is not None:
+            await self.session.close()